@@ -0,0 +1,403 @@
+import json
+import asyncio
+from os.path import exists
+from time import perf_counter
+from traceback import print_exc
+
+from .dwx_client import dwx_client, batch_result, RACY_STAT_SECONDS
+
+
+"""Async client
+
+dwx_client for asyncio applications. It uses the same DWX files and
+the same parsing as dwx_client, but the files are polled by tasks of
+the running event loop instead of threads, and the data is delivered
+through async iterators instead of an event_handler.
+
+Example:
+
+    async with async_dwx_client(MT4_files_dir) as dwx:
+        await dwx.subscribe_symbols(['EURUSD', 'GBPUSD'])
+        async for symbol, bid, ask in dwx.ticks(['EURUSD']):
+            print(symbol, bid, ask)
+
+All command functions of dwx_client (open_order(), modify_order(), ...)
+are coroutines here. They return the INFO or ERROR message of the mql
+side, or None for commands that are not answered with a message (see
+command_ack.ACK_RULES). If there is no answer within
+command_ack_timeout seconds they raise a TimeoutError.
+
+Everything runs in the thread of the event loop, so the data can be
+used without locks. The client has to be started with start() (or
+'async with') from within the event loop.
+
+Each iterator has its own queue. If a consumer is too slow and its
+queue is full, the oldest event in the queue is dropped.
+
+"""
+
+
+class async_dwx_client(dwx_client):
+
+    def __init__(self, metatrader_dir_path='',
+                 sleep_delay=0.005,             # 5 ms for asyncio.sleep()
+                 # retry to send the commend for 10 seconds if not successful.
+                 max_retry_command_seconds=10,
+                 # to load orders from file on initialization.
+                 load_orders_from_file=True,
+                 verbose=True,
+                 # back off up to max_sleep_delay while files do not change.
+                 adaptive_polling=False,
+                 max_sleep_delay=0.5,
+                 # function to decode the JSON files, for example fast_json_loads.
+                 json_loads=json.loads,
+                 # seconds to wait for the answer to a command.
+                 command_ack_timeout=30,
+                 # events kept per iterator before the oldest ones are dropped.
+                 max_queue_size=1000,
+                 # keep the last ticks per symbol in self.tick_history (needs numpy).
+                 tick_history_capacity=0,
+                 # files modified this many seconds before the last read are
+                 # read again, use the timestamp resolution of the file system.
+                 racy_stat_seconds=RACY_STAT_SECONDS
+                 ):
+
+        # the poll functions of dwx_client call the event functions below.
+        self.init_options(self, sleep_delay, max_retry_command_seconds,
+                          load_orders_from_file, verbose, scheduler=None,
+                          adaptive_polling=adaptive_polling, max_sleep_delay=max_sleep_delay,
+                          spin_seconds=0, json_loads=json_loads, async_commands=False,
+                          racy_stat_seconds=racy_stat_seconds)
+        self.max_queue_size = max_queue_size
+
+        self.init_state(metatrader_dir_path, command_ack_timeout, tick_history_capacity)
+
+        # event type -> list of (symbols or None, asyncio.Queue).
+        self._subscribers = {'tick': [], 'bar': [], 'order': [], 'message': []}
+        self._tasks = []
+        self._command_lock = None
+
+    async def __aenter__(self):
+
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+
+        await self.stop()
+
+    """Starts one polling task per file in the running event loop and
+    resets the command IDs.
+    """
+
+    async def start(self):
+
+        if self.START:
+            return
+
+        self.ACTIVE = True
+        self._command_lock = asyncio.Lock()
+
+        for poll in (self.poll_market_data, self.poll_bar_data,
+                     self.poll_messages, self.poll_open_orders,
+                     self.poll_historic_data):
+            self._tasks.append(asyncio.ensure_future(self.poll_loop(poll)))
+
+        await self.reset_command_ids()
+
+        self.START = True
+
+    """Stops the polling tasks and ends all iterators.
+    """
+
+    async def stop(self):
+
+        self.ACTIVE = False
+        self.START = False
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for subscribers in self._subscribers.values():
+            for _, queue in subscribers:
+                self.put_event(queue, None)
+
+    """Calls the poll function until the client is stopped.
+    """
+
+    async def poll_loop(self, poll):
+
+        delay = self.new_poll_delay()
+
+        while self.ACTIVE:
+
+            try:
+                changed = poll()
+            except Exception:
+                print_exc()
+                changed = False
+
+            if poll == self.poll_messages:
+                self.command_acks.expire()
+
+            await asyncio.sleep(delay.update(changed))
+
+    """Yields (symbol, bid, ask) for each new tick.
+
+    Kwargs:
+        symbols (list[str]): Symbols to receive, None for all symbols.
+    """
+
+    async def ticks(self, symbols=None):
+
+        async for tick in self.events('tick', symbols):
+            yield tick
+
+    """Yields (symbol, time_frame, time, open, high, low, close, tick_volume)
+    for each new or updated bar.
+
+    Kwargs:
+        symbols (list[str]): Symbols to receive, None for all symbols.
+    """
+
+    async def bars(self, symbols=None):
+
+        async for bar in self.events('bar', symbols):
+            yield bar
+
+    """Yields the open orders (ticket -> order) each time an order
+    was added or removed.
+    """
+
+    async def orders(self):
+
+        async for orders in self.events('order'):
+            yield orders
+
+    """Yields each new INFO or ERROR message of the mql side.
+    """
+
+    async def messages(self):
+
+        async for message in self.events('message'):
+            yield message
+
+    """Yields the events of one type until the client is stopped.
+    """
+
+    async def events(self, event_type, symbols=None):
+
+        queue = asyncio.Queue(self.max_queue_size)
+        subscriber = (None if symbols is None else set(symbols), queue)
+        self._subscribers[event_type].append(subscriber)
+
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            self._subscribers[event_type].remove(subscriber)
+
+    """Puts an event into the queue of an iterator. Drops the oldest
+    event if the queue is full.
+    """
+
+    def put_event(self, queue, event):
+
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def publish(self, event_type, event, symbol=None):
+
+        for symbols, queue in self._subscribers[event_type]:
+            if symbols is None or symbol in symbols:
+                self.put_event(queue, event)
+
+    def on_tick(self, symbol, bid, ask):
+
+        self.publish('tick', (symbol, bid, ask), symbol)
+
+    def on_bar_data(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        self.publish('bar', (symbol, time_frame, time, open_price,
+                             high, low, close_price, tick_volume), symbol)
+
+    def on_order_event(self):
+
+        self.publish('order', dict(self.open_orders))
+
+    def on_message(self, message):
+
+        self.publish('message', message)
+
+    # the data is stored in self.historic_data and self.historic_trades.
+    def on_historic_data(self, symbol, time_frame, data):
+        pass
+
+    def on_historic_trades(self):
+        pass
+
+    """Sends a RESET_COMMAND_IDS command to reset stored command IDs.
+    """
+
+    async def reset_command_ids(self):
+
+        self.command_id = 0
+
+        await self.send_command('RESET_COMMAND_IDS', '')
+
+        # sleep to make sure it is read before other commands.
+        await asyncio.sleep(0.5)
+
+    """Writes a command to the next free command file.
+
+    Kwargs:
+        future (asyncio.Future): Future that is resolved with the INFO
+            or ERROR message of the mql side.
+
+    Returns:
+        bool: True if the command was written to a command file.
+    """
+
+    async def send_command(self, command, content, future=None):
+
+        # the lock keeps the command_ids in the order of the files.
+        async with self._command_lock:
+
+            self.command_id = (self.command_id + 1) % 100000
+
+            pending = None
+            if self.command_acks.expects_ack(command):
+                pending = self.command_acks.add(self.command_id, command,
+                                                content, future)
+
+            success = await self.write_command_file(command, content)
+
+            if success and pending is not None:
+                pending.written_time = perf_counter()
+
+        if not success and pending is not None:
+            self.command_acks.discard(pending)
+
+        if future is not None:
+            if not success:
+                future.set_exception(TimeoutError(
+                    f'Could not write command {command}, all command files are in use.'))
+            elif pending is None:
+                future.set_result(None)
+
+        return success
+
+    async def write_command_file(self, command, content):
+
+        end_time = perf_counter() + self.max_retry_command_seconds
+
+        while perf_counter() < end_time:
+            i = self.command_slots.acquire()
+            if i is None:
+                await asyncio.sleep(self.sleep_delay)
+                continue
+            file_path = f'{self.path_commands_prefix}{i}.txt'
+            if not exists(file_path):
+                try:
+                    with open(file_path, 'w') as f:
+                        f.write(f'<:{self.command_id}|{command}|{content}:>')
+                    return True
+                except:
+                    print_exc()
+            # the file is still there or could not be written, give the 
+            # mql side time to read it instead of spinning the event loop.
+            await asyncio.sleep(self.sleep_delay)
+
+        return False
+
+    """Writes a command and waits for the answer. All command
+    functions of dwx_client use this.
+    """
+
+    async def submit_command(self, command, content):
+
+        future = asyncio.get_running_loop().create_future()
+        await self.send_command(command, content, future)
+        return await future
+
+    """Like submit_command() but returns the future as soon as the
+    command was written.
+    """
+
+    async def send_command_async(self, command, content):
+
+        future = asyncio.get_running_loop().create_future()
+        await self.send_command(command, content, future)
+        return future
+
+    """Opens several orders in one pass, see dwx_client.open_orders_batch().
+    """
+
+    async def open_orders_batch(self, orders, timeout=10):
+
+        futures = [await self.send_command_async('OPEN_ORDER',
+                                                 self.order_command_content(self.open_order, order))
+                   for order in orders]
+        return await self.wait_for_batch('OPEN_ORDER', futures,
+                                         [None] * len(orders), timeout)
+
+    """Modifies several orders in one pass, see dwx_client.modify_orders_batch().
+    """
+
+    async def modify_orders_batch(self, orders, timeout=10):
+
+        futures = [await self.send_command_async('MODIFY_ORDER',
+                                                 self.order_command_content(self.modify_order, order))
+                   for order in orders]
+        return await self.wait_for_batch('MODIFY_ORDER', futures,
+                                         [order['ticket'] for order in orders], timeout)
+
+    """Closes several orders in one pass, see dwx_client.close_orders_batch().
+    """
+
+    async def close_orders_batch(self, orders, timeout=10):
+
+        orders = [order if isinstance(order, dict) else {'ticket': order}
+                  for order in orders]
+        futures = [await self.send_command_async('CLOSE_ORDER',
+                                                 self.order_command_content(self.close_order, order))
+                   for order in orders]
+        return await self.wait_for_batch('CLOSE_ORDER', futures,
+                                         [order['ticket'] for order in orders], timeout)
+
+    """Waits for the answers of a batch and matches them with the
+    changes in DWX_Orders.txt, see dwx_client.wait_for_batch().
+    """
+
+    async def wait_for_batch(self, command, futures, tickets, timeout):
+
+        end_time = perf_counter() + timeout
+
+        results = []
+        answer_times = []
+        for future, ticket in zip(futures, tickets):
+            message = None
+            try:
+                # cancels the future on timeout, so a late answer is ignored.
+                message = await asyncio.wait_for(future, max(0, end_time - perf_counter()))
+            except (TimeoutError, asyncio.TimeoutError):
+                pass
+            results.append(batch_result(ticket, message))
+            answer_times.append(perf_counter())
+
+        while not self.confirm_batch(command, results, answer_times):
+            if perf_counter() > end_time:
+                break
+            await asyncio.sleep(self.sleep_delay)
+
+        for result in results:
+            if result['ticket'] is not None:
+                result['order'] = self.open_orders.get(result['ticket'])
+
+        return results
@@ -0,0 +1,357 @@
+from time import time
+from threading import RLock, Thread, Event
+from traceback import print_exc
+from datetime import datetime, timezone
+
+from .event_stage import event_stage
+
+# numpy is only needed if bars are aggregated.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""Bar aggregator
+
+Builds OHLC bars from the ticks for any number of time frames, so that
+no SUBSCRIBE_SYMBOLS_BAR_DATA subscription (and no DWX_Bar_Data.txt
+traffic) is needed. It is used as event_handler in front of the actual
+handler:
+
+    aggregator = bar_aggregator(processor, ['S10', 'M1', 'M5', 'H1'])
+    dwx = dwx_client(aggregator, MT4_files_dir)
+
+Time frames are MT4 names ('M1', 'H4', 'D1', 'W1'), seconds ('S5',
+'S30') or a number of seconds for custom time frames. Bars are built
+from the bid like in MT4, tick_volume is the number of ticks. Bars start
+at multiples of their length in server time, which is UTC plus
+time_offset seconds, and their times are server times like the bar
+times of MT4. Weekly bars start on Sunday 00:00 server time, like in
+MT4.
+
+When the first tick of a new bar arrives, the previous bar is closed
+and passed on with on_bar_data(), so existing handlers work without
+changes. If the handler has an on_bar_update() function with the same
+arguments, it is called with the current bar after every tick.
+
+Bars of symbols without new ticks are closed by close_due_bars(), which
+is called every close_interval seconds by a background thread if
+close_interval is set. Leave it off when ticks are replayed with their
+own timestamps.
+
+The state of all symbols and time frames is kept in NumPy arrays with
+one row per symbol and one column per time frame. A tick updates all
+time frames of its symbol at once, and add_ticks() aggregates arrays
+of ticks without a loop over the ticks.
+
+Args:
+    event_handler: Gets the bars and all other events, can be None.
+    time_frames (list): Time frames to build.
+
+Kwargs:
+    time_offset (float): Seconds the MT4 server time is ahead of UTC,
+        for example 7200 for GMT+2. D1, H4 and W1 bars are cut at server
+        time midnight.
+    close_interval (float): Seconds between the calls of
+        close_due_bars() by the background thread, 0 for no thread.
+
+"""
+
+
+TIME_FRAME_UNITS = {'S': 1, 'M': 60, 'H': 3600, 'D': 86400, 'W': 604800}
+
+BAR_TIME_FORMAT = '%Y.%m.%d %H:%M'
+
+SECONDS_PER_WEEK = 604800
+# the epoch was a Thursday, weekly bars start 3 days later on Sunday.
+WEEK_START = 3 * 86400
+
+
+"""Returns (name, seconds) of a time frame given as name or seconds.
+"""
+
+
+def parse_time_frame(time_frame):
+
+    if isinstance(time_frame, (int, float)):
+        seconds = int(time_frame)
+        if seconds % 60 == 0:
+            return f'M{seconds // 60}', seconds
+        return f'S{seconds}', seconds
+
+    unit = time_frame[0].upper()
+    if unit not in TIME_FRAME_UNITS or not time_frame[1:].isdigit():
+        raise ValueError(f'Unknown time frame: {time_frame}')
+    return time_frame, int(time_frame[1:]) * TIME_FRAME_UNITS[unit]
+
+
+class bar_aggregator(event_stage):
+
+    def __init__(self, event_handler=None,
+                 time_frames=('M1', 'M5', 'M15', 'H1', 'H4'), time_offset=0,
+                 close_interval=0):
+
+        if np is None:
+            raise ImportError('numpy is needed for the bar aggregator.')
+
+        event_stage.__init__(self, event_handler)
+
+        parsed = [parse_time_frame(time_frame) for time_frame in time_frames]
+        self.time_frames = [name for name, _ in parsed]
+        self.seconds = np.array([seconds for _, seconds in parsed], dtype=np.float64)
+        self.anchors = np.where(self.seconds % SECONDS_PER_WEEK == 0, WEEK_START, 0.)
+        self.time_offset = time_offset
+
+        # symbol -> row in the arrays.
+        self._rows = {}
+        self._resize(16)
+
+        self.num_closed = 0
+
+        # the arrays are changed by the polling thread and the close
+        # thread. The events are passed on while it is held, so that
+        # the bars of a symbol stay in order. Handlers may read
+        # current_bar() from the events.
+        self._lock = RLock()
+
+        self.close_interval = close_interval
+        self._closed = Event()
+        self.close_thread = None
+        if close_interval > 0:
+            self.close_thread = Thread(target=self.run_close_due_bars, args=())
+            self.close_thread.daemon = True
+            self.close_thread.start()
+
+    def _resize(self, num_rows):
+
+        shape = (num_rows, len(self.time_frames))
+        arrays = {'starts': np.full(shape, -1.),
+                  'opens': np.zeros(shape),
+                  'highs': np.zeros(shape),
+                  'lows': np.zeros(shape),
+                  'closes': np.zeros(shape),
+                  'volumes': np.zeros(shape, dtype=np.int64)}
+        for name, array in arrays.items():
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:len(old)] = old
+            setattr(self, name, array)
+
+    def _row(self, symbol):
+
+        row = self._rows.get(symbol)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self.starts):
+                self._resize(2 * row)
+            self._rows[symbol] = row
+        return row
+
+    def on_tick(self, symbol, bid, ask):
+
+        self.add_tick(symbol, bid)
+
+        event_stage.on_tick(self, symbol, bid, ask)
+
+    """Adds one tick to all time frames of a symbol.
+
+    Kwargs:
+        timestamp (float): Seconds since epoch (UTC), by default the
+            current time.
+    """
+
+    def add_tick(self, symbol, price, timestamp=None):
+
+        if timestamp is None:
+            timestamp = time()
+
+        with self._lock:
+            self._add_tick(symbol, price, timestamp)
+
+    def _add_tick(self, symbol, price, timestamp):
+
+        row = self._row(symbol)
+        starts = self.bar_starts(timestamp)
+        new = starts > self.starts[row]
+
+        if new.any():
+            for column in np.flatnonzero(new & (self.starts[row] >= 0)):
+                self.close_bar(symbol, row, column)
+            self.starts[row, new] = starts[new]
+            self.opens[row, new] = price
+            self.highs[row, new] = price
+            self.lows[row, new] = price
+            self.volumes[row, new] = 0
+
+        np.maximum(self.highs[row], price, out=self.highs[row])
+        np.minimum(self.lows[row], price, out=self.lows[row])
+        self.closes[row] = price
+        self.volumes[row] += 1
+
+        self.update_bars(symbol, row)
+
+    """Adds ticks of one symbol in time order (UTC), for example from
+    tick_reader or tick_history. The bars are computed per time frame
+    with NumPy reductions. on_bar_update() is called once at the end.
+
+    Args:
+        times (numpy.ndarray): Seconds since epoch.
+        prices (numpy.ndarray): Bid prices.
+    """
+
+    def add_ticks(self, symbol, times, prices):
+
+        if len(times) == 0:
+            return
+
+        times = np.asarray(times, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+
+        with self._lock:
+            self._add_ticks(symbol, times, prices)
+
+    def _add_ticks(self, symbol, times, prices):
+
+        row = self._row(symbol)
+
+        for column in range(len(self.seconds)):
+
+            starts = self.bar_starts(times, column)
+            # ticks older than the current bar count for the current bar.
+            starts = np.maximum(starts, self.starts[row, column])
+
+            first = np.concatenate(([0], np.flatnonzero(np.diff(starts)) + 1))
+            last = np.concatenate((first[1:] - 1, [len(times) - 1]))
+
+            opens = prices[first]
+            highs = np.maximum.reduceat(prices, first)
+            lows = np.minimum.reduceat(prices, first)
+            closes = prices[last]
+            volumes = last - first + 1
+
+            # the first group continues the current bar.
+            if starts[0] == self.starts[row, column]:
+                opens[0] = self.opens[row, column]
+                highs[0] = max(highs[0], self.highs[row, column])
+                lows[0] = min(lows[0], self.lows[row, column])
+                volumes[0] += self.volumes[row, column]
+            elif self.starts[row, column] >= 0:
+                self.close_bar(symbol, row, column)
+
+            for i in range(len(first) - 1):
+                self.emit_bar(symbol, column, starts[first[i]], opens[i], highs[i],
+                              lows[i], closes[i], volumes[i])
+
+            self.starts[row, column] = starts[first[-1]]
+            self.opens[row, column] = opens[-1]
+            self.highs[row, column] = highs[-1]
+            self.lows[row, column] = lows[-1]
+            self.closes[row, column] = closes[-1]
+            self.volumes[row, column] = volumes[-1]
+
+        self.update_bars(symbol, row)
+
+    """Closes the bars whose time has passed without waiting for the next
+    tick, for example from a timer.
+    """
+
+    def close_due_bars(self, timestamp=None):
+
+        if timestamp is None:
+            timestamp = time()
+
+        with self._lock:
+
+            due = (self.starts >= 0) & (self.starts + self.seconds <= timestamp + self.time_offset)
+
+            for symbol, row in list(self._rows.items()):
+                for column in np.flatnonzero(due[row]):
+                    self.close_bar(symbol, row, column)
+                    self.starts[row, column] = -1.
+
+    def run_close_due_bars(self):
+
+        while not self._closed.wait(self.close_interval):
+            try:
+                self.close_due_bars()
+            except:
+                print_exc()
+
+    """Stops the close thread.
+    """
+
+    def close(self):
+
+        self._closed.set()
+
+    """Returns the start of the bars in server time for UTC timestamps,
+    for all time frames or for one column.
+    """
+
+    def bar_starts(self, timestamps, column=None):
+
+        if column is None:
+            seconds, anchors = self.seconds, self.anchors
+        else:
+            seconds, anchors = self.seconds[column], self.anchors[column]
+
+        server_times = timestamps + self.time_offset
+        return server_times - (server_times - anchors) % seconds
+
+    def close_bar(self, symbol, row, column):
+
+        self.emit_bar(symbol, column, self.starts[row, column], self.opens[row, column],
+                      self.highs[row, column], self.lows[row, column],
+                      self.closes[row, column], self.volumes[row, column])
+
+    def emit_bar(self, symbol, column, start, open_price, high, low, close_price, tick_volume):
+
+        self.num_closed += 1
+        event_stage.on_bar_data(self, symbol, self.time_frames[column], format_bar_time(start),
+                                float(open_price), float(high), float(low),
+                                float(close_price), int(tick_volume))
+
+    def update_bars(self, symbol, row):
+
+        on_bar_update = getattr(self.event_handler, 'on_bar_update', None)
+        if on_bar_update is None:
+            return
+
+        for column, time_frame in enumerate(self.time_frames):
+            if self.starts[row, column] < 0:
+                continue
+            on_bar_update(symbol, time_frame, format_bar_time(self.starts[row, column]),
+                          float(self.opens[row, column]), float(self.highs[row, column]),
+                          float(self.lows[row, column]), float(self.closes[row, column]),
+                          int(self.volumes[row, column]))
+
+    """Returns the current (not closed) bar of a symbol as dict, or None.
+    """
+
+    def current_bar(self, symbol, time_frame):
+
+        column = self.time_frames.index(time_frame)
+        with self._lock:
+            row = self._rows.get(symbol)
+            if row is None or self.starts[row, column] < 0:
+                return None
+            return {'time': format_bar_time(self.starts[row, column]),
+                    'open': float(self.opens[row, column]),
+                    'high': float(self.highs[row, column]),
+                    'low': float(self.lows[row, column]),
+                    'close': float(self.closes[row, column]),
+                    'tick_volume': int(self.volumes[row, column])}
+
+
+"""Returns the bar time in the format of the DWX files. Bars that do not
+start at a full minute get the seconds appended.
+"""
+
+
+def format_bar_time(start):
+
+    bar_time = datetime.fromtimestamp(start, timezone.utc)
+    if bar_time.second == 0:
+        return bar_time.strftime(BAR_TIME_FORMAT)
+    return bar_time.strftime(BAR_TIME_FORMAT + ':%S')
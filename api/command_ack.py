@@ -0,0 +1,201 @@
+import re
+from time import perf_counter
+from threading import Lock
+from collections import deque
+
+
+"""Command acknowledgements
+
+The mql side answers most commands with an INFO or ERROR message in
+DWX_Messages.txt. The messages do not contain the command_id, so each
+message is matched to the oldest pending command of the command type
+that the message belongs to.
+
+ACK_RULES maps the messages to the commands. The first rule that matches
+a message decides the command type, so more specific rules come first.
+Commands without a rule (for example GET_HISTORIC_DATA) are not
+acknowledged by a message.
+
+If the message names an order ticket that is also the first field of a
+pending command (MODIFY_ORDER, CLOSE_ORDER), that command is matched
+instead of the oldest one, because the mql side does not always execute
+the commands in the order of their command_id.
+
+"""
+
+
+# (command, message type, pattern for the message text or the error type)
+ACK_RULES = [
+    ('CLOSE_ALL_ORDERS', 'ERROR', r'CLOSE_ORDER_ALL'),
+    ('CLOSE_ORDERS_BY_SYMBOL', 'ERROR', r'CLOSE_ORDER_SYMBOL'),
+    ('CLOSE_ORDERS_BY_MAGIC', 'ERROR', r'CLOSE_ORDER_MAGIC'),
+    ('CLOSE_ORDER', 'ERROR', r'CLOSE_ORDER'),
+    ('OPEN_ORDER', 'ERROR', r'OPEN_ORDER'),
+    ('MODIFY_ORDER', 'ERROR', r'MODIFY_ORDER'),
+    ('CLOSE_ORDERS_BY_SYMBOL', 'INFO', r'Successfully closed \d+ orders with symbol'),
+    ('CLOSE_ORDERS_BY_MAGIC', 'INFO', r'Successfully closed \d+ orders with magic'),
+    ('CLOSE_ALL_ORDERS', 'INFO', r'Successfully closed \d+ orders'),
+    ('CLOSE_ORDER', 'INFO', r'Successfully (closed|deleted) order'),
+    ('OPEN_ORDER', 'INFO', r'Successfully sent order'),
+    ('MODIFY_ORDER', 'INFO', r'Successfully modified order'),
+    ('SUBSCRIBE_SYMBOLS_BAR_DATA', 'INFO', r'Successfully subscribed to bar data'),
+    ('SUBSCRIBE_SYMBOLS', 'INFO', r'Successfully subscribed'),
+]
+
+TICKET_PATTERN = re.compile(r'order (\d+)')
+
+
+class pending_command():
+
+    def __init__(self, command_id, command, content, future, deadline):
+
+        self.command_id = command_id
+        self.command = command
+        self.content = content
+        self.future = future
+        self.deadline = deadline
+        self.written_time = perf_counter()
+
+
+"""Keeps the commands that wait for an acknowledgement.
+
+Kwargs:
+    timeout (float): Seconds after which a pending command is dropped.
+        Its future (if any) gets a TimeoutError.
+    rules (list): Rules to match messages, see ACK_RULES.
+
+"""
+
+
+class ack_matcher():
+
+    def __init__(self, timeout=30, rules=ACK_RULES):
+
+        self.timeout = timeout
+        self.rules = [(command, message_type, re.compile(pattern))
+                      for command, message_type, pattern in rules]
+        self.commands = set(command for command, _, _ in self.rules)
+
+        self._pending = {}
+        self._lock = Lock()
+
+    """Returns True if the mql side answers the command with a message.
+    """
+
+    def expects_ack(self, command):
+
+        return command in self.commands
+
+    """Adds a command that was written to a command file.
+
+    The future can be None, for example for commands sent with
+    send_command(). They are still tracked so that their messages are
+    not matched to later commands.
+    """
+
+    def add(self, command_id, command, content='', future=None):
+
+        pending = pending_command(command_id, command, content, future,
+                                  perf_counter() + self.timeout)
+        with self._lock:
+            self._pending.setdefault(command, deque()).append(pending)
+        return pending
+
+    """Removes a command, for example if it could not be written.
+    """
+
+    def discard(self, pending):
+
+        with self._lock:
+            queue = self._pending.get(pending.command)
+            if queue and pending in queue:
+                queue.remove(pending)
+
+    """Returns the command type a message belongs to, or None.
+    """
+
+    def command_of(self, message):
+
+        message_type = message.get('type')
+        if message_type == 'ERROR':
+            text = message.get('error_type', '')
+        else:
+            text = message.get('message', '')
+
+        for command, rule_type, pattern in self.rules:
+            if rule_type == message_type and pattern.match(text):
+                return command
+        return None
+
+    """Matches a message to the oldest pending command of its type
+    and resolves its future with the message.
+
+    Returns:
+        The pending_command, or None if no command matched.
+    """
+
+    def match(self, message):
+
+        self.expire()
+
+        command = self.command_of(message)
+        if command is None:
+            return None
+
+        ticket = ticket_of(message)
+
+        with self._lock:
+            queue = self._pending.get(command)
+            if not queue:
+                return None
+            pending = queue[0]
+            if ticket is not None:
+                for candidate in queue:
+                    if candidate.content.split(',', 1)[0] == ticket:
+                        pending = candidate
+                        break
+            queue.remove(pending)
+
+        if pending.future is not None and not pending.future.done():
+            pending.future.set_result(message)
+        return pending
+
+    """Drops commands that were not acknowledged within the timeout.
+    """
+
+    def expire(self):
+
+        now = perf_counter()
+        expired = []
+        with self._lock:
+            for queue in self._pending.values():
+                while queue and queue[0].deadline < now:
+                    expired.append(queue.popleft())
+
+        for pending in expired:
+            if pending.future is not None and not pending.future.done():
+                pending.future.set_exception(TimeoutError(
+                    f'No answer for command {pending.command_id} ({pending.command}).'))
+
+    """Returns the number of commands waiting for an answer.
+    """
+
+    def num_pending(self):
+
+        with self._lock:
+            return sum(len(queue) for queue in self._pending.values())
+
+
+"""Returns the order ticket named in an INFO message, or None.
+"""
+
+
+def ticket_of(message):
+
+    if message.get('type') != 'INFO':
+        return None
+
+    match = TICKET_PATTERN.search(message.get('message', ''))
+    if match is None:
+        return None
+    return match.group(1)
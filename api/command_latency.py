@@ -0,0 +1,130 @@
+from time import perf_counter
+from threading import Lock
+from collections import deque, OrderedDict
+
+
+"""Command latency
+
+Measures how long the mql side takes to act on a command. The time
+starts when the command file was written and ends when the answer
+(INFO or ERROR message) was read. For OPEN_ORDER commands the time
+until the new ticket shows up in DWX_Orders.txt is also measured, as
+'OPEN_ORDER:orders'.
+
+The last max_samples values are kept per command type and percentiles
+are computed from them.
+
+"""
+
+
+ORDERS_SUFFIX = ':orders'
+
+
+class command_latency():
+
+    def __init__(self, max_samples=1000, max_tickets=1000):
+
+        self.max_samples = max_samples
+        self.max_tickets = max_tickets
+
+        self._samples = {}
+        self._counts = {}
+        # ticket -> write time of the OPEN_ORDER, answered but not seen yet.
+        self._awaited_tickets = OrderedDict()
+        # ticket -> time it was first seen in the orders file.
+        self._seen_tickets = OrderedDict()
+        self._lock = Lock()
+
+    """Adds one measurement in seconds.
+    """
+
+    def record(self, name, seconds):
+
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+                self._counts[name] = 0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+
+    """Records the latency of an answered command.
+
+    Args:
+        pending (pending_command): The command matched by ack_matcher.
+        ticket (str): Ticket named in the answer, or None.
+    """
+
+    def command_answered(self, pending, ticket=None):
+
+        now = perf_counter()
+        self.record(pending.command, now - pending.written_time)
+
+        if pending.command != 'OPEN_ORDER' or ticket is None:
+            return
+
+        with self._lock:
+            seen_time = self._seen_tickets.pop(ticket, None)
+            if seen_time is None:
+                self._awaited_tickets[ticket] = pending.written_time
+                trim(self._awaited_tickets, self.max_tickets)
+
+        if seen_time is not None:
+            self.record(pending.command + ORDERS_SUFFIX,
+                        seen_time - pending.written_time)
+
+    """Records the latency of new orders from DWX_Orders.txt. The
+    answer can be read before or after the orders file.
+    """
+
+    def orders_seen(self, tickets):
+
+        now = perf_counter()
+        found = []
+        with self._lock:
+            for ticket in tickets:
+                written_time = self._awaited_tickets.pop(ticket, None)
+                if written_time is None:
+                    self._seen_tickets[ticket] = now
+                else:
+                    found.append(written_time)
+            trim(self._seen_tickets, self.max_tickets)
+
+        for written_time in found:
+            self.record('OPEN_ORDER' + ORDERS_SUFFIX, now - written_time)
+
+    """Returns the statistics per command type in milliseconds.
+
+    Returns:
+        dict: command -> {'count', 'p50', 'p95', 'p99', 'max'}.
+            count is the total number of measurements, the other
+            values are computed from the last max_samples.
+    """
+
+    def get_stats(self):
+
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            counts = dict(self._counts)
+
+        stats = {}
+        for name, values in samples.items():
+            stats[name] = {
+                'count': counts[name],
+                'p50': 1000 * percentile(values, 50),
+                'p95': 1000 * percentile(values, 95),
+                'p99': 1000 * percentile(values, 99),
+                'max': 1000 * values[-1],
+            }
+        return stats
+
+
+def percentile(sorted_values, p):
+
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def trim(ordered_dict, max_size):
+
+    while len(ordered_dict) > max_size:
+        ordered_dict.popitem(last=False)
@@ -0,0 +1,170 @@
+from queue import Empty
+from threading import Condition
+from collections import deque
+
+
+"""Command queue
+
+Queue for the commands of send_command_async() with two lanes and
+coalescing of order modifications.
+
+Commands that reduce risk (closing orders) go into the high priority
+lane and are written before all queued commands of the normal lane.
+Note that this also moves them in front of queued OPEN_ORDER commands.
+
+If a MODIFY_ORDER command for a ticket is queued while an older one for
+the same ticket was not written yet, only the newest stop loss/take
+profit is sent. The older command takes the content of the new one and
+the future of the new command gets the same result.
+
+A CLOSE_ORDER command removes a queued MODIFY_ORDER command for the same
+ticket, which would otherwise be written after the close and fail. The
+future of the removed command is cancelled.
+
+"""
+
+
+HIGH_PRIORITY_COMMANDS = {
+    'CLOSE_ORDER',
+    'CLOSE_ALL_ORDERS',
+    'CLOSE_ORDERS_BY_SYMBOL',
+    'CLOSE_ORDERS_BY_MAGIC',
+}
+
+COALESCED_COMMANDS = {'MODIFY_ORDER'}
+
+# command -> queued command for the same ticket that it makes obsolete.
+SUPERSEDED_COMMANDS = {'CLOSE_ORDER': 'MODIFY_ORDER'}
+
+
+class queued_command():
+
+    def __init__(self, command, content, future):
+
+        self.command = command
+        self.content = content
+        self.future = future
+
+
+class command_queue():
+
+    def __init__(self, high_priority_commands=HIGH_PRIORITY_COMMANDS,
+                 coalesced_commands=COALESCED_COMMANDS,
+                 superseded_commands=SUPERSEDED_COMMANDS):
+
+        self.high_priority_commands = high_priority_commands
+        self.coalesced_commands = coalesced_commands
+        self.superseded_commands = superseded_commands
+
+        self._high = deque()
+        self._normal = deque()
+        # (command, ticket) -> queued_command that was not written yet.
+        self._coalescable = {}
+        self._condition = Condition()
+
+        self.num_coalesced = 0
+        self.num_prioritized = 0
+        self.num_superseded = 0
+
+    """Adds a command. Returns the queued_command that will be written,
+    which is an older one if the command was coalesced.
+    """
+
+    def put(self, command, content, future=None):
+
+        with self._condition:
+
+            if command in self.coalesced_commands:
+                key = (command, content.split(',', 1)[0])
+                queued = self._coalescable.get(key)
+                if queued is not None:
+                    queued.content = content
+                    if queued.future is None:
+                        queued.future = future
+                    elif future is not None:
+                        queued.future.add_done_callback(
+                            lambda done, future=future: copy_future_result(done, future))
+                    self.num_coalesced += 1
+                    return queued
+
+            if command in self.superseded_commands:
+                self.remove_queued(self.superseded_commands[command],
+                                   content.split(',', 1)[0])
+
+            queued = queued_command(command, content, future)
+
+            if command in self.coalesced_commands:
+                self._coalescable[key] = queued
+
+            if command in self.high_priority_commands:
+                self._high.append(queued)
+                if len(self._normal) > 0:
+                    self.num_prioritized += 1
+            else:
+                self._normal.append(queued)
+
+            self._condition.notify()
+            return queued
+
+    """Returns the next (command, content, future). Raises queue.Empty
+    if there was no command within the timeout.
+    """
+
+    def get(self, timeout=None):
+
+        with self._condition:
+
+            if len(self._high) == 0 and len(self._normal) == 0:
+                self._condition.wait(timeout)
+
+            if len(self._high) > 0:
+                queued = self._high.popleft()
+            elif len(self._normal) > 0:
+                queued = self._normal.popleft()
+            else:
+                raise Empty
+
+            if queued.command in self.coalesced_commands:
+                key = (queued.command, queued.content.split(',', 1)[0])
+                if self._coalescable.get(key) is queued:
+                    del self._coalescable[key]
+
+            return queued.command, queued.content, queued.future
+
+    """Removes the queued command for a ticket that was not written yet
+    and cancels its future. Call with the condition held.
+    """
+
+    def remove_queued(self, command, ticket):
+
+        queued = self._coalescable.pop((command, ticket), None)
+        if queued is None:
+            return
+
+        for lane in (self._normal, self._high):
+            try:
+                lane.remove(queued)
+                break
+            except ValueError:
+                pass
+
+        if queued.future is not None:
+            queued.future.cancel()
+        self.num_superseded += 1
+
+    def qsize(self):
+
+        with self._condition:
+            return len(self._high) + len(self._normal)
+
+
+def copy_future_result(source, target):
+
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
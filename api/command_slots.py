@@ -0,0 +1,142 @@
+import os
+import re
+from threading import Lock
+from os.path import dirname, basename
+
+from .file_watcher import inotify_watcher, IN_DELETE, IN_MOVED_FROM
+
+
+"""Command slots
+
+Keeps track of which DWX_Commands_{i}.txt files still exist, so that a
+free file can be found without checking every path with exists().
+
+A file is marked as used when we write it. With an inotify watcher it
+is marked as free again when the mql side removed it, and the directory
+is only scanned if all files seem to be used. Without inotify the
+directory is scanned once per command (instead of one exists() per file).
+
+The lowest free file is handed out first. The mql side reads the
+command files in order and stops at the first file that does not exist,
+so the files have to be filled from index 0 without gaps.
+
+Args:
+    path_commands_prefix (str): Path of the command files without the
+        index, e.g. '.../DWX/DWX_Commands_'.
+    num_command_files (int): Number of command files.
+
+"""
+
+
+class command_slots():
+
+    def __init__(self, path_commands_prefix, num_command_files=50):
+
+        self.directory = dirname(path_commands_prefix)
+        self.prefix = basename(path_commands_prefix)
+        self.num_command_files = num_command_files
+
+        self._pattern = re.compile(re.escape(self.prefix) + r'(\d+)\.txt$')
+        self._used = set()
+        self._lock = Lock()
+
+        self.track_removals = False
+        self.num_scans = 0
+
+        self.scan()
+
+    """Reads the directory once and marks the existing files as used.
+    """
+
+    def scan(self):
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+
+        used = set()
+        for name in names:
+            match = self._pattern.match(name)
+            if match is not None and int(match.group(1)) < self.num_command_files:
+                used.add(int(match.group(1)))
+
+        with self._lock:
+            self._used = used
+            self.num_scans += 1
+
+    """Returns the index of the next free command file and marks it as
+    used, or None if all files are in use.
+    """
+
+    def acquire(self):
+
+        # without events the cached state could miss a removed file and 
+        # leave a gap in front of the new command.
+        if not self.track_removals:
+            self.scan()
+            return self._find_free()
+
+        index = self._find_free()
+
+        if index is None:
+            self.scan()
+            index = self._find_free()
+
+        return index
+
+    def _find_free(self):
+
+        with self._lock:
+            for index in range(self.num_command_files):
+                if index not in self._used:
+                    self._used.add(index)
+                    return index
+        return None
+
+    """Marks a command file as used, for example if it already existed.
+    """
+
+    def mark_used(self, index):
+
+        with self._lock:
+            self._used.add(index)
+
+    """Marks a command file as free.
+    """
+
+    def release(self, index):
+
+        with self._lock:
+            self._used.discard(index)
+
+    """Registers on_file_event() with the file watcher if it reports 
+    removed files (only the inotify_watcher does).
+    """
+
+    def watch(self, file_watcher):
+
+        if isinstance(file_watcher, inotify_watcher):
+            file_watcher.add_callback(self.on_file_event)
+            self.track_removals = True
+
+    """Callback for the file watcher. Frees the file if it was removed.
+    """
+
+    def on_file_event(self, name, mask):
+
+        if not mask & (IN_DELETE | IN_MOVED_FROM):
+            return
+
+        match = self._pattern.match(name)
+        if match is not None:
+            self.release(int(match.group(1)))
+
+    """Returns the number of command files that were not read by the
+    mql side yet (as far as known without scanning).
+    """
+
+    def num_used(self):
+
+        with self._lock:
+            return len(self._used)
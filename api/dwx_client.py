@@ -1,12 +1,80 @@
 
 import os
 import json
-from time import sleep
+from time import sleep, time, time_ns, perf_counter
+from queue import Empty
 from threading import Thread, Lock
+from inspect import signature
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeoutError
 from os.path import join, exists
 from traceback import print_exc
 from datetime import datetime, timezone, timedelta
 
+from .file_watcher import create_file_watcher
+from .poll_scheduler import adaptive_delay
+from .command_ack import ack_matcher, ticket_of
+from .command_latency import command_latency
+from .command_slots import command_slots
+from .command_queue import command_queue
+from .tick_history import tick_history
+
+
+# orjson is optional. fast_json_loads can be passed as json_loads to dwx_client.
+try:
+    import orjson
+    fast_json_loads = orjson.loads
+except ImportError:
+    fast_json_loads = json.loads
+
+
+# files modified less than this many seconds before they were last read
+# are read again even if os.stat() did not change. FAT has a timestamp
+# resolution of 2 seconds and NTFS updates the modification time lazily.
+RACY_STAT_SECONDS = 2.
+
+
+"""Compares the market data with the last quotes.
+
+Only bid and ask are compared, as (bid, ask) tuples. last_quotes is 
+updated in place. 
+
+Args:
+    data (dict): Market data as decoded from DWX_Market_Data.txt. 
+    last_quotes (dict): symbol -> (bid, ask) of the last call. 
+
+Returns:
+    list[tuple]: (symbol, bid, ask) for each symbol that changed. 
+"""
+
+
+def changed_quotes(data, last_quotes):
+
+    changed = []
+    for symbol, values in data.items():
+        bid = values['bid']
+        ask = values['ask']
+        last = last_quotes.get(symbol)
+        if last is None or last[0] != bid or last[1] != ask:
+            last_quotes[symbol] = (bid, ask)
+            changed.append((symbol, bid, ask))
+    return changed
+
+
+"""Returns the result of one command of a batch before it is 
+confirmed, see dwx_client.wait_for_batch(). The ticket of a new 
+order is read from the answer. 
+"""
+
+
+def batch_result(ticket, message):
+
+    if ticket is None and message is not None:
+        ticket = ticket_of(message)
+    return {'ticket': None if ticket is None else str(ticket),
+            'message': message,
+            'confirmed': False,
+            'order': None}
+
 
 """Client class
 
@@ -23,16 +91,82 @@ class dwx_client():
                  max_retry_command_seconds=10,
                  # to load orders from file on initialization.
                  load_orders_from_file=True,
-                 verbose=True
+                 verbose=True,
+                 # wait for file changes with inotify instead of sleeping (linux only).
+                 use_inotify=True,
+                 # poll_scheduler that polls the files instead of five own threads.
+                 scheduler=None,
+                 # polling intervals per file if a scheduler is used.
+                 poll_intervals=None,
+                 # back off up to max_sleep_delay while files do not change.
+                 adaptive_polling=False,
+                 max_sleep_delay=0.5,
+                 # keep checking the market data file for this many seconds
+                 # before sleeping again (uses a full CPU core while spinning).
+                 spin_seconds=0,
+                 # function to decode the JSON files, for example fast_json_loads.
+                 json_loads=json.loads,
+                 # return futures from the command functions instead of blocking.
+                 async_commands=False,
+                 # seconds to wait for the answer to a command.
+                 command_ack_timeout=30,
+                 # keep the last ticks per symbol in self.tick_history (needs numpy).
+                 tick_history_capacity=0,
+                 # files modified this many seconds before the last read are
+                 # read again, use the timestamp resolution of the file system.
+                 racy_stat_seconds=RACY_STAT_SECONDS
                  ):
 
+        self.init_options(event_handler, sleep_delay, max_retry_command_seconds,
+                          load_orders_from_file, verbose, scheduler, adaptive_polling,
+                          max_sleep_delay, spin_seconds, json_loads, async_commands,
+                          racy_stat_seconds)
+
+        self.init_state(metatrader_dir_path, command_ack_timeout, tick_history_capacity)
+
+        if self.scheduler is not None:
+            self.scheduler.add_client(self, poll_intervals)
+        else:
+            self.file_watcher = create_file_watcher(join(metatrader_dir_path, 'DWX'),
+                                                    use_inotify, verbose)
+            self.command_slots.watch(self.file_watcher)
+            self.start_threads()
+
+        self.reset_command_ids()
+
+        # no need to wait.
+        if self.event_handler is None:
+            self.start()
+
+    """Sets the options shared by all client variants, see __init__(). 
+    """
+
+    def init_options(self, event_handler, sleep_delay, max_retry_command_seconds,
+                     load_orders_from_file, verbose, scheduler, adaptive_polling,
+                     max_sleep_delay, spin_seconds, json_loads, async_commands,
+                     racy_stat_seconds=RACY_STAT_SECONDS):
+
         self.event_handler = event_handler
         self.sleep_delay = sleep_delay
         self.max_retry_command_seconds = max_retry_command_seconds
         self.load_orders_from_file = load_orders_from_file
         self.verbose = verbose
+        self.scheduler = scheduler
+        self.adaptive_polling = adaptive_polling
+        self.max_sleep_delay = max_sleep_delay
+        self.spin_seconds = spin_seconds
+        self.json_loads = json_loads
+        self.async_commands = async_commands
+        self.racy_stat_nanoseconds = int(racy_stat_seconds * 1e9)
         self.command_id = 0
 
+    """Sets the file paths and the state shared by all client variants 
+    and loads the stored orders and messages. 
+    """
+
+    def init_state(self, metatrader_dir_path, command_ack_timeout=30,
+                   tick_history_capacity=0):
+
         if not exists(metatrader_dir_path):
             print('ERROR: metatrader_dir_path does not exist!')
             exit()
@@ -57,35 +191,53 @@ class dwx_client():
                                          'DWX', 'DWX_Commands_')
 
         self.num_command_files = 50
+        self.command_slots = command_slots(self.path_commands_prefix,
+                                           self.num_command_files)
 
         self._last_messages_millis = 0
-        self._last_open_orders_str = ""
-        self._last_messages_str = ""
-        self._last_market_data_str = ""
-        self._last_bar_data_str = ""
-        self._last_historic_data_str = ""
-        self._last_historic_trades_str = ""
+        # file path -> [st_mtime_ns, st_size, hash of the text, time_ns()] of the last read.
+        self._file_states = {}
 
         self.open_orders = {}
         self.account_info = {}
+        # perf_counter() of the last change read from the orders file.
+        self.orders_read_time = 0.
         self.market_data = {}
         self.bar_data = {}
         self.historic_data = {}
         self.historic_trades = {}
 
         self._last_bar_data = {}
-        self._last_market_data = {}
+        # symbol -> (bid, ask) of the last on_tick() call.
+        self._last_quotes = {}
+        self.tick_history = None
+        if tick_history_capacity > 0:
+            self.tick_history = tick_history(tick_history_capacity)
+
+        self.file_watcher = None
 
         self.ACTIVE = True
         self.START = False
 
         self.lock = Lock()
 
+        self.command_acks = ack_matcher(command_ack_timeout)
+        self.command_latency = command_latency()
+        self._command_queue = command_queue()
+        self._command_writer_lock = Lock()
+        self.command_writer_thread = None
+
         self.load_messages()
 
         if self.load_orders_from_file:
             self.load_orders()
 
+    """Starts one thread per file. Not used if a poll_scheduler 
+    is given.
+    """
+
+    def start_threads(self):
+
         self.messages_thread = Thread(target=self.check_messages, args=())
         self.messages_thread.daemon = True
         self.messages_thread.start()
@@ -109,18 +261,59 @@ class dwx_client():
         self.historic_data_thread.daemon = True
         self.historic_data_thread.start()
 
-        self.reset_command_ids()
-
-        # no need to wait.
-        if self.event_handler is None:
-            self.start()
-
     """START can be used to check if the client has been initialized.  
     """
 
     def start(self):
         self.START = True
 
+    """Returns the polling delay for one file. With adaptive_polling 
+    it backs off to max_sleep_delay while the file does not change. 
+    """
+
+    def new_poll_delay(self, min_delay=None):
+
+        if min_delay is None:
+            min_delay = self.sleep_delay
+
+        if not self.adaptive_polling:
+            return adaptive_delay(min_delay, min_delay)
+
+        return adaptive_delay(min_delay, self.max_sleep_delay)
+
+    """Waits until one of the files of the handle changed. 
+
+    If the client was not started yet, it just sleeps so that the 
+    handle stays triggered and the first check after start() happens 
+    immediately.
+    """
+
+    def wait_for_files(self, handle, delay):
+
+        if not self.START:
+            sleep(self.sleep_delay)
+            return
+
+        self.file_watcher.wait(handle, delay.delay)
+
+    """Calls the poll function in a loop without sleeping for 
+    self.spin_seconds. The time is extended after each change. 
+
+    Returns True if the poll function read new data.
+    """
+
+    def spin(self, poll):
+
+        changed = False
+        end_time = perf_counter() + self.spin_seconds
+
+        while self.ACTIVE and perf_counter() < end_time:
+            if poll():
+                changed = True
+                end_time = perf_counter() + self.spin_seconds
+
+        return changed
+
     """Tries to read a file. 
     """
 
@@ -138,6 +331,57 @@ class dwx_client():
             print_exc()
         return ''
 
+    """Reads a file only if it changed since the last call.
+
+    First os.stat() is used to compare the modification time and size 
+    with the last read. Only if they differ the file is read, and the 
+    text is compared by its hash instead of keeping a copy of it. 
+
+    If the file was modified less than racy_stat_seconds before it was 
+    last read, it is read and its hash compared anyway, because a 
+    second write within the timestamp resolution of the file system 
+    would not change the modification time, and rewrites often keep 
+    the size because the prices have a fixed precision (like the racy 
+    clean check of git). Once a read happened well after the last 
+    modification, the stat is trusted. 
+
+    Returns:
+        The text of the file, or None if the file does not exist, 
+        is empty or did not change. 
+    """
+
+    def read_file_if_changed(self, file_path):
+
+        read_time = time_ns()
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        # [modification time, size, hash of the text, time of the read].
+        state = self._file_states.get(file_path)
+
+        if (state is not None and state[0] == stat.st_mtime_ns
+                and state[1] == stat.st_size
+                and stat.st_mtime_ns < state[3] - self.racy_stat_nanoseconds):
+            return None
+
+        text = self.try_read_file(file_path)
+
+        if len(text.strip()) == 0:
+            return None
+
+        text_hash = hash(text)
+
+        if state is not None and state[2] == text_hash:
+            state[0] = stat.st_mtime_ns
+            state[1] = stat.st_size
+            state[3] = read_time
+            return None
+
+        self._file_states[file_path] = [stat.st_mtime_ns, stat.st_size, text_hash, read_time]
+        return text
+
     """Tries to remove a file.
     """
 
@@ -151,195 +395,284 @@ class dwx_client():
             except:
                 print_exc()
 
-    """Regularly checks the file for open orders and triggers
-    the event_handler.on_order_event() function.
+    """Regularly checks the file for open orders in its own thread.
     """
 
     def check_open_orders(self):
 
+        handle = self.file_watcher.watch(self.path_orders)
+
+        delay = self.new_poll_delay()
+
         while self.ACTIVE:
 
-            sleep(self.sleep_delay)
+            self.wait_for_files(handle, delay)
 
             if not self.START:
                 continue
 
-            text = self.try_read_file(self.path_orders)
+            delay.update(self.poll_open_orders())
 
-            if len(text.strip()) == 0 or text == self._last_open_orders_str:
-                continue
+    """Checks the file for open orders once and triggers the 
+    event_handler.on_order_event() function. 
 
-            self._last_open_orders_str = text
-            data = json.loads(text)
+    Returns True if new data was read. 
+    """
 
-            new_event = False
-            for order_id, order in self.open_orders.items():
-                # also triggers if a pending order got filled?
-                if order_id not in data['orders'].keys():
-                    new_event = True
-                    if self.verbose:
-                        print('Order removed: ', order)
+    def poll_open_orders(self):
 
-            for order_id, order in data['orders'].items():
-                if order_id not in self.open_orders:
-                    new_event = True
-                    if self.verbose:
-                        print('New order: ', order)
+        text = self.read_file_if_changed(self.path_orders)
 
-            self.account_info = data['account_info']
-            self.open_orders = data['orders']
+        if text is None:
+            return False
+
+        data = self.json_loads(text)
+
+        new_event = False
+        for order_id, order in self.open_orders.items():
+            # also triggers if a pending order got filled?
+            if order_id not in data['orders'].keys():
+                new_event = True
+                if self.verbose:
+                    print('Order removed: ', order)
+
+        new_tickets = []
+        for order_id, order in data['orders'].items():
+            if order_id not in self.open_orders:
+                new_event = True
+                new_tickets.append(order_id)
+                if self.verbose:
+                    print('New order: ', order)
+
+        if len(new_tickets) > 0:
+            self.command_latency.orders_seen(new_tickets)
+
+        self.account_info = data['account_info']
+        self.open_orders = data['orders']
+        self.orders_read_time = perf_counter()
+
+        if self.load_orders_from_file:
+            with open(self.path_orders_stored, 'w') as f:
+                f.write(json.dumps(data))
 
-            if self.load_orders_from_file:
-                with open(self.path_orders_stored, 'w') as f:
-                    f.write(json.dumps(data))
+        if self.event_handler is not None and new_event:
+            self.event_handler.on_order_event()
 
-            if self.event_handler is not None and new_event:
-                self.event_handler.on_order_event()
+        return True
 
-    """Regularly checks the file for messages and triggers
-    the event_handler.on_message() function.
+    """Regularly checks the file for messages in its own thread.
     """
 
     def check_messages(self):
 
+        handle = self.file_watcher.watch(self.path_messages)
+
+        delay = self.new_poll_delay()
+
         while self.ACTIVE:
 
-            sleep(self.sleep_delay)
+            self.wait_for_files(handle, delay)
 
             if not self.START:
                 continue
 
-            text = self.try_read_file(self.path_messages)
+            delay.update(self.poll_messages())
 
-            if len(text.strip()) == 0 or text == self._last_messages_str:
-                continue
+    """Checks the file for messages once and triggers the 
+    event_handler.on_message() function. 
 
-            self._last_messages_str = text
-            data = json.loads(text)
+    Returns True if new data was read. 
+    """
 
-            # use sorted() to make sure that we don't miss messages
-            # because of (int(millis) > self._last_messages_millis).
-            for millis, message in sorted(data.items()):
-                if int(millis) > self._last_messages_millis:
-                    self._last_messages_millis = int(millis)
-                    # print(message)
-                    if self.event_handler is not None:
-                        self.event_handler.on_message(message)
+    def poll_messages(self):
 
-            with open(self.path_messages_stored, 'w') as f:
-                f.write(json.dumps(data))
+        text = self.read_file_if_changed(self.path_messages)
+
+        if text is None:
+            return False
+
+        data = self.json_loads(text)
+
+        # use sorted() to make sure that we don't miss messages
+        # because of (int(millis) > self._last_messages_millis).
+        for millis, message in sorted(data.items()):
+            if int(millis) > self._last_messages_millis:
+                self._last_messages_millis = int(millis)
+                # print(message)
+                pending = self.command_acks.match(message)
+                if pending is not None:
+                    self.command_latency.command_answered(pending,
+                                                          ticket_of(message))
+                if self.event_handler is not None:
+                    self.event_handler.on_message(message)
 
-    """Regularly checks the file for market data and triggers
-    the event_handler.on_tick() function.
+        with open(self.path_messages_stored, 'w') as f:
+            f.write(json.dumps(data))
+
+        return True
+
+    """Regularly checks the file for market data in its own thread.
     """
 
     def check_market_data(self):
 
+        handle = self.file_watcher.watch(self.path_market_data)
+
+        delay = self.new_poll_delay()
+
         while self.ACTIVE:
 
-            sleep(self.sleep_delay)
+            self.wait_for_files(handle, delay)
 
             if not self.START:
                 continue
 
-            text = self.try_read_file(self.path_market_data)
+            changed = self.poll_market_data()
 
-            if len(text.strip()) == 0 or text == self._last_market_data_str:
-                continue
+            if self.spin_seconds > 0:
+                changed = self.spin(self.poll_market_data) or changed
+
+            delay.update(changed)
+
+    """Checks the file for market data once and triggers the 
+    event_handler.on_tick() function. 
+
+    Returns True if new data was read. 
+    """
+
+    def poll_market_data(self):
+
+        text = self.read_file_if_changed(self.path_market_data)
 
-            self._last_market_data_str = text
-            data = json.loads(text)
+        if text is None:
+            return False
 
-            self.market_data = data
+        data = self.json_loads(text)
 
-            if self.event_handler is not None:
-                for symbol in data.keys():
-                    if symbol not in self._last_market_data or self.market_data[symbol] != self._last_market_data[symbol]:
-                        self.event_handler.on_tick(symbol,
-                                                   self.market_data[symbol]['bid'],
-                                                   self.market_data[symbol]['ask'])
-            self._last_market_data = data
+        self.market_data = data
 
-    """Regularly checks the file for bar data and triggers
-    the event_handler.on_bar_data() function.
+        if self.event_handler is not None or self.tick_history is not None:
+            now = time()
+            for symbol, bid, ask in changed_quotes(data, self._last_quotes):
+                if self.tick_history is not None:
+                    self.tick_history.add(symbol, bid, ask, now)
+                if self.event_handler is not None:
+                    self.event_handler.on_tick(symbol, bid, ask)
+
+        return True
+
+    """Regularly checks the file for bar data in its own thread.
     """
 
     def check_bar_data(self):
 
+        handle = self.file_watcher.watch(self.path_bar_data)
+
+        delay = self.new_poll_delay()
+
         while self.ACTIVE:
 
-            sleep(self.sleep_delay)
+            self.wait_for_files(handle, delay)
 
             if not self.START:
                 continue
 
-            text = self.try_read_file(self.path_bar_data)
+            delay.update(self.poll_bar_data())
 
-            if len(text.strip()) == 0 or text == self._last_bar_data_str:
-                continue
+    """Checks the file for bar data once and triggers the 
+    event_handler.on_bar_data() function. 
+
+    Returns True if new data was read. 
+    """
 
-            self._last_bar_data_str = text
-            data = json.loads(text)
+    def poll_bar_data(self):
 
-            self.bar_data = data
+        text = self.read_file_if_changed(self.path_bar_data)
 
-            if self.event_handler is not None:
-                for st in data.keys():
-                    if st not in self._last_bar_data or self.bar_data[st] != self._last_bar_data[st]:
-                        symbol, time_frame = st.split('_')
-                        self.event_handler.on_bar_data(symbol,
-                                                       time_frame,
-                                                       self.bar_data[st]['time'],
-                                                       self.bar_data[st]['open'],
-                                                       self.bar_data[st]['high'],
-                                                       self.bar_data[st]['low'],
-                                                       self.bar_data[st]['close'],
-                                                       self.bar_data[st]['tick_volume'])
-            self._last_bar_data = data
+        if text is None:
+            return False
 
-    """Regularly checks the file for historic data and trades and triggers
-    the event_handler.on_historic_data() function.
+        data = self.json_loads(text)
+
+        self.bar_data = data
+
+        if self.event_handler is not None:
+            for st in data.keys():
+                if st not in self._last_bar_data or self.bar_data[st] != self._last_bar_data[st]:
+                    symbol, time_frame = st.split('_')
+                    self.event_handler.on_bar_data(symbol,
+                                                   time_frame,
+                                                   self.bar_data[st]['time'],
+                                                   self.bar_data[st]['open'],
+                                                   self.bar_data[st]['high'],
+                                                   self.bar_data[st]['low'],
+                                                   self.bar_data[st]['close'],
+                                                   self.bar_data[st]['tick_volume'])
+        self._last_bar_data = data
+
+        return True
+
+    """Regularly checks the files for historic data and trades in its own thread.
     """
 
     def check_historic_data(self):
 
+        handle = self.file_watcher.watch(self.path_historic_data,
+                                           self.path_historic_trades)
+
+        delay = self.new_poll_delay()
+
         while self.ACTIVE:
 
-            sleep(self.sleep_delay)
+            self.wait_for_files(handle, delay)
 
             if not self.START:
                 continue
 
-            text = self.try_read_file(self.path_historic_data)
+            delay.update(self.poll_historic_data())
+
+    """Checks the files for historic data and trades once and triggers the 
+    event_handler.on_historic_data() function. 
 
-            if len(text.strip()) > 0 and text != self._last_historic_data_str:
+    Returns True if new data was read. 
+    """
+
+    def poll_historic_data(self):
+
+        changed = False
+
+        text = self.read_file_if_changed(self.path_historic_data)
 
-                self._last_historic_data_str = text
+        if text is not None:
 
-                data = json.loads(text)
+            changed = True
 
-                for st in data.keys():
-                    self.historic_data[st] = data[st]
-                    if self.event_handler is not None:
-                        symbol, time_frame = st.split('_')
-                        self.event_handler.on_historic_data(
-                            symbol, time_frame, data[st])
+            data = self.json_loads(text)
 
-                self.try_remove_file(self.path_historic_data)
+            for st in data.keys():
+                self.historic_data[st] = data[st]
+                if self.event_handler is not None:
+                    symbol, time_frame = st.split('_')
+                    self.event_handler.on_historic_data(
+                        symbol, time_frame, data[st])
 
-            # also check historic trades in the same thread.
-            text = self.try_read_file(self.path_historic_trades)
+            self.try_remove_file(self.path_historic_data)
 
-            if len(text.strip()) > 0 and text != self._last_historic_trades_str:
+        # also check historic trades in the same call.
+        text = self.read_file_if_changed(self.path_historic_trades)
 
-                self._last_historic_trades_str = text
+        if text is not None:
 
-                data = json.loads(text)
+            changed = True
 
-                self.historic_trades = data
-                self.event_handler.on_historic_trades()
+            data = self.json_loads(text)
 
-                self.try_remove_file(self.path_historic_trades)
+            self.historic_trades = data
+            self.event_handler.on_historic_trades()
+
+            self.try_remove_file(self.path_historic_trades)
+
+        return changed
 
     """Loads stored orders from file (in case of a restart). 
     """
@@ -349,8 +682,9 @@ class dwx_client():
         text = self.try_read_file(self.path_orders_stored)
 
         if len(text) > 0:
-            self._last_open_orders_str = text
-            data = json.loads(text)
+            # only the hash is known, so the first check compares the text.
+            self._file_states[self.path_orders] = [None, None, hash(text), None]
+            data = self.json_loads(text)
             self.account_info = data['account_info']
             self.open_orders = data['orders']
 
@@ -363,9 +697,9 @@ class dwx_client():
 
         if len(text) > 0:
 
-            self._last_messages_str = text
+            self._file_states[self.path_messages] = [None, None, hash(text), None]
 
-            data = json.loads(text)
+            data = self.json_loads(text)
 
             # here we don't have to sort because we just need the latest millis value.
             for millis in data.keys():
@@ -388,7 +722,7 @@ class dwx_client():
 
     def subscribe_symbols(self, symbols):
 
-        self.send_command('SUBSCRIBE_SYMBOLS', ','.join(symbols))
+        return self.submit_command('SUBSCRIBE_SYMBOLS', ','.join(symbols))
 
     """Sends a SUBSCRIBE_SYMBOLS_BAR_DATA command to subscribe to bar data.
 
@@ -409,8 +743,8 @@ class dwx_client():
     def subscribe_symbols_bar_data(self, symbols=[['EURUSD', 'M1']]):
 
         data = [f'{st[0]},{st[1]}' for st in symbols]
-        self.send_command('SUBSCRIBE_SYMBOLS_BAR_DATA',
-                          ','.join(str(p) for p in data))
+        return self.submit_command('SUBSCRIBE_SYMBOLS_BAR_DATA',
+                                   ','.join(str(p) for p in data))
 
     """Sends a GET_HISTORIC_DATA command to request historic data. 
     
@@ -439,7 +773,7 @@ class dwx_client():
         data = [symbol, time_frame,
                 int(start),
                 int(end)]
-        self.send_command('GET_HISTORIC_DATA', ','.join(str(p) for p in data))
+        return self.submit_command('GET_HISTORIC_DATA', ','.join(str(p) for p in data))
 
     """Sends a GET_HISTORIC_TRADES command to request historic trades.
     
@@ -457,7 +791,7 @@ class dwx_client():
     def get_historic_trades(self,
                             lookback_days=30):
 
-        self.send_command('GET_HISTORIC_TRADES', str(lookback_days))
+        return self.submit_command('GET_HISTORIC_TRADES', str(lookback_days))
 
     """Sends an OPEN_ORDER command to open an order.
 
@@ -491,7 +825,7 @@ class dwx_client():
 
         data = [symbol, order_type, lots, price, stop_loss,
                 take_profit, magic, comment, expiration]
-        self.send_command('OPEN_ORDER', ','.join(str(p) for p in data))
+        return self.submit_command('OPEN_ORDER', ','.join(str(p) for p in data))
 
     """Sends a MODIFY_ORDER command to modify an order.
 
@@ -515,7 +849,7 @@ class dwx_client():
                      expiration=0):
 
         data = [ticket, price, stop_loss, take_profit, expiration]
-        self.send_command('MODIFY_ORDER', ','.join(str(p) for p in data))
+        return self.submit_command('MODIFY_ORDER', ','.join(str(p) for p in data))
 
     """Sends a CLOSE_ORDER command to close an order.
 
@@ -532,14 +866,14 @@ class dwx_client():
     def close_order(self, ticket, lots=0):
 
         data = [ticket, lots]
-        self.send_command('CLOSE_ORDER', ','.join(str(p) for p in data))
+        return self.submit_command('CLOSE_ORDER', ','.join(str(p) for p in data))
 
     """Sends a CLOSE_ALL_ORDERS command to close all orders.
     """
 
     def close_all_orders(self):
 
-        self.send_command('CLOSE_ALL_ORDERS', '')
+        return self.submit_command('CLOSE_ALL_ORDERS', '')
 
     """Sends a CLOSE_ORDERS_BY_SYMBOL command to close all orders
     with a given symbol.
@@ -551,7 +885,7 @@ class dwx_client():
 
     def close_orders_by_symbol(self, symbol):
 
-        self.send_command('CLOSE_ORDERS_BY_SYMBOL', symbol)
+        return self.submit_command('CLOSE_ORDERS_BY_SYMBOL', symbol)
 
     """Sends a CLOSE_ORDERS_BY_MAGIC command to close all orders
     with a given magic number.
@@ -564,7 +898,154 @@ class dwx_client():
 
     def close_orders_by_magic(self, magic):
 
-        self.send_command('CLOSE_ORDERS_BY_MAGIC', magic)
+        return self.submit_command('CLOSE_ORDERS_BY_MAGIC', magic)
+
+    """Opens several orders in one pass. 
+
+    All commands are queued at once and written to the free command 
+    files in order. 
+
+    Args:
+        orders (list[dict]): Keyword arguments of open_order() for 
+            each order, for example {'symbol': 'EURUSD', 'lots': 0.01}. 
+
+    Kwargs:
+        timeout (float): Seconds to wait for the answers and for the 
+            orders to show up in DWX_Orders.txt. 
+
+    Returns:
+        list[dict]: One result per order, see wait_for_batch(). 
+    """
+
+    def open_orders_batch(self, orders, timeout=10):
+
+        futures = [self.send_command_async('OPEN_ORDER',
+                                           self.order_command_content(self.open_order, order))
+                   for order in orders]
+        return self.wait_for_batch('OPEN_ORDER', futures,
+                                   [None] * len(orders), timeout)
+
+    """Modifies several orders in one pass. 
+
+    Args:
+        orders (list[dict]): Keyword arguments of modify_order() for 
+            each order, including the ticket. 
+
+    Kwargs:
+        timeout (float): Seconds to wait for the answers and the 
+            updated DWX_Orders.txt. 
+
+    Returns:
+        list[dict]: One result per order, see wait_for_batch(). 
+    """
+
+    def modify_orders_batch(self, orders, timeout=10):
+
+        futures = [self.send_command_async('MODIFY_ORDER',
+                                           self.order_command_content(self.modify_order, order))
+                   for order in orders]
+        return self.wait_for_batch('MODIFY_ORDER', futures,
+                                   [order['ticket'] for order in orders], timeout)
+
+    """Closes several orders in one pass. 
+
+    Args:
+        orders (list): Tickets, or keyword arguments of close_order() 
+            for each order, for example {'ticket': 123, 'lots': 0.01}. 
+
+    Kwargs:
+        timeout (float): Seconds to wait for the answers and for the 
+            orders to disappear from DWX_Orders.txt. 
+
+    Returns:
+        list[dict]: One result per order, see wait_for_batch(). 
+    """
+
+    def close_orders_batch(self, orders, timeout=10):
+
+        orders = [order if isinstance(order, dict) else {'ticket': order}
+                  for order in orders]
+        futures = [self.send_command_async('CLOSE_ORDER',
+                                           self.order_command_content(self.close_order, order))
+                   for order in orders]
+        return self.wait_for_batch('CLOSE_ORDER', futures,
+                                   [order['ticket'] for order in orders], timeout)
+
+    """Builds the command content from keyword arguments of one of the 
+    order functions. The parameters of these functions are in the 
+    same order as the fields of their commands. 
+    """
+
+    def order_command_content(self, function, kwargs):
+
+        arguments = signature(function).bind(**kwargs)
+        arguments.apply_defaults()
+        return ','.join(str(p) for p in arguments.arguments.values())
+
+    """Waits for the answers of a batch and matches them with the 
+    changes in DWX_Orders.txt. 
+
+    Returns:
+        list[dict]: One dict per command with: 
+            'ticket': Ticket of the order (read from the answer for 
+                new orders). 
+            'message': INFO or ERROR message, None if there was no 
+                answer within the timeout. 
+            'confirmed': True if DWX_Orders.txt shows the change: new 
+                orders appeared, closed orders disappeared and for 
+                modified orders the file was read again after the answer. 
+            'order': The order from DWX_Orders.txt or None. 
+    """
+
+    def wait_for_batch(self, command, futures, tickets, timeout):
+
+        end_time = perf_counter() + timeout
+
+        results = []
+        answer_times = []
+        for future, ticket in zip(futures, tickets):
+            message = None
+            try:
+                message = future.result(max(0, end_time - perf_counter()))
+            except (TimeoutError, FutureTimeoutError, CancelledError):
+                pass
+            results.append(batch_result(ticket, message))
+            answer_times.append(perf_counter())
+
+        while not self.confirm_batch(command, results, answer_times):
+            if perf_counter() > end_time:
+                break
+            sleep(self.sleep_delay)
+
+        for result in results:
+            if result['ticket'] is not None:
+                result['order'] = self.open_orders.get(result['ticket'])
+
+        return results
+
+    """Checks DWX_Orders.txt for the changes of a batch and sets 
+    'confirmed' in the results, see wait_for_batch(). 
+
+    Returns True if all answered commands are confirmed. 
+    """
+
+    def confirm_batch(self, command, results, answer_times):
+
+        done = True
+        for result, answer_time in zip(results, answer_times):
+            if result['confirmed']:
+                continue
+            message = result['message']
+            if message is None or message['type'] != 'INFO' or result['ticket'] is None:
+                continue
+            if command == 'OPEN_ORDER':
+                result['confirmed'] = result['ticket'] in self.open_orders
+            elif command == 'CLOSE_ORDER':
+                result['confirmed'] = result['ticket'] not in self.open_orders
+            else:
+                result['confirmed'] = self.orders_read_time > answer_time
+            done = done and result['confirmed']
+        return done
 
     """Sends a RESET_COMMAND_IDS command to reset stored command IDs. 
     This should be used when restarting the python side without restarting 
@@ -586,10 +1067,17 @@ class dwx_client():
 
     Multiple command files are used to allow for fast execution 
     of multiple commands in the correct chronological order. 
+
+    Kwargs:
+        future (Future): Future that is resolved with the INFO or ERROR 
+            message of the mql side, see send_command_async(). 
+
+    Returns:
+        bool: True if the command was written to a command file. 
     
     """
 
-    def send_command(self, command, content):
+    def send_command(self, command, content, future=None):
 
         # Acquire lock so that different threads do not use the same 
         # command_id or write at the same time.
@@ -597,31 +1085,161 @@ class dwx_client():
 
         self.command_id = (self.command_id + 1) % 100000
 
+        # register before writing so that a fast answer is not missed.
+        pending = None
+        if self.command_acks.expects_ack(command):
+            pending = self.command_acks.add(self.command_id, command,
+                                            content, future)
+
+        success = self.write_command_file(command, content)
+
+        if success and pending is not None:
+            pending.written_time = perf_counter()
+
+        # release lock again
+        self.lock.release()
+
+        if not success and pending is not None:
+            self.command_acks.discard(pending)
+
+        if future is not None:
+            if not success:
+                future.set_exception(TimeoutError(
+                    f'Could not write command {command}, all command files are in use.'))
+            elif pending is None:
+                future.set_result(None)
+
+        return success
+
+    """Writes the command with the current command_id to the next 
+    free command file. Must be called while holding self.lock. 
+    """
+
+    def write_command_file(self, command, content):
+
         end_time = datetime.now(timezone.utc) + timedelta(seconds=self.max_retry_command_seconds)
         now = datetime.now(timezone.utc)
 
         # trying again for X seconds in case all files exist or are 
         # currently read from mql side.
         while now < end_time:
-            # using 10 different files to increase the execution speed 
-            # for muliple commands.
-            success = False
-            for i in range(self.num_command_files):
-                # only send commend if the file does not exists so that we 
-                # do not overwrite all commands.
-                file_path = f'{self.path_commands_prefix}{i}.txt'
-                if not exists(file_path):
-                    try:
-                        with open(file_path, 'w') as f:
-                            f.write(f'<:{self.command_id}|{command}|{content}:>')
-                        success = True
-                        break
-                    except:
-                        print_exc()
-            if success:
-                break
-            sleep(self.sleep_delay)
+            # command_slots knows which files were not read yet, so only 
+            # the chosen file is checked.
+            i = self.command_slots.acquire()
+            if i is None:
+                sleep(self.sleep_delay)
+                now = datetime.now(timezone.utc)
+                continue
+            # only send commend if the file does not exists so that we 
+            # do not overwrite all commands.
+            file_path = f'{self.path_commands_prefix}{i}.txt'
+            if not exists(file_path):
+                try:
+                    with open(file_path, 'w') as f:
+                        f.write(f'<:{self.command_id}|{command}|{content}:>')
+                    return True
+                except:
+                    print_exc()
             now = datetime.now(timezone.utc)
-        
-        # release lock again
-        self.lock.release()
+
+        return False
+
+    """Returns how many commands are waiting. 
+
+    Returns:
+        dict: 'command_files' is the number of command files that were 
+        not read by the mql side yet, 'queued' the number of commands 
+        from send_command_async() that were not written yet and 
+        'pending_acks' the number of commands waiting for an answer. 
+        'coalesced' and 'prioritized' count the merged MODIFY_ORDER 
+        commands and the close commands that skipped the queue, 
+        'superseded' the MODIFY_ORDER commands dropped by a close. 
+    """
+
+    def command_backlog(self):
+
+        # without inotify, removed files are only noticed by a scan.
+        if not self.command_slots.track_removals:
+            self.command_slots.scan()
+
+        return {'command_files': self.command_slots.num_used(),
+                'queued': self._command_queue.qsize(),
+                'pending_acks': self.command_acks.num_pending(),
+                'coalesced': self._command_queue.num_coalesced,
+                'prioritized': self._command_queue.num_prioritized,
+                'superseded': self._command_queue.num_superseded}
+
+    """Returns the round-trip latency of the commands in milliseconds, 
+    from writing the command file to reading the answer, per command 
+    type. 'OPEN_ORDER:orders' is the time until a new order shows up 
+    in DWX_Orders.txt. See command_latency.get_stats(). 
+    """
+
+    def get_command_latency(self):
+
+        return self.command_latency.get_stats()
+
+    """Queues a command and returns immediately. 
+
+    A single writer thread writes the queued commands to the command 
+    files in the order they were queued. Commands that close orders 
+    are written before the other queued commands, and queued 
+    MODIFY_ORDER commands for the same ticket are merged so that only 
+    the newest one is sent, and dropped when the ticket is closed 
+    (see command_queue). 
+
+    Returns:
+        concurrent.futures.Future: Resolves with the INFO or ERROR 
+        message of the mql side (a dict). For commands that are not 
+        answered with a message (see command_ack.ACK_RULES) it 
+        resolves with None as soon as the command was written. If 
+        there is no answer within command_ack_timeout seconds, it 
+        raises a TimeoutError. A MODIFY_ORDER that was dropped because 
+        its ticket is closed is cancelled. 
+    """
+
+    def send_command_async(self, command, content):
+
+        future = Future()
+        self._command_queue.put(command, content, future)
+
+        if self.command_writer_thread is None:
+            with self._command_writer_lock:
+                if self.command_writer_thread is None:
+                    self.command_writer_thread = Thread(
+                        target=self.write_queued_commands, args=())
+                    self.command_writer_thread.daemon = True
+                    self.command_writer_thread.start()
+
+        return future
+
+    """Sends the command with send_command_async() if async_commands 
+    is set, otherwise with send_command(). 
+    """
+
+    def submit_command(self, command, content):
+
+        if self.async_commands:
+            return self.send_command_async(command, content)
+
+        return self.send_command(command, content)
+
+    """Writes the commands queued by send_command_async(). 
+    """
+
+    def write_queued_commands(self):
+
+        while self.ACTIVE:
+
+            try:
+                command, content, future = self._command_queue.get(timeout=0.1)
+            except Empty:
+                self.command_acks.expire()
+                continue
+
+            try:
+                self.send_command(command, content, future)
+            except Exception as e:
+                print_exc()
+                if not future.done():
+                    future.set_exception(e)
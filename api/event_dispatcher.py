@@ -0,0 +1,283 @@
+from time import perf_counter
+from threading import Thread, Condition, Lock
+from collections import deque
+from traceback import print_exc
+
+
+"""Event dispatcher
+
+Calls the functions of an event_handler on worker threads, so that a
+slow handler does not delay the polling of the DWX files. It is passed
+to dwx_client instead of the event_handler:
+
+    dwx = dwx_client(event_dispatcher(processor), MT4_files_dir)
+
+The polling threads only put the events into a bounded queue. What
+happens if the queue is full for an event type is set per type:
+
+    'conflate': Only the latest event per key is kept (the symbol for
+        ticks, symbol and time frame for bars). A newer event replaces
+        the queued one at its position in the queue. If the queue is
+        full with other keys, the oldest event is dropped.
+    'drop_oldest': The oldest queued event of this type is dropped.
+    'block': The polling thread waits until there is space in the
+        queue. This keeps all events, but a slow handler delays the
+        polling of this file again (and of all files if a
+        poll_scheduler is used).
+
+With several workers, the events are distributed by their key, so the
+events of one symbol are still handled in order by the same worker.
+Events without a key (messages, order events) go to the first worker.
+on_bar_update() (the current bar of a bar_aggregator) is only queued if
+the event_handler has it.
+The handler functions have to be thread safe if num_workers > 1.
+
+Kwargs:
+    num_workers (int): Number of worker threads.
+    max_queue_size (int): Queued events per event type and worker.
+    policies (dict): Event type -> policy, updates DEFAULT_POLICIES.
+
+"""
+
+
+# event types are the names of the event_handler functions without 'on_'.
+DEFAULT_POLICIES = {
+    'tick': 'conflate',
+    'bar_data': 'block',
+    'bar_update': 'conflate',
+    'historic_data': 'block',
+    'historic_trades': 'conflate',
+    'message': 'block',
+    'order_event': 'conflate',
+}
+
+POLICIES = {'conflate', 'drop_oldest', 'block'}
+
+
+"""Queue of one worker. Each event type has its own bounded lane, so
+the policy of one type never drops the events of another type. The
+events are returned in the order they were added over all lanes.
+"""
+
+
+class event_queue():
+
+    def __init__(self, max_size):
+
+        self.max_size = max_size
+
+        # event_type -> deque of (sequence number, key) of the queued events.
+        self._lanes = {}
+        # (event_type, key) -> args of the queued event.
+        self._events = {}
+        self._sequence = 0
+        self._condition = Condition()
+        self.closed = False
+
+    """Adds an event. Returns 'queued', 'conflated' or 'dropped' if an
+    older event of the same type was dropped to make space.
+    """
+
+    def put(self, event_type, key, args, policy):
+
+        result = 'queued'
+
+        with self._condition:
+
+            if policy == 'conflate' and (event_type, key) in self._events:
+                self._events[(event_type, key)] = args
+                return 'conflated'
+
+            lane = self._lanes.setdefault(event_type, deque())
+
+            if policy == 'block':
+                while len(lane) >= self.max_size and not self.closed:
+                    self._condition.wait()
+            if len(lane) >= self.max_size:
+                _, dropped = lane.popleft()
+                self._events.pop((event_type, dropped), None)
+                result = 'dropped'
+
+            # events that are not conflated get a unique key.
+            if policy != 'conflate':
+                key = object()
+
+            self._sequence += 1
+            lane.append((self._sequence, key))
+            self._events[(event_type, key)] = args
+            self._condition.notify_all()
+
+        return result
+
+    """Returns the next (event_type, args), or None after the timeout.
+    """
+
+    def get(self, timeout=None):
+
+        with self._condition:
+
+            if len(self._events) == 0:
+                self._condition.wait(timeout)
+
+            if len(self._events) == 0:
+                return None
+
+            event_type = min((lane[0][0], event_type)
+                             for event_type, lane in self._lanes.items()
+                             if len(lane) > 0)[1]
+            _, key = self._lanes[event_type].popleft()
+            args = self._events.pop((event_type, key))
+            self._condition.notify_all()
+
+        return event_type, args
+
+    def qsize(self):
+
+        with self._condition:
+            return len(self._events)
+
+    """Wakes up blocked put() calls. They do not wait anymore.
+    """
+
+    def close(self):
+
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class event_dispatcher():
+
+    def __init__(self, event_handler, num_workers=1, max_queue_size=10000,
+                 policies=None):
+
+        self.event_handler = event_handler
+        self.policies = dict(DEFAULT_POLICIES)
+        if policies is not None:
+            self.policies.update(policies)
+
+        for event_type, policy in self.policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f'Unknown policy {policy} for {event_type}.')
+
+        self.ACTIVE = True
+
+        self._queues = [event_queue(max_queue_size) for _ in range(num_workers)]
+        self._stats = {event_type: {'queued': 0, 'conflated': 0, 'dropped': 0,
+                                    'dispatched': 0, 'errors': 0,
+                                    'handler_seconds': 0.}
+                       for event_type in self.policies}
+        self._stats_lock = Lock()
+
+        self.workers = []
+        for queue in self._queues:
+            worker = Thread(target=self.run_worker, args=(queue,))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def on_tick(self, symbol, bid, ask):
+
+        self.dispatch('tick', symbol, (symbol, bid, ask))
+
+    def on_bar_data(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        self.dispatch('bar_data', (symbol, time_frame),
+                      (symbol, time_frame, time, open_price, high, low, close_price, tick_volume))
+
+    def on_bar_update(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        if hasattr(self.event_handler, 'on_bar_update'):
+            self.dispatch('bar_update', (symbol, time_frame),
+                          (symbol, time_frame, time, open_price, high, low, close_price, tick_volume))
+
+    def on_historic_data(self, symbol, time_frame, data):
+
+        self.dispatch('historic_data', (symbol, time_frame),
+                      (symbol, time_frame, data))
+
+    def on_historic_trades(self):
+
+        self.dispatch('historic_trades', None, ())
+
+    def on_message(self, message):
+
+        self.dispatch('message', None, (message,))
+
+    def on_order_event(self):
+
+        self.dispatch('order_event', None, ())
+
+    """Puts an event into the queue of the worker for its key.
+    """
+
+    def dispatch(self, event_type, key, args):
+
+        if key is None:
+            queue = self._queues[0]
+        else:
+            queue = self._queues[hash(key) % len(self._queues)]
+
+        result = queue.put(event_type, key, args, self.policies[event_type])
+
+        # only the polling thread of this event type writes these counters.
+        stats = self._stats[event_type]
+        if result == 'conflated':
+            stats['conflated'] += 1
+        else:
+            stats['queued'] += 1
+            if result == 'dropped':
+                stats['dropped'] += 1
+
+    """Calls the event_handler for the events of one queue.
+    """
+
+    def run_worker(self, queue):
+
+        while self.ACTIVE:
+
+            event = queue.get(timeout=0.1)
+            if event is None:
+                continue
+
+            event_type, args = event
+            stats = self._stats[event_type]
+
+            start_time = perf_counter()
+            error = False
+            try:
+                getattr(self.event_handler, 'on_' + event_type)(*args)
+            except:
+                print_exc()
+                error = True
+
+            with self._stats_lock:
+                stats['handler_seconds'] += perf_counter() - start_time
+                stats['dispatched'] += 1
+                stats['errors'] += error
+
+    """Returns the counters per event type and the number of queued
+    events.
+
+    Returns:
+        dict: 'queue_size' and one dict per event type with 'queued',
+            'conflated', 'dropped', 'dispatched', 'errors' and
+            'handler_seconds'.
+    """
+
+    def get_stats(self):
+
+        with self._stats_lock:
+            stats = {event_type: dict(values) for event_type, values in self._stats.items()}
+        stats['queue_size'] = sum(queue.qsize() for queue in self._queues)
+        return stats
+
+    """Stops the workers. Queued events are not handled anymore.
+    """
+
+    def stop(self):
+
+        self.ACTIVE = False
+
+        for queue in self._queues:
+            queue.close()
@@ -0,0 +1,56 @@
+"""Event stage
+
+Base class for event handlers that sit between dwx_client and another
+event_handler, for example tick_recorder or bar_aggregator. By default
+every event is passed on unchanged. Subclasses override the functions of
+the events they use and call the function of the base class to pass the
+event on. on_bar_update() is only passed on to handlers that have it.
+
+Args:
+    event_handler: Gets the events that are passed on, can be None.
+
+"""
+
+
+class event_stage():
+
+    def __init__(self, event_handler=None):
+
+        self.event_handler = event_handler
+
+    def on_tick(self, symbol, bid, ask):
+
+        if self.event_handler is not None:
+            self.event_handler.on_tick(symbol, bid, ask)
+
+    def on_bar_data(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        if self.event_handler is not None:
+            self.event_handler.on_bar_data(symbol, time_frame, time, open_price,
+                                           high, low, close_price, tick_volume)
+
+    def on_bar_update(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        on_bar_update = getattr(self.event_handler, 'on_bar_update', None)
+        if on_bar_update is not None:
+            on_bar_update(symbol, time_frame, time, open_price, high, low, close_price, tick_volume)
+
+    def on_historic_data(self, symbol, time_frame, data):
+
+        if self.event_handler is not None:
+            self.event_handler.on_historic_data(symbol, time_frame, data)
+
+    def on_historic_trades(self):
+
+        if self.event_handler is not None:
+            self.event_handler.on_historic_trades()
+
+    def on_message(self, message):
+
+        if self.event_handler is not None:
+            self.event_handler.on_message(message)
+
+    def on_order_event(self):
+
+        if self.event_handler is not None:
+            self.event_handler.on_order_event()
@@ -0,0 +1,211 @@
+import os
+import sys
+import select
+import struct
+import ctypes
+import ctypes.util
+from time import sleep
+from threading import Thread, Event, Lock
+from os.path import basename
+from traceback import print_exc
+
+
+"""File watchers
+
+The dwx_client threads use a file watcher to wait until one of the DWX
+files has been written by the mql side.
+
+polling_watcher just sleeps for the given delay (the original behaviour).
+inotify_watcher blocks until the kernel reports that the file was written,
+so the latency does not depend on the polling interval anymore and idle
+threads do not use any CPU. It only works on Linux (this includes MT4
+running under Wine).
+
+"""
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# the mql side closes the file after each write, so IN_MODIFY is not needed.
+# it would also wake us up while the file is only partially written.
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+"""Watcher that just sleeps. Used if inotify is not available.
+"""
+
+
+class polling_watcher():
+
+    def watch(self, *file_paths):
+        return file_paths
+
+    def wait(self, handle, delay):
+        sleep(delay)
+
+    def add_callback(self, callback):
+        pass
+
+    def stop(self):
+        pass
+
+
+"""Watcher based on Linux inotify.
+
+One thread reads the inotify events for the DWX directory and sets the
+events of all handles that watch the changed file.
+
+Args:
+    directory (str): Directory that contains the DWX files.
+
+Kwargs:
+    timeout (float): Maximum time wait() will block even if no event
+        was received. This is only a safety net, for example if the
+        files are on a network drive that does not support inotify.
+
+"""
+
+
+class inotify_watcher():
+
+    def __init__(self, directory, timeout=0.5):
+
+        self.directory = directory
+        self.timeout = timeout
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                 use_errno=True)
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        wd = self._libc.inotify_add_watch(self._fd,
+                                          os.fsencode(directory),
+                                          WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), directory)
+
+        self._handles = {}
+        self._callbacks = []
+        self._lock = Lock()
+
+        self.ACTIVE = True
+
+        self._thread = Thread(target=self._read_events, args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    """Returns a handle that can be passed to wait(). The handle is
+    triggered if any of the given files is written, moved or removed.
+
+    The handle starts triggered so that the first wait() returns
+    immediately and files that already exist are read once.
+    """
+
+    def watch(self, *file_paths):
+
+        handle = Event()
+        handle.set()
+
+        with self._lock:
+            for file_path in file_paths:
+                self._handles.setdefault(basename(file_path), []).append(handle)
+
+        return handle
+
+    """Blocks until one of the watched files changed.
+
+    The delay is the polling interval of the caller and is ignored
+    here, only self.timeout limits the waiting time.
+    """
+
+    def wait(self, handle, delay):
+
+        handle.wait(self.timeout)
+        # clear before the caller reads the file. a write after this
+        # point sets the handle again and will not be missed.
+        handle.clear()
+
+    """Registers a function that is called with (file_name, mask)
+    for every event in the directory.
+    """
+
+    def add_callback(self, callback):
+
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def stop(self):
+
+        self.ACTIVE = False
+
+    def _read_events(self):
+
+        while self.ACTIVE:
+
+            try:
+                readable, _, _ = select.select([self._fd], [], [], self.timeout)
+                if not readable:
+                    continue
+                buffer = os.read(self._fd, 65536)
+            except BlockingIOError:
+                continue
+            except:
+                print_exc()
+                sleep(self.timeout)
+                continue
+
+            names = []
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buffer):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = buffer[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name:
+                    names.append((os.fsdecode(name), mask))
+
+            with self._lock:
+                callbacks = list(self._callbacks)
+                for name, _ in names:
+                    for handle in self._handles.get(name, []):
+                        handle.set()
+
+            for name, mask in names:
+                for callback in callbacks:
+                    try:
+                        callback(name, mask)
+                    except:
+                        print_exc()
+
+        os.close(self._fd)
+
+
+"""Creates the best available watcher for a directory.
+
+Falls back to the polling_watcher if inotify is not available or
+could not be initialized (for example if the directory does not exist yet).
+"""
+
+
+def create_file_watcher(directory, use_inotify=True, verbose=True):
+
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return inotify_watcher(directory)
+        except (OSError, AttributeError) as e:
+            if verbose:
+                print(f'Could not start inotify watcher, using polling: {e}')
+
+    return polling_watcher()
@@ -0,0 +1,238 @@
+import heapq
+from time import perf_counter
+from threading import Thread, Condition
+from traceback import print_exc
+
+
+"""Poll scheduler
+
+One thread that polls the DWX files of one or more dwx_client instances.
+This replaces the five threads per client. Every file has its own
+polling interval, and if several files are due at the same time, they
+are checked in order of their priority (market data first).
+
+Example:
+
+    scheduler = poll_scheduler()
+    dwx_1 = dwx_client(processor_1, MT4_dir_1, scheduler=scheduler)
+    dwx_2 = dwx_client(processor_2, MT4_dir_2, scheduler=scheduler,
+                       poll_intervals={'market_data': 0.002})
+
+"""
+
+
+# polling interval in seconds per file.
+DEFAULT_POLL_INTERVALS = {
+    'market_data': 0.001,
+    'bar_data': 0.005,
+    'messages': 0.005,
+    'open_orders': 0.01,
+    'historic_data': 0.25,
+}
+
+# dwx_client attribute with the path of each file.
+POLL_PATHS = {
+    'market_data': 'path_market_data',
+    'bar_data': 'path_bar_data',
+    'messages': 'path_messages',
+    'open_orders': 'path_orders',
+    'historic_data': 'path_historic_data',
+}
+
+# lower priorities are checked first if several files are due.
+POLL_PRIORITIES = {
+    'market_data': 0,
+    'bar_data': 1,
+    'messages': 2,
+    'open_orders': 3,
+    'historic_data': 4,
+}
+
+
+"""Polling interval that backs off while a file does not change.
+
+The delay stays at min_delay while changes are seen. If there was no
+change for backoff_after seconds, the delay is multiplied by factor
+after each unchanged check until it reaches max_delay. The first change
+sets it back to min_delay.
+
+Args:
+    min_delay (float): Fastest polling interval in seconds.
+    max_delay (float): Slowest polling interval in seconds. If it is
+        equal to min_delay the interval is fixed.
+
+"""
+
+
+class adaptive_delay():
+
+    def __init__(self, min_delay, max_delay, backoff_after=1., factor=2.):
+
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.backoff_after = backoff_after
+        self.factor = factor
+
+        self.delay = min_delay
+        self._last_change = perf_counter()
+
+    """Updates the delay after a check and returns the new delay.
+    """
+
+    def update(self, changed):
+
+        if changed:
+            self.delay = self.min_delay
+            self._last_change = perf_counter()
+        elif (self.delay < self.max_delay
+              and perf_counter() - self._last_change > self.backoff_after):
+            self.delay = min(self.delay * self.factor, self.max_delay)
+
+        return self.delay
+
+
+class poll_task():
+
+    def __init__(self, client, name, interval):
+
+        self.client = client
+        self.name = name
+        self.interval = interval
+        self.delay = client.new_poll_delay(interval)
+        self.priority = POLL_PRIORITIES[name]
+        self.file_path = getattr(client, POLL_PATHS[name])
+        self.poll = getattr(client, f'poll_{name}')
+
+        self.wakeups = 0
+        self.useful_reads = 0
+        self.errors = 0
+        self.busy_seconds = 0.
+
+
+class poll_scheduler():
+
+    def __init__(self, verbose=True):
+
+        self.verbose = verbose
+
+        self._heap = []
+        self._sequence = 0
+        self._tasks = []
+        self._condition = Condition()
+
+        self.ACTIVE = True
+
+        self.thread = Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    """Registers all DWX files of a client.
+
+    Args:
+        client (dwx_client): The client whose files should be polled.
+
+    Kwargs:
+        intervals (dict): Polling intervals in seconds that override
+            DEFAULT_POLL_INTERVALS, for example {'historic_data': 1}.
+
+    """
+
+    def add_client(self, client, intervals=None):
+
+        intervals = {**DEFAULT_POLL_INTERVALS, **(intervals or {})}
+
+        with self._condition:
+            now = perf_counter()
+            for name in DEFAULT_POLL_INTERVALS.keys():
+                task = poll_task(client, name, intervals[name])
+                self._tasks.append(task)
+                self._push(task, now)
+            self._condition.notify()
+
+    """Returns the statistics per file as a dictionary keyed by
+    file path.
+    """
+
+    def get_stats(self):
+
+        stats = {}
+        with self._condition:
+            tasks = list(self._tasks)
+        for task in tasks:
+            stats[task.file_path] = {
+                'file': task.name,
+                'interval': task.interval,
+                'current_delay': task.delay.delay,
+                'wakeups': task.wakeups,
+                'useful_reads': task.useful_reads,
+                'errors': task.errors,
+                'busy_seconds': task.busy_seconds
+            }
+        return stats
+
+    def stop(self):
+
+        with self._condition:
+            self.ACTIVE = False
+            self._condition.notify()
+
+    def _push(self, task, due):
+
+        self._sequence += 1
+        heapq.heappush(self._heap, (due, task.priority, self._sequence, task))
+
+    """Scheduler loop. Waits until the next file is due, then checks all
+    due files ordered by priority.
+    """
+
+    def run(self):
+
+        while self.ACTIVE:
+
+            with self._condition:
+
+                if len(self._heap) == 0:
+                    self._condition.wait(0.1)
+                    continue
+
+                delay = self._heap[0][0] - perf_counter()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                now = perf_counter()
+                due = []
+                while len(self._heap) > 0 and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[3])
+
+            due.sort(key=lambda task: task.priority)
+
+            for task in due:
+                self._run_task(task)
+
+            with self._condition:
+                now = perf_counter()
+                for task in due:
+                    if task.client.ACTIVE:
+                        self._push(task, now + task.delay.delay)
+                    else:
+                        self._tasks.remove(task)
+
+    def _run_task(self, task):
+
+        if not task.client.START:
+            return
+
+        task.wakeups += 1
+        start = perf_counter()
+        changed = False
+        try:
+            changed = task.poll()
+            if changed:
+                task.useful_reads += 1
+        except:
+            task.errors += 1
+            if self.verbose:
+                print_exc()
+        task.busy_seconds += perf_counter() - start
+        task.delay.update(changed)
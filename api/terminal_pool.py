@@ -0,0 +1,459 @@
+import os
+import pickle
+import multiprocessing
+from time import time, perf_counter
+from queue import Empty
+from threading import Thread, Lock
+from collections import deque
+from concurrent.futures import Future
+from traceback import print_exc, format_exc
+
+from .dwx_client import dwx_client
+from .command_latency import percentile
+
+
+"""Terminal pool
+
+Runs the dwx_clients of several MT4 terminals in worker processes, so
+that the polling and JSON decoding of many terminals is not limited by
+the GIL of one process. The terminals are distributed over the
+processes, each process runs one dwx_client per terminal.
+
+The events of all terminals are merged into one stream in the main
+process. The functions of the event_handler get the terminal id as
+first argument:
+
+    on_tick(terminal_id, symbol, bid, ask)
+    on_bar_data(terminal_id, symbol, time_frame, time, open_price, high,
+                low, close_price, tick_volume)
+    on_historic_data(terminal_id, symbol, time_frame, data)
+    on_historic_trades(terminal_id, historic_trades)
+    on_message(terminal_id, message)
+    on_order_event(terminal_id, open_orders)
+
+Functions the handler does not have are skipped. The handler is called
+from one thread of the main process, an event_dispatcher style queue
+can be put in front of it if it is slow.
+
+Functions of the clients are called with call(), which returns a
+Future with the return value:
+
+    pool = terminal_pool(handler, {'demo': demo_dir, 'live': live_dir})
+    pool.start()
+    pool.call_all('subscribe_symbols', ['EURUSD', 'GBPUSD'])
+    pool.call('demo', 'open_order', 'EURUSD', 'buy', 0.01).result()
+
+Args:
+    event_handler: Gets the events of all terminals, can be None.
+    terminals: List of metatrader_dir_path values (the ids are '0',
+        '1', ...) or dict of terminal id -> metatrader_dir_path.
+
+Kwargs:
+    num_processes (int): Worker processes, by default one per terminal
+        up to the number of CPUs.
+    client_kwargs (dict): Arguments for each dwx_client, they have to
+        be picklable. With async_commands the worker waits for the
+        Future of a command and sends its result.
+    flush_interval (float): Seconds the worker processes collect events
+        before they send them as one batch.
+    health_interval (float): Seconds between the health reports of the
+        worker processes.
+
+"""
+
+
+# events per terminal the latency percentiles are computed from.
+MAX_LATENCY_SAMPLES = 1000
+
+
+"""Event handler of one dwx_client in a worker process. The events are
+collected in the outbox of the process together with the time they
+were read.
+"""
+
+
+class terminal_forwarder():
+
+    def __init__(self, terminal_id, outbox, lock):
+
+        self.terminal_id = terminal_id
+        self.outbox = outbox
+        self.lock = lock
+        self.dwx = None
+        self.counts = {}
+
+    def add(self, event_type, args):
+
+        with self.lock:
+            self.outbox.append((event_type, self.terminal_id, time(), args))
+            self.counts[event_type] = self.counts.get(event_type, 0) + 1
+
+    def on_tick(self, symbol, bid, ask):
+
+        self.add('tick', (symbol, bid, ask))
+
+    def on_bar_data(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        self.add('bar_data', (symbol, time_frame, time, open_price, high, low,
+                              close_price, tick_volume))
+
+    def on_historic_data(self, symbol, time_frame, data):
+
+        self.add('historic_data', (symbol, time_frame, data))
+
+    def on_historic_trades(self):
+
+        self.add('historic_trades', (dict(self.dwx.historic_trades),))
+
+    def on_message(self, message):
+
+        self.add('message', (message,))
+
+    def on_order_event(self):
+
+        self.add('order_event', (dict(self.dwx.open_orders),))
+
+
+"""Main function of a worker process. Sends the collected events every
+flush_interval seconds and calls the client functions requested by
+the main process, each on its own thread because the command functions
+can block.
+"""
+
+
+def run_worker(terminals, client_kwargs, events, control,
+               flush_interval, health_interval):
+
+    outbox = []
+    lock = Lock()
+    clients = {}
+    forwarders = {}
+
+    for terminal_id, metatrader_dir_path in terminals:
+        forwarder = terminal_forwarder(terminal_id, outbox, lock)
+        try:
+            dwx = dwx_client(forwarder, metatrader_dir_path, **client_kwargs)
+        except:
+            print_exc()
+            continue
+        forwarder.dwx = dwx
+        clients[terminal_id] = dwx
+        forwarders[terminal_id] = forwarder
+
+    for dwx in clients.values():
+        dwx.start()
+
+    next_health_time = 0
+
+    while True:
+
+        try:
+            request = control.get(timeout=flush_interval)
+        except Empty:
+            request = None
+        else:
+            if request is None:
+                break
+            thread = Thread(target=run_call, args=(clients, outbox, lock, request))
+            thread.daemon = True
+            thread.start()
+
+        now = time()
+        with lock:
+            batch = outbox[:]
+            del outbox[:]
+
+        if now >= next_health_time:
+            next_health_time = now + health_interval
+            for terminal_id, metatrader_dir_path in terminals:
+                batch.append(('health', terminal_id, now,
+                              (worker_health(clients.get(terminal_id),
+                                             forwarders.get(terminal_id)),)))
+
+        if len(batch) > 0:
+            events.put(batch)
+
+    for dwx in clients.values():
+        dwx.ACTIVE = False
+
+
+"""Calls a function of a client and puts the result into the outbox.
+A Future (from async_commands) is waited for. A result that cannot be
+pickled is sent as error, otherwise it would break the whole batch in
+the events queue.
+"""
+
+
+def run_call(clients, outbox, lock, request):
+
+    call_id, terminal_id, function_name, args, kwargs = request
+
+    error = None
+    result = None
+    try:
+        dwx = clients[terminal_id]
+        result = getattr(dwx, function_name)(*args, **kwargs)
+        if isinstance(result, Future):
+            result = result.result()
+        pickle.dumps(result)
+    except:
+        result = None
+        error = format_exc()
+
+    with lock:
+        outbox.append(('result', terminal_id, time(), (call_id, result, error)))
+
+
+"""Returns the state of one client for the health report of its worker
+process.
+"""
+
+
+def worker_health(dwx, forwarder):
+
+    if dwx is None:
+        return {'pid': os.getpid(), 'running': False}
+
+    health = {'pid': os.getpid(),
+              'running': dwx.ACTIVE,
+              'read_events': dict(forwarder.counts),
+              'open_orders': len(dwx.open_orders)}
+    try:
+        health['command_backlog'] = dwx.command_backlog()
+    except:
+        pass
+    return health
+
+
+class terminal_pool():
+
+    def __init__(self, event_handler, terminals, num_processes=None,
+                 client_kwargs=None, flush_interval=0.002, health_interval=1.):
+
+        self.event_handler = event_handler
+
+        if isinstance(terminals, dict):
+            self.terminals = [(str(terminal_id), path) for terminal_id, path in terminals.items()]
+        else:
+            self.terminals = [(str(i), path) for i, path in enumerate(terminals)]
+
+        if num_processes is None:
+            num_processes = min(len(self.terminals), os.cpu_count() or 1)
+        self.num_processes = max(1, min(num_processes, len(self.terminals)))
+
+        self.client_kwargs = dict(client_kwargs or {})
+        # only the worker processes print if they are not asked to.
+        self.client_kwargs.setdefault('verbose', False)
+        self.flush_interval = flush_interval
+        self.health_interval = health_interval
+
+        # spawn does not copy the threads and locks of this process.
+        self._context = multiprocessing.get_context('spawn')
+        self._events = self._context.Queue()
+        self._controls = []
+        self.processes = []
+
+        # terminal id -> index of the worker process.
+        self._process_of = {}
+        # terminal id -> state kept by the main process.
+        self._terminals = {}
+        for i, (terminal_id, path) in enumerate(self.terminals):
+            self._process_of[terminal_id] = i % self.num_processes
+            self._terminals[terminal_id] = {'path': path,
+                                            'events': {},
+                                            'last_event_time': None,
+                                            'latencies': deque(maxlen=MAX_LATENCY_SAMPLES),
+                                            'health': {},
+                                            'health_time': None}
+
+        self._calls = {}
+        self._call_id = 0
+        self._lock = Lock()
+
+        self.ACTIVE = False
+
+    """Starts the worker processes and the thread that passes their
+    events to the event_handler.
+    """
+
+    def start(self):
+
+        self.ACTIVE = True
+
+        for i in range(self.num_processes):
+            terminals = [(terminal_id, path) for terminal_id, path in self.terminals
+                         if self._process_of[terminal_id] == i]
+            control = self._context.Queue()
+            process = self._context.Process(
+                target=run_worker,
+                args=(terminals, self.client_kwargs, self._events, control,
+                      self.flush_interval, self.health_interval))
+            process.daemon = True
+            process.start()
+            self._controls.append(control)
+            self.processes.append(process)
+
+        self.receive_thread = Thread(target=self.receive_events, args=())
+        self.receive_thread.daemon = True
+        self.receive_thread.start()
+
+    def receive_events(self):
+
+        while self.ACTIVE:
+
+            try:
+                batch = self._events.get(timeout=0.1)
+            except Empty:
+                continue
+            except:
+                if self.ACTIVE:
+                    print_exc()
+                continue
+
+            receive_time = time()
+
+            for event_type, terminal_id, read_time, args in batch:
+
+                if event_type == 'result':
+                    self.resolve_call(*args)
+                    continue
+
+                state = self._terminals[terminal_id]
+
+                if event_type == 'health':
+                    state['health'] = args[0]
+                    state['health_time'] = read_time
+                    continue
+
+                with self._lock:
+                    state['events'][event_type] = state['events'].get(event_type, 0) + 1
+                    state['last_event_time'] = read_time
+                    state['latencies'].append(receive_time - read_time)
+
+                function = getattr(self.event_handler, 'on_' + event_type, None)
+                if function is None:
+                    continue
+                try:
+                    function(terminal_id, *args)
+                except:
+                    print_exc()
+
+    """Calls a function of the dwx_client of one terminal in its worker
+    process, for example call('demo', 'subscribe_symbols', ['EURUSD']).
+
+    Returns:
+        concurrent.futures.Future: Resolves with the return value, which
+        has to be picklable. Raises a RuntimeError with the traceback
+        of the worker process if the function raised an exception.
+    """
+
+    def call(self, terminal_id, function_name, *args, **kwargs):
+
+        terminal_id = str(terminal_id)
+        if terminal_id not in self._process_of:
+            raise KeyError(f'Unknown terminal: {terminal_id}')
+        if function_name.startswith('_'):
+            raise ValueError(f'Not a public function: {function_name}')
+
+        future = Future()
+        with self._lock:
+            self._call_id += 1
+            call_id = self._call_id
+            self._calls[call_id] = future
+
+        self._controls[self._process_of[terminal_id]].put(
+            (call_id, terminal_id, function_name, args, kwargs))
+        return future
+
+    """Calls a function of the dwx_clients of all terminals.
+
+    Returns:
+        dict: terminal id -> Future, see call().
+    """
+
+    def call_all(self, function_name, *args, **kwargs):
+
+        return {terminal_id: self.call(terminal_id, function_name, *args, **kwargs)
+                for terminal_id, _ in self.terminals}
+
+    def resolve_call(self, call_id, result, error):
+
+        with self._lock:
+            future = self._calls.pop(call_id, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    """Returns the health of each terminal.
+
+    Returns:
+        dict: terminal id -> {'path', 'process' (index), 'pid', 'alive'
+            (worker process running), 'events' (received per event
+            type), 'last_event_age' and 'last_health_age' in seconds,
+            'ipc_latency_ms' ({'p50', 'p99', 'max'} from reading an
+            event in the worker to receiving it here, so only the
+            batching and transfer between the processes, not the delay
+            of MT4 or of the polling) and 'worker' (the last report of
+            the worker process, with 'read_events' and
+            'command_backlog').
+    """
+
+    def get_health(self):
+
+        now = time()
+        health = {}
+
+        with self._lock:
+            for terminal_id, state in self._terminals.items():
+
+                index = self._process_of[terminal_id]
+                process = self.processes[index] if index < len(self.processes) else None
+                latencies = sorted(state['latencies'])
+
+                health[terminal_id] = {
+                    'path': state['path'],
+                    'process': index,
+                    'pid': None if process is None else process.pid,
+                    'alive': process is not None and process.is_alive(),
+                    'events': dict(state['events']),
+                    'last_event_age': None if state['last_event_time'] is None
+                    else now - state['last_event_time'],
+                    'last_health_age': None if state['health_time'] is None
+                    else now - state['health_time'],
+                    'ipc_latency_ms': None if len(latencies) == 0 else
+                    {'p50': 1000 * percentile(latencies, 50),
+                     'p99': 1000 * percentile(latencies, 99),
+                     'max': 1000 * latencies[-1]},
+                    'worker': dict(state['health']),
+                }
+
+        return health
+
+    """Stops the worker processes. Open calls get a RuntimeError.
+    """
+
+    def stop(self, timeout=5):
+
+        for control in self._controls:
+            try:
+                control.put(None)
+            except:
+                pass
+
+        end_time = perf_counter() + timeout
+        for process in self.processes:
+            process.join(max(0, end_time - perf_counter()))
+            if process.is_alive():
+                process.terminate()
+
+        self.ACTIVE = False
+
+        with self._lock:
+            calls = list(self._calls.values())
+            self._calls = {}
+        for future in calls:
+            if not future.done():
+                future.set_exception(RuntimeError('terminal_pool was stopped.'))
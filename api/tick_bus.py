@@ -0,0 +1,331 @@
+import sys
+import struct
+from time import time, sleep
+from threading import Lock
+from traceback import print_exc
+from multiprocessing import shared_memory, resource_tracker
+
+from .event_stage import event_stage
+
+# numpy is only needed by the readers.
+try:
+    import numpy as np
+    TICK_BUS_DTYPE = np.dtype([('sequence', '<u8'), ('symbol_id', '<u4'), ('reserved', '<u4'),
+                               ('time', '<f8'), ('bid', '<f8'), ('ask', '<f8')])
+except ImportError:
+    np = None
+    TICK_BUS_DTYPE = None
+
+
+"""Tick bus
+
+Publishes the ticks into a ring buffer in shared memory, so that any
+number of local processes can read them without their own dwx_client
+and without reading the DWX files again. The writer is used as
+event_handler in front of the actual handler:
+
+    bus = tick_bus(event_dispatcher(processor), 'dwx_ticks')
+    dwx = dwx_client(bus, MT4_files_dir)
+
+and the readers attach by name:
+
+    reader = tick_bus_reader('dwx_ticks')
+    for symbol, bid, ask, timestamp in reader.ticks():
+        ...
+
+Layout of the shared memory (little endian):
+
+    header      sequence (u8) of the last tick, capacity (u8),
+                max_symbols (u8), num_symbols (u8)
+    symbols     max_symbols names of SYMBOL_SIZE bytes (utf-8, null
+                padded), the index is the symbol id
+    ticks       capacity records of TICK_BUS_DTYPE: sequence (u8),
+                symbol id (u4), reserved (u4), time, bid, ask (f8)
+
+Tick n is stored in record n % capacity. The record is written like a
+seqlock: its sequence is set to INVALID_SEQUENCE, then the values are
+written, then the new sequence. The sequence of the header is written
+after the record, so a reader that sees sequence n in the header can
+read all records up to n. A reader copies the records and reads their
+sequences again afterwards; records whose sequence was not the expected
+one before and after the copy were overwritten and are dropped. A
+reader that is more than capacity ticks behind loses the oldest ticks,
+they are counted in num_lost.
+
+There is one writer per bus. Readers never write to the memory.
+
+"""
+
+
+# names of the buses created by this process, their readers in this
+# process share the resource tracker registration of the writer.
+_created_buses = set()
+
+HEADER_FORMAT = struct.Struct('<QQQQ')
+SYMBOL_SIZE = 16
+# sequence, then the values of a record.
+SEQUENCE_FORMAT = struct.Struct('<Q')
+VALUES_FORMAT = struct.Struct('<IIddd')
+RECORD_SIZE = SEQUENCE_FORMAT.size + VALUES_FORMAT.size
+# sequence of a record while it is written, real sequences start at 1.
+INVALID_SEQUENCE = 0
+
+
+def bus_size(capacity, max_symbols):
+
+    return HEADER_FORMAT.size + max_symbols * SYMBOL_SIZE + capacity * RECORD_SIZE
+
+
+"""Args:
+    event_handler: Gets all events after the ticks were published, can
+        be None.
+    name (str): Name of the shared memory block.
+
+Kwargs:
+    capacity (int): Number of ticks in the ring buffer.
+    max_symbols (int): Size of the symbol table.
+    replace (bool): Remove an existing shared memory block of the same
+        name, for example one left over by a crashed writer. Without it
+        a FileExistsError is raised, so that a bus of a running writer
+        is not taken over.
+"""
+
+
+class tick_bus(event_stage):
+
+    def __init__(self, event_handler=None, name='dwx_tick_bus',
+                 capacity=65536, max_symbols=1024, replace=False):
+
+        event_stage.__init__(self, event_handler)
+
+        self.name = name
+        self.capacity = capacity
+        self.max_symbols = max_symbols
+
+        size = bus_size(capacity, max_symbols)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            if not replace:
+                raise FileExistsError(f'The tick bus {name} exists already. Close its writer '
+                                      'or pass replace=True to remove it.')
+            old = shared_memory.SharedMemory(name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+
+        _created_buses.add(name)
+
+        self.buf = self.shm.buf
+        self._symbols_offset = HEADER_FORMAT.size
+        self._records_offset = HEADER_FORMAT.size + max_symbols * SYMBOL_SIZE
+
+        self._symbol_ids = {}
+        self.sequence = 0
+        self._lock = Lock()
+
+        HEADER_FORMAT.pack_into(self.buf, 0, 0, capacity, max_symbols, 0)
+
+    def on_tick(self, symbol, bid, ask):
+
+        try:
+            self.publish(symbol, bid, ask)
+        except:
+            print_exc()
+
+        event_stage.on_tick(self, symbol, bid, ask)
+
+    """Writes one tick into the ring buffer.
+
+    Kwargs:
+        timestamp (float): Seconds since epoch, by default the current time.
+    """
+
+    def publish(self, symbol, bid, ask, timestamp=None):
+
+        if timestamp is None:
+            timestamp = time()
+
+        with self._lock:
+
+            symbol_id = self._symbol_ids.get(symbol)
+            if symbol_id is None:
+                symbol_id = self.add_symbol(symbol)
+
+            sequence = self.sequence + 1
+            offset = self._records_offset + (sequence % self.capacity) * RECORD_SIZE
+            SEQUENCE_FORMAT.pack_into(self.buf, offset, INVALID_SEQUENCE)
+            VALUES_FORMAT.pack_into(self.buf, offset + SEQUENCE_FORMAT.size,
+                                    symbol_id, 0, timestamp, bid, ask)
+            SEQUENCE_FORMAT.pack_into(self.buf, offset, sequence)
+            SEQUENCE_FORMAT.pack_into(self.buf, 0, sequence)
+            self.sequence = sequence
+
+    def add_symbol(self, symbol):
+
+        symbol_id = len(self._symbol_ids)
+        if symbol_id >= self.max_symbols:
+            raise ValueError(f'The symbol table of {self.name} is full.')
+
+        name = symbol.encode('utf-8')
+        if len(name) > SYMBOL_SIZE:
+            raise ValueError(f'Symbol name too long for the tick bus: {symbol}')
+
+        offset = self._symbols_offset + symbol_id * SYMBOL_SIZE
+        self.buf[offset:offset + SYMBOL_SIZE] = name.ljust(SYMBOL_SIZE, b'\0')
+        # the name is written before it is counted.
+        SEQUENCE_FORMAT.pack_into(self.buf, 3 * SEQUENCE_FORMAT.size, symbol_id + 1)
+
+        self._symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    """Closes and removes the shared memory. Attached readers keep their
+    mapping but do not get new ticks.
+    """
+
+    def close(self):
+
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        _created_buses.discard(self.name)
+
+
+"""Reads the ticks of a tick_bus in another process.
+
+Args:
+    name (str): Name of the shared memory block.
+
+Kwargs:
+    from_start (bool): Also return the ticks that are still in the ring
+        buffer, otherwise only ticks published after attaching.
+    shared_tracker (bool): True if this process uses the resource
+        tracker of the writer, like a multiprocessing child of the
+        writer process. By default only a reader in the process of the
+        writer does. The block is removed from the tracker of other
+        processes, so that it is not unlinked when the reader exits.
+"""
+
+
+class tick_bus_reader():
+
+    def __init__(self, name='dwx_tick_bus', from_start=False, shared_tracker=None):
+
+        if np is None:
+            raise ImportError('numpy is needed to read the tick bus.')
+
+        self.name = name
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            if shared_tracker is None:
+                shared_tracker = name in _created_buses
+            # the block belongs to the writer, it must not be removed when
+            # this process exits. A shared tracker keeps the registration
+            # of the writer, which removes it again in close().
+            if not shared_tracker:
+                try:
+                    resource_tracker.unregister(self.shm._name, 'shared_memory')
+                except:
+                    pass
+
+        sequence, self.capacity, self.max_symbols, _ = HEADER_FORMAT.unpack_from(self.shm.buf, 0)
+
+        symbols_offset = HEADER_FORMAT.size
+        records_offset = symbols_offset + self.max_symbols * SYMBOL_SIZE
+        # views of the shared memory, nothing is copied.
+        self._header = np.ndarray((4,), dtype='<u8', buffer=self.shm.buf)
+        self._names = np.ndarray((self.max_symbols,), dtype=f'S{SYMBOL_SIZE}',
+                                 buffer=self.shm.buf, offset=symbols_offset)
+        self.records = np.ndarray((self.capacity,), dtype=TICK_BUS_DTYPE,
+                                  buffer=self.shm.buf, offset=records_offset)
+
+        self.symbols = []
+        self.sequence = max(0, sequence - self.capacity) if from_start else sequence
+        self.num_lost = 0
+
+    def symbol(self, symbol_id):
+
+        if symbol_id >= len(self.symbols):
+            num_symbols = int(self._header[3])
+            self.symbols = [name.decode('utf-8') for name in self._names[:num_symbols]]
+        return self.symbols[symbol_id]
+
+    """Returns the ticks published since the last call as a structured
+    array of TICK_BUS_DTYPE, in the order they were published.
+
+    Kwargs:
+        max_ticks (int): Return at most this many ticks, the others are
+            returned by the next calls.
+    """
+
+    def read(self, max_ticks=None):
+
+        head = int(self._header[0])
+        if head <= self.sequence:
+            return self.records[:0].copy()
+
+        first = self.sequence + 1
+        if head - first >= self.capacity:
+            self.num_lost += head - self.capacity + 1 - first
+            first = head - self.capacity + 1
+        last = head if max_ticks is None else min(head, first + max_ticks - 1)
+
+        sequences = np.arange(first, last + 1, dtype=np.int64)
+        indices = sequences % self.capacity
+        ticks = self.records.take(indices)
+
+        # records the writer started to overwrite before or while they
+        # were copied.
+        valid = (ticks['sequence'] == sequences) & (self.records['sequence'][indices] == sequences)
+        if not valid.all():
+            self.num_lost += int(len(valid) - valid.sum())
+            ticks = ticks[valid]
+
+        self.sequence = last
+        return ticks
+
+    """Yields (symbol, bid, ask, timestamp) of the new ticks until stop()
+    is called, checking for new ticks every sleep_delay seconds.
+    """
+
+    def ticks(self, sleep_delay=0.001):
+
+        self.ACTIVE = True
+
+        while self.ACTIVE:
+            ticks = self.read()
+            if len(ticks) == 0:
+                sleep(sleep_delay)
+                continue
+            for symbol_id, bid, ask, timestamp in zip(ticks['symbol_id'].tolist(),
+                                                      ticks['bid'].tolist(),
+                                                      ticks['ask'].tolist(),
+                                                      ticks['time'].tolist()):
+                yield self.symbol(symbol_id), bid, ask, timestamp
+
+    """Calls event_handler.on_tick() for the new ticks, like a dwx_client
+    would, until stop() is called.
+    """
+
+    def run(self, event_handler, sleep_delay=0.001):
+
+        for symbol, bid, ask, _ in self.ticks(sleep_delay):
+            try:
+                event_handler.on_tick(symbol, bid, ask)
+            except:
+                print_exc()
+
+    def stop(self):
+
+        self.ACTIVE = False
+
+    def close(self):
+
+        self.ACTIVE = False
+        self._header = self._names = self.records = None
+        self.shm.close()
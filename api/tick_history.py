@@ -0,0 +1,147 @@
+from time import time
+from threading import Lock
+
+# numpy is only needed if a tick history is used.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""Tick history
+
+Keeps the last ticks of each symbol in preallocated NumPy arrays of
+fixed size. The windows returned by last() and last_seconds() are views
+into these arrays, nothing is copied.
+
+Each value is written twice, at position i and i + capacity of arrays
+with twice the capacity. This way the last n ticks are always one
+contiguous slice, also after the write position wrapped around.
+
+A view stays valid until capacity more ticks of the symbol were added,
+then its values are overwritten. Use .copy() to keep a window longer.
+
+Example:
+
+    dwx = dwx_client(processor, MT4_files_dir, tick_history_capacity=10000)
+    times, bids, asks = dwx.tick_history.last_seconds('EURUSD', 60)
+    spread = (asks - bids).mean()
+
+Args:
+    capacity (int): Number of ticks kept per symbol.
+
+"""
+
+
+class tick_ring():
+
+    def __init__(self, capacity):
+
+        self.capacity = capacity
+        self.times = np.zeros(2 * capacity, dtype=np.float64)
+        self.bids = np.zeros(2 * capacity, dtype=np.float64)
+        self.asks = np.zeros(2 * capacity, dtype=np.float64)
+        # number of ticks added so far.
+        self.count = 0
+
+    def add(self, timestamp, bid, ask):
+
+        i = self.count % self.capacity
+        j = i + self.capacity
+        self.times[i] = self.times[j] = timestamp
+        self.bids[i] = self.bids[j] = bid
+        self.asks[i] = self.asks[j] = ask
+        # increased last, so readers never see a tick that is not written yet.
+        self.count += 1
+
+    """Returns views of (times, bids, asks) of the last n ticks.
+    """
+
+    def last(self, n):
+
+        count = self.count
+        n = max(0, min(n, count, self.capacity))
+        end = count % self.capacity
+        if count >= self.capacity:
+            end += self.capacity
+        return (self.times[end - n:end], self.bids[end - n:end],
+                self.asks[end - n:end])
+
+    """Returns views of the ticks since the given time stamp.
+    """
+
+    def since(self, timestamp):
+
+        times, bids, asks = self.last(self.capacity)
+        start = np.searchsorted(times, timestamp, side='left')
+        return times[start:], bids[start:], asks[start:]
+
+
+class tick_history():
+
+    def __init__(self, capacity=10000):
+
+        if np is None:
+            raise ImportError('numpy is needed for the tick history.')
+
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = Lock()
+
+    """Adds a tick. timestamp is in seconds since epoch, by default
+    the current time.
+    """
+
+    def add(self, symbol, bid, ask, timestamp=None):
+
+        ring = self._rings.get(symbol)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.setdefault(symbol, tick_ring(self.capacity))
+
+        if timestamp is None:
+            timestamp = time()
+
+        ring.add(timestamp, bid, ask)
+
+    """Returns views of (times, bids, asks) of the last n ticks of a
+    symbol. The arrays are empty for unknown symbols.
+    """
+
+    def last(self, symbol, n):
+
+        ring = self._rings.get(symbol)
+        if ring is None:
+            return empty_window()
+        return ring.last(n)
+
+    """Returns views of (times, bids, asks) of the ticks of a symbol
+    from the last given seconds.
+    """
+
+    def last_seconds(self, symbol, seconds):
+
+        ring = self._rings.get(symbol)
+        if ring is None:
+            return empty_window()
+        return ring.since(time() - seconds)
+
+    """Returns the number of ticks kept for a symbol.
+    """
+
+    def num_ticks(self, symbol):
+
+        ring = self._rings.get(symbol)
+        if ring is None:
+            return 0
+        return min(ring.count, self.capacity)
+
+    def symbols(self):
+
+        return list(self._rings.keys())
+
+
+def empty_window():
+
+    empty = np.zeros(0, dtype=np.float64)
+    return empty, empty, empty
@@ -0,0 +1,248 @@
+import os
+import struct
+from time import time
+from threading import Lock, Thread, Event
+from os.path import join, exists, getsize
+from traceback import print_exc
+from datetime import datetime, timezone, timedelta
+
+from .event_stage import event_stage
+
+# numpy is only needed to read the files.
+try:
+    import numpy as np
+    TICK_DTYPE = np.dtype([('time', '<f8'), ('bid', '<f8'), ('ask', '<f8')])
+except ImportError:
+    np = None
+    TICK_DTYPE = None
+
+
+"""Tick recorder
+
+Writes every tick to fixed width binary files, one file per symbol and
+UTC day:
+
+    {directory}/{symbol}/{symbol}_{YYYYMMDD}.ticks
+
+Each tick is 24 bytes: time (seconds since epoch), bid and ask as
+little endian float64, the same layout as TICK_DTYPE. The files are
+only appended to.
+
+tick_recorder is used as event_handler and passes all events on to the
+next event_handler. It should come before an event_dispatcher, which
+may conflate ticks:
+
+    recorder = tick_recorder('ticks', event_dispatcher(processor))
+    dwx = dwx_client(recorder, MT4_files_dir)
+
+tick_reader maps the files into memory as NumPy structured arrays.
+
+"""
+
+
+TICK_FORMAT = struct.Struct('<ddd')
+
+SECONDS_PER_DAY = 86400
+
+
+def tick_file_path(directory, symbol, day):
+
+    return join(directory, symbol, f'{symbol}_{day.strftime("%Y%m%d")}.ticks')
+
+
+"""Args:
+    directory (str): Directory for the tick files.
+    event_handler: Gets all events after the ticks were recorded, can
+        be None.
+
+Kwargs:
+    flush_interval (float): The files are flushed at most this many
+        seconds after a tick was recorded, so that readers see it. A
+        background thread flushes them, also when no more ticks come.
+"""
+
+
+class tick_recorder(event_stage):
+
+    def __init__(self, directory, event_handler=None, flush_interval=1.):
+
+        event_stage.__init__(self, event_handler)
+
+        self.directory = directory
+        self.flush_interval = flush_interval
+
+        # symbol -> (day number, open file).
+        self._files = {}
+        self._dirty = False
+        self._lock = Lock()
+
+        self.num_ticks = 0
+
+        self._closed = Event()
+        self.flush_thread = Thread(target=self.run_flush, args=())
+        self.flush_thread.daemon = True
+        self.flush_thread.start()
+
+    """Appends one tick to the file of its symbol and day.
+    """
+
+    def record(self, symbol, bid, ask, timestamp=None):
+
+        if timestamp is None:
+            timestamp = time()
+
+        day_number = int(timestamp // SECONDS_PER_DAY)
+
+        with self._lock:
+
+            entry = self._files.get(symbol)
+            if entry is None or entry[0] != day_number:
+                if entry is not None:
+                    entry[1].close()
+                entry = (day_number, self.open_file(symbol, day_number))
+                self._files[symbol] = entry
+
+            entry[1].write(TICK_FORMAT.pack(timestamp, bid, ask))
+            self.num_ticks += 1
+            self._dirty = True
+
+    def open_file(self, symbol, day_number):
+
+        day = datetime.fromtimestamp(day_number * SECONDS_PER_DAY, timezone.utc)
+        path = tick_file_path(self.directory, symbol, day)
+        os.makedirs(join(self.directory, symbol), exist_ok=True)
+
+        f = open(path, 'ab')
+        # cut off a tick that was not written completely, e.g. after a crash.
+        size = f.tell()
+        if size % TICK_FORMAT.size != 0:
+            f.truncate(size - size % TICK_FORMAT.size)
+        return f
+
+    def flush(self):
+
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+
+        for _, f in self._files.values():
+            f.flush()
+        self._dirty = False
+
+    """Flushes the files every flush_interval seconds if ticks were
+    recorded, until close() is called.
+    """
+
+    def run_flush(self):
+
+        while not self._closed.wait(self.flush_interval):
+            if self._dirty:
+                try:
+                    self.flush()
+                except:
+                    print_exc()
+
+    def close(self):
+
+        self._closed.set()
+        with self._lock:
+            for _, f in self._files.values():
+                f.close()
+            self._files = {}
+
+    def on_tick(self, symbol, bid, ask):
+
+        self.record(symbol, bid, ask)
+
+        event_stage.on_tick(self, symbol, bid, ask)
+
+
+"""Reads the files of a tick_recorder.
+
+The arrays returned by read_day() are memory mapped, so only the pages
+that are used are read from disk. The fields are 'time', 'bid' and
+'ask'.
+
+Args:
+    directory (str): Directory of the tick files.
+"""
+
+
+class tick_reader():
+
+    def __init__(self, directory):
+
+        if np is None:
+            raise ImportError('numpy is needed to read tick files.')
+
+        self.directory = directory
+
+    def symbols(self):
+
+        if not exists(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(join(self.directory, name)))
+
+    """Returns the days (datetime.date) with ticks for a symbol.
+    """
+
+    def days(self, symbol):
+
+        directory = join(self.directory, symbol)
+        if not exists(directory):
+            return []
+
+        days = []
+        for name in os.listdir(directory):
+            if name.startswith(symbol + '_') and name.endswith('.ticks'):
+                stamp = name[len(symbol) + 1:-len('.ticks')]
+                days.append(datetime.strptime(stamp, '%Y%m%d').date())
+        return sorted(days)
+
+    """Returns the ticks of one UTC day as memory mapped structured
+    array (read only). Ticks that are still written are left out.
+    """
+
+    def read_day(self, symbol, day):
+
+        path = tick_file_path(self.directory, symbol, day)
+        if not exists(path):
+            return np.zeros(0, dtype=TICK_DTYPE)
+
+        num_ticks = getsize(path) // TICK_DTYPE.itemsize
+        if num_ticks == 0:
+            return np.zeros(0, dtype=TICK_DTYPE)
+
+        return np.memmap(path, dtype=TICK_DTYPE, mode='r', shape=(num_ticks,))
+
+    """Returns the ticks with start <= time < end. start and end are
+    seconds since epoch.
+
+    The times are found by binary search. If the range is within one
+    day, the result is a view of the memory mapped file, otherwise the
+    days are copied into one array.
+    """
+
+    def read_range(self, symbol, start, end):
+
+        day = datetime.fromtimestamp(start, timezone.utc).date()
+        last_day = datetime.fromtimestamp(end, timezone.utc).date()
+
+        parts = []
+        while day <= last_day:
+            ticks = self.read_day(symbol, day)
+            if len(ticks) > 0:
+                times = ticks['time']
+                i = np.searchsorted(times, start, side='left')
+                j = np.searchsorted(times, end, side='left')
+                if j > i:
+                    parts.append(ticks[i:j])
+            day += timedelta(days=1)
+
+        if len(parts) == 0:
+            return np.zeros(0, dtype=TICK_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
@@ -0,0 +1,192 @@
+import heapq
+from time import sleep, perf_counter
+from datetime import datetime, timezone
+from traceback import print_exc
+
+from .command_latency import percentile
+
+
+"""Tick replay
+
+Calls on_tick(), on_bar_data() and on_historic_data() of an
+event_handler with recorded data, without an MT4 terminal. The events
+of all sources are merged by their time stamps.
+
+Example:
+
+    replay = tick_replay(processor, speed=10)
+    replay.add_recorded_ticks(tick_reader('ticks'), ['EURUSD', 'GBPUSD'],
+                              start, end)
+    replay.add_bars('EURUSD', 'M1', dwx.historic_data['EURUSD_M1'])
+    print(replay.run())
+
+Args:
+    event_handler: Object with the usual dwx_client event functions.
+
+Kwargs:
+    speed (float): 0 to replay as fast as possible, 1 for real time,
+        10 for ten times faster than real time.
+
+"""
+
+
+# seconds per MT4 time frame, a bar is replayed when it is complete.
+TIME_FRAME_SECONDS = {
+    'M1': 60,
+    'M5': 300,
+    'M15': 900,
+    'M30': 1800,
+    'H1': 3600,
+    'H4': 14400,
+    'D1': 86400,
+    'W1': 604800,
+    'MN1': 2592000,
+}
+
+# format of the bar times in the DWX files.
+BAR_TIME_FORMAT = '%Y.%m.%d %H:%M'
+
+
+class tick_replay():
+
+    def __init__(self, event_handler, speed=0):
+
+        self.event_handler = event_handler
+        self.speed = speed
+
+        # iterators of (timestamp, source index, function name, args).
+        self._sources = []
+        self._durations = {}
+
+        self.ACTIVE = True
+
+    """Adds ticks of one symbol, for example from tick_reader. ticks is
+    a structured array with the fields 'time', 'bid' and 'ask'.
+    """
+
+    def add_ticks(self, symbol, ticks):
+
+        times = ticks['time'].tolist()
+        bids = ticks['bid'].tolist()
+        asks = ticks['ask'].tolist()
+        index = len(self._sources)
+        self._sources.append((t, index, 'on_tick', (symbol, bid, ask))
+                             for t, bid, ask in zip(times, bids, asks))
+
+    """Adds the ticks of several symbols from the files of a tick_recorder.
+    """
+
+    def add_recorded_ticks(self, reader, symbols, start, end):
+
+        for symbol in symbols:
+            self.add_ticks(symbol, reader.read_range(symbol, start, end))
+
+    """Adds bars in the format of the DWX historic data:
+    {'2023.11.14 10:00': {'open': ..., 'high': ..., 'low': ...,
+    'close': ..., 'tick_volume': ...}, ...}. Each bar is replayed when
+    its time frame has passed.
+    """
+
+    def add_bars(self, symbol, time_frame, bars):
+
+        duration = TIME_FRAME_SECONDS[time_frame]
+        events = []
+        for bar_time in sorted(bars.keys()):
+            bar = bars[bar_time]
+            timestamp = parse_bar_time(bar_time) + duration
+            events.append((timestamp, len(self._sources), 'on_bar_data',
+                           (symbol, time_frame, bar_time, bar['open'], bar['high'],
+                            bar['low'], bar['close'], bar['tick_volume'])))
+        self._sources.append(iter(events))
+
+    """Adds one on_historic_data() call at the given time stamp.
+    """
+
+    def add_historic_data(self, symbol, time_frame, data, timestamp):
+
+        self._sources.append(iter([(timestamp, len(self._sources), 'on_historic_data',
+                                    (symbol, time_frame, data))]))
+
+    """Replays all events and returns the statistics.
+
+    Returns:
+        dict: 'events', 'seconds' (wall time), 'events_per_second',
+            'max_lag_ms' (how late the events were called compared to
+            the schedule, 0 without speed) and 'callbacks' with
+            {'count', 'p50', 'p95', 'p99', 'max'} in microseconds per
+            event function.
+    """
+
+    def run(self):
+
+        self._durations = {}
+
+        num_events = 0
+        max_lag = 0.
+        first_timestamp = None
+        start_time = perf_counter()
+
+        for timestamp, _, name, args in heapq.merge(*self._sources):
+
+            if not self.ACTIVE:
+                break
+
+            if self.speed > 0:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                due_time = start_time + (timestamp - first_timestamp) / self.speed
+                wait = due_time - perf_counter()
+                if wait > 0:
+                    sleep(wait)
+                else:
+                    max_lag = max(max_lag, -wait)
+
+            callback_start = perf_counter()
+            try:
+                getattr(self.event_handler, name)(*args)
+            except:
+                print_exc()
+            self._durations.setdefault(name, []).append(perf_counter() - callback_start)
+
+            num_events += 1
+
+        self._sources = []
+
+        seconds = perf_counter() - start_time
+        return {'events': num_events,
+                'seconds': seconds,
+                'events_per_second': num_events / seconds if seconds > 0 else 0,
+                'max_lag_ms': 1000 * max_lag,
+                'callbacks': self.get_callback_stats()}
+
+    """Returns the duration of the event functions of the last run in
+    microseconds.
+    """
+
+    def get_callback_stats(self):
+
+        stats = {}
+        for name, durations in self._durations.items():
+            values = sorted(durations)
+            stats[name] = {
+                'count': len(values),
+                'p50': 1e6 * percentile(values, 50),
+                'p95': 1e6 * percentile(values, 95),
+                'p99': 1e6 * percentile(values, 99),
+                'max': 1e6 * values[-1],
+            }
+        return stats
+
+    def stop(self):
+
+        self.ACTIVE = False
+
+
+"""Returns the seconds since epoch of a DWX bar time, read as UTC.
+"""
+
+
+def parse_bar_time(bar_time):
+
+    return datetime.strptime(bar_time, BAR_TIME_FORMAT).replace(
+        tzinfo=timezone.utc).timestamp()
@@ -20,18 +20,22 @@ except ImportError:
     sys.exit(1)
 
 class CloudForwarder:
-    def __init__(self, cloud_url, mt4_directory):
+    def __init__(self, cloud_url, mt4_directory, use_socketio=False):
         """
         Initialize the cloud forwarder
         
         Args:
             cloud_url (str): URL of your Render app (e.g., https://your-app.onrender.com)
             mt4_directory (str): Path to your MT4 directory
+            use_socketio (bool): Send the batches over a persistent Socket.IO connection
+                to the /ingest namespace, HTTP is used while it is not connected
         """
         self.cloud_url = cloud_url.rstrip('/')
         self.mt4_directory = mt4_directory
         self.session = requests.Session()
         self.session.timeout = 10
+        self.use_socketio = use_socketio
+        self.sio = None
         
         # Statistics
         self.ticks_sent = 0
@@ -45,6 +49,8 @@ class CloudForwarder:
         print("🚀 CloudForwarder initialized")
         print(f"📍 Cloud URL: {self.cloud_url}")
         print(f"📂 MT4 Directory: {self.mt4_directory}")
+        if self.use_socketio:
+            print("🔌 Batches are sent over Socket.IO (/ingest)")
         print("=" * 50)
     
     def test_connection(self):
@@ -133,6 +139,69 @@ class CloudForwarder:
             print(f"❌ Error sending bar {symbol} {timeframe}: {e}")
             return False
     
+    def connect_socketio(self):
+        """Open the Socket.IO connection to the /ingest namespace, return True if connected"""
+        try:
+            import socketio
+        except ImportError:
+            print("⚠️  python-socketio is not installed, sending batches over HTTP")
+            self.use_socketio = False
+            return False
+        
+        try:
+            # The client reconnects by itself after the connection was lost
+            self.sio = socketio.Client(reconnection=True)
+            self.sio.connect(self.cloud_url, namespaces=['/ingest'], wait_timeout=10)
+            print("✅ Socket.IO connected to /ingest")
+            return True
+        except Exception as e:
+            print(f"⚠️  Socket.IO connection failed, sending batches over HTTP: {e}")
+            self.sio = None
+            return False
+    
+    def count_result(self, records, result):
+        """Add the result of a batch to the statistics"""
+        # Only the first errors are listed, so count from the totals
+        self.ticks_sent += result.get('accepted_ticks', 0)
+        self.bars_sent += result.get('accepted_bars', 0)
+        self.errors += result.get('rejected', 0)
+        if result.get('rejected'):
+            print(f"⚠️  {result['rejected']} of {len(records)} records rejected: {result.get('errors', [])[:3]}")
+    
+    def send_batch(self, records):
+        """Send ticks and bars (dicts with 'type': 'tick' or 'bar') in one request"""
+        if not records:
+            return True
+        
+        # The ack of the 'records' event is the same result as the HTTP response
+        if self.sio is not None and self.sio.connected:
+            try:
+                result = self.sio.call('records', records, namespace='/ingest', timeout=10)
+                self.count_result(records, result)
+                return True
+            except Exception as e:
+                print(f"⚠️  Socket.IO batch failed, sending over HTTP: {e}")
+        
+        try:
+            response = self.session.post(
+                f"{self.cloud_url}/api/forward/batch",
+                json=records,
+                timeout=10
+            )
+            
+            if response.status_code != 200:
+                self.errors += len(records)
+                print(f"❌ Failed to send batch of {len(records)} records: HTTP {response.status_code}")
+                return False
+            
+            self.count_result(records, response.json())
+            return True
+            
+        except Exception as e:
+            self.errors += len(records)
+            print(f"❌ Error sending batch of {len(records)} records: {e}")
+            return False
+    
     def print_statistics(self):
         """Print forwarding statistics"""
         runtime = datetime.now() - self.start_time
@@ -158,6 +227,9 @@ class CloudForwarder:
             print("❌ Cannot connect to cloud server. Please check your URL and try again.")
             return
         
+        if self.use_socketio:
+            self.connect_socketio()
+        
         print("📡 Starting data forwarding...")
         print("💡 Press Ctrl+C to stop")
         print("-" * 50)
@@ -172,11 +244,15 @@ class CloudForwarder:
             
             while True:
                 try:
+                    # Collect the new ticks and bars and send them in one request
+                    records = []
+                    
                     # Get tick data
                     tick_data = self.dwx_client.get_latest_ticks()
                     for symbol, data in tick_data.items():
                         if symbol not in last_tick_time or data['timestamp'] > last_tick_time[symbol]:
-                            self.send_tick_data(symbol, data['bid'], data['ask'], data['timestamp'])
+                            records.append({'type': 'tick', 'symbol': symbol, 'bid': data['bid'],
+                                            'ask': data['ask'], 'timestamp': data['timestamp']})
                             last_tick_time[symbol] = data['timestamp']
                     
                     # Get bar data (less frequently)
@@ -186,11 +262,12 @@ class CloudForwarder:
                             parts = symbol_tf.split('_')
                             if len(parts) == 2:
                                 symbol, timeframe = parts
-                                self.send_bar_data(
-                                    symbol, timeframe, data['time'],
-                                    data['open'], data['high'], data['low'], data['close'],
-                                    data.get('volume', 0)
-                                )
+                                records.append({'type': 'bar', 'symbol': symbol, 'timeframe': timeframe,
+                                                'time': data['time'], 'open': data['open'],
+                                                'high': data['high'], 'low': data['low'],
+                                                'close': data['close'], 'volume': data.get('volume', 0)})
+                    
+                    self.send_batch(records)
                     
                     time.sleep(0.1)  # 100ms delay
                     
@@ -204,6 +281,8 @@ class CloudForwarder:
         except Exception as e:
             print(f"❌ Fatal error: {e}")
         finally:
+            if self.sio is not None:
+                self.sio.disconnect()
             self.print_statistics()
             print("✅ CloudForwarder stopped")
     
@@ -236,8 +315,11 @@ def main():
             print("❌ Invalid MT4 directory")
             return
     
+    # FORWARDER_SOCKETIO=1 keeps one Socket.IO connection open instead of a request per batch
+    use_socketio = os.getenv('FORWARDER_SOCKETIO', '0') == '1'
+    
     # Create and run forwarder
-    forwarder = CloudForwarder(CLOUD_URL, MT4_DIRECTORY)
+    forwarder = CloudForwarder(CLOUD_URL, MT4_DIRECTORY, use_socketio=use_socketio)
     forwarder.run()
 
 if __name__ == "__main__":
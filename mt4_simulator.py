@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from os.path import join, exists
+from datetime import datetime, timezone
+from traceback import print_exc
+
+"""
+MT4 simulator for DWX Connect
+
+Plays the MQL side of the DWX file protocol, so that dwx_client, the
+forwarders and the web server can run without a Wine MT4 install:
+
+- writes DWX_Market_Data.txt and DWX_Bar_Data.txt at configurable rates
+  for a configurable number of symbols (random walk prices)
+- reads DWX_Commands_{i}.txt in order, stopping at the first missing file
+  like the MQL server, and answers through DWX_Messages.txt
+- fills market orders after a configurable execution delay and keeps
+  DWX_Orders.txt up to date
+- answers GET_HISTORIC_DATA and GET_HISTORIC_TRADES
+
+Usage:
+    python mt4_simulator.py /tmp/mt4 --symbols 20 --tick-rate 50
+    python mt4_simulator.py /tmp/mt4 --symbols EURUSD,GBPUSD --execution-delay 0.05
+
+Then start dwx_client (or web_tick_processor.py) with /tmp/mt4 as MT4 directory.
+"""
+
+TIME_FRAME_SECONDS = {
+    'M1': 60, 'M5': 300, 'M15': 900, 'M30': 1800,
+    'H1': 3600, 'H4': 14400, 'D1': 86400, 'W1': 604800, 'MN1': 2592000,
+}
+
+COMMAND_PATTERN = re.compile(r'<:(\d+)\|(\w+)\|(.*):>', re.DOTALL)
+
+MAX_MESSAGES = 50
+
+
+class MT4Simulator:
+    def __init__(self, metatrader_dir_path,
+                 symbols=10,                  # number of generated symbols or list of names
+                 tick_rate=20,                # market data file writes per second
+                 changed_fraction=0.5,        # share of the symbols with a new price per write
+                 bar_rate=1,                  # bar data file writes per second
+                 orders_rate=1,               # orders file writes per second (pnl updates)
+                 command_interval=0.025,      # timer of the MQL server in seconds
+                 execution_delay=0.0,         # seconds until an order is filled
+                 num_command_files=50,
+                 subscribe_all=True,          # publish the symbols without a SUBSCRIBE_SYMBOLS command
+                 verbose=True):
+        """
+        Initialize the simulator
+
+        Args:
+            metatrader_dir_path (str): Directory that gets the DWX folder (MQL4/Files of a terminal)
+        """
+        self.dwx_dir = join(metatrader_dir_path, 'DWX')
+        os.makedirs(self.dwx_dir, exist_ok=True)
+
+        if isinstance(symbols, int):
+            symbols = [f'SYM{i:04d}' for i in range(symbols)]
+        self.symbols = list(symbols)
+
+        self.tick_rate = tick_rate
+        self.changed_fraction = changed_fraction
+        self.bar_rate = bar_rate
+        self.orders_rate = orders_rate
+        self.command_interval = command_interval
+        self.execution_delay = execution_delay
+        self.num_command_files = num_command_files
+        self.verbose = verbose
+
+        self.prices = {symbol: round(1 + random.random(), 5) for symbol in self.symbols}
+        self.spread = 0.0002
+
+        self.subscribed_symbols = list(self.symbols) if subscribe_all else []
+        # (symbol, time_frame) -> current bar
+        self.bar_subscriptions = {}
+        self.bars = {}
+
+        self.account_info = {
+            'name': 'Simulator',
+            'number': 1,
+            'currency': 'USD',
+            'leverage': 100,
+            'free_margin': 10000.,
+            'balance': 10000.,
+            'equity': 10000.,
+        }
+        self.orders = {}
+        self.closed_orders = {}
+        self.next_ticket = 10000000
+        self.messages = {}
+        self.last_millis = 0
+        self.command_ids = set()
+
+        # Statistics
+        self.market_data_writes = 0
+        self.commands_processed = 0
+
+        self.lock = threading.Lock()
+        self.active = False
+        self.threads = []
+
+    def start(self):
+        """Start the writer and command threads"""
+        self.active = True
+        self.write_orders()
+        self.write_messages()
+
+        for target in (self.market_data_loop, self.bar_data_loop,
+                       self.orders_loop, self.command_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        if self.verbose:
+            print(f"🧪 MT4 simulator started in {self.dwx_dir}")
+            print(f"📊 {len(self.subscribed_symbols)} symbols at {self.tick_rate} writes/s")
+
+    def stop(self):
+        """Stop all threads"""
+        self.active = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def write_file(self, name, data):
+        """Write a JSON file in one step so readers never see a partial file"""
+        path = join(self.dwx_dir, name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(data))
+        os.replace(tmp_path, path)
+
+    def run_at_rate(self, rate, function):
+        """Call function rate times per second until stopped"""
+        if rate <= 0:
+            return
+        interval = 1.0 / rate
+        next_time = time.perf_counter()
+        while self.active:
+            try:
+                function()
+            except Exception:
+                print_exc()
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # running late, don't try to catch up
+                next_time = time.perf_counter()
+
+    # ------------------------------------------------------------------
+    # market data, bars and orders
+
+    def market_data_loop(self):
+        self.run_at_rate(self.tick_rate, self.write_market_data)
+
+    def write_market_data(self):
+        with self.lock:
+            symbols = list(self.subscribed_symbols)
+            for symbol in symbols:
+                if random.random() < self.changed_fraction:
+                    self.prices[symbol] = round(self.prices[symbol] * (1 + random.gauss(0, 0.0001)), 5)
+                self.update_bar(symbol)
+            data = {symbol: {'bid': self.prices[symbol],
+                             'ask': round(self.prices[symbol] + self.spread, 5),
+                             'tick_value': 1.}
+                    for symbol in symbols}
+        self.write_file('DWX_Market_Data.txt', data)
+        self.market_data_writes += 1
+
+    def update_bar(self, symbol):
+        """Update the current bars of a symbol with its price (called with self.lock held)"""
+        price = self.prices[symbol]
+        now = time.time()
+        for key in self.bar_subscriptions:
+            if key[0] != symbol:
+                continue
+            seconds = TIME_FRAME_SECONDS[key[1]]
+            bar_start = now - now % seconds
+            bar = self.bars.get(key)
+            if bar is None or bar['start'] != bar_start:
+                bar = {'start': bar_start, 'open': price, 'high': price,
+                       'low': price, 'close': price, 'tick_volume': 0}
+                self.bars[key] = bar
+            bar['high'] = max(bar['high'], price)
+            bar['low'] = min(bar['low'], price)
+            bar['close'] = price
+            bar['tick_volume'] += 1
+
+    def bar_data_loop(self):
+        self.run_at_rate(self.bar_rate, self.write_bar_data)
+
+    def write_bar_data(self):
+        with self.lock:
+            data = {}
+            for (symbol, time_frame), bar in self.bars.items():
+                data[f'{symbol}_{time_frame}'] = {
+                    'time': format_bar_time(bar['start']),
+                    'open': bar['open'],
+                    'high': bar['high'],
+                    'low': bar['low'],
+                    'close': bar['close'],
+                    'tick_volume': bar['tick_volume'],
+                }
+        if data:
+            self.write_file('DWX_Bar_Data.txt', data)
+
+    def orders_loop(self):
+        self.run_at_rate(self.orders_rate, self.write_orders)
+
+    def write_orders(self):
+        with self.lock:
+            pnl = 0.
+            for order in self.orders.values():
+                order['pnl'] = self.order_pnl(order)
+                pnl += order['pnl']
+            self.account_info['equity'] = round(self.account_info['balance'] + pnl, 2)
+            data = {'account_info': dict(self.account_info),
+                    'orders': {ticket: dict(order) for ticket, order in self.orders.items()}}
+        self.write_file('DWX_Orders.txt', data)
+
+    def order_pnl(self, order):
+        if order['type'] not in ('buy', 'sell'):
+            return 0.
+        price = self.prices.get(order['symbol'], order['open_price'])
+        if order['type'] == 'buy':
+            diff = price - order['open_price']
+        else:
+            diff = order['open_price'] - (price + self.spread)
+        return round(diff * order['lots'] * 100000, 2)
+
+    # ------------------------------------------------------------------
+    # commands
+
+    def command_loop(self):
+        while self.active:
+            time.sleep(self.command_interval)
+            try:
+                self.check_commands()
+            except Exception:
+                print_exc()
+
+    def check_commands(self):
+        """Read the command files in order like the MQL server: stop at the first missing file"""
+        for i in range(self.num_command_files):
+            path = join(self.dwx_dir, f'DWX_Commands_{i}.txt')
+            if not exists(path):
+                break
+            try:
+                with open(path) as f:
+                    text = f.read()
+            except OSError:
+                break
+            match = COMMAND_PATTERN.match(text)
+            if match is None:
+                # still being written
+                break
+            os.remove(path)
+
+            command_id, command, content = match.groups()
+            if command_id in self.command_ids and command != 'RESET_COMMAND_IDS':
+                continue
+            self.command_ids.add(command_id)
+            self.execute(command, content)
+            self.commands_processed += 1
+
+    def execute(self, command, content):
+        if self.verbose:
+            print(f"📥 {command} {content}")
+
+        if command == 'RESET_COMMAND_IDS':
+            self.command_ids = set()
+        elif command == 'SUBSCRIBE_SYMBOLS':
+            self.subscribe_symbols(content)
+        elif command == 'SUBSCRIBE_SYMBOLS_BAR_DATA':
+            self.subscribe_bar_data(content)
+        elif command == 'GET_HISTORIC_DATA':
+            self.send_historic_data(content)
+        elif command == 'GET_HISTORIC_TRADES':
+            self.send_historic_trades(content)
+        elif command == 'OPEN_ORDER':
+            self.open_order(content)
+        elif command == 'MODIFY_ORDER':
+            self.modify_order(content)
+        elif command == 'CLOSE_ORDER':
+            self.close_order(content)
+        elif command == 'CLOSE_ALL_ORDERS':
+            self.close_orders(lambda order: True, 'Successfully closed {n} orders.')
+        elif command == 'CLOSE_ORDERS_BY_SYMBOL':
+            self.close_orders(lambda order: order['symbol'] == content,
+                              'Successfully closed {n} orders with symbol ' + content + '.')
+        elif command == 'CLOSE_ORDERS_BY_MAGIC':
+            self.close_orders(lambda order: str(order['magic']) == content,
+                              'Successfully closed {n} orders with magic number ' + content + '.')
+
+    def send_message(self, message):
+        with self.lock:
+            millis = max(int(time.time() * 1000), self.last_millis + 1)
+            self.last_millis = millis
+            self.messages[str(millis)] = message
+            while len(self.messages) > MAX_MESSAGES:
+                del self.messages[next(iter(self.messages))]
+        self.write_messages()
+
+    def write_messages(self):
+        with self.lock:
+            data = dict(self.messages)
+        self.write_file('DWX_Messages.txt', data)
+
+    def info(self, text):
+        self.send_message({'type': 'INFO', 'message': text})
+
+    def error(self, error_type, description):
+        self.send_message({'type': 'ERROR', 'error_type': error_type, 'description': description})
+
+    def subscribe_symbols(self, content):
+        symbols = [s for s in content.split(',') if s]
+        with self.lock:
+            for symbol in symbols:
+                if symbol not in self.prices:
+                    self.prices[symbol] = round(1 + random.random(), 5)
+            self.subscribed_symbols = symbols
+        self.info('Successfully subscribed to: ' + ', '.join(symbols))
+
+    def subscribe_bar_data(self, content):
+        fields = [s for s in content.split(',') if s]
+        with self.lock:
+            self.bar_subscriptions = {}
+            self.bars = {}
+            for symbol, time_frame in zip(fields[0::2], fields[1::2]):
+                if time_frame not in TIME_FRAME_SECONDS:
+                    continue
+                if symbol not in self.prices:
+                    self.prices[symbol] = round(1 + random.random(), 5)
+                self.bar_subscriptions[(symbol, time_frame)] = True
+                self.update_bar(symbol)
+        self.info('Successfully subscribed to bar data: ' + content)
+
+    def send_historic_data(self, content):
+        symbol, time_frame, start, end = content.split(',')[:4]
+        seconds = TIME_FRAME_SECONDS.get(time_frame)
+        if seconds is None:
+            self.error('HISTORIC_DATA_TIME_FRAME', f'Unknown time frame {time_frame}.')
+            return
+        start, end = int(start), int(end)
+        price = self.prices.get(symbol, 1.)
+        bars = {}
+        bar_time = start - start % seconds
+        # at most 5000 bars like a typical chart history
+        while bar_time <= end and len(bars) < 5000:
+            open_price = price
+            price = round(price * (1 + random.gauss(0, 0.001)), 5)
+            bars[format_bar_time(bar_time)] = {
+                'open': open_price,
+                'high': round(max(open_price, price) * 1.0005, 5),
+                'low': round(min(open_price, price) * 0.9995, 5),
+                'close': price,
+                'tick_volume': random.randint(10, 1000),
+            }
+            bar_time += seconds
+        self.write_file('DWX_Historic_Data.txt', {f'{symbol}_{time_frame}': bars})
+
+    def send_historic_trades(self, content):
+        with self.lock:
+            data = {ticket: dict(order) for ticket, order in self.closed_orders.items()}
+        self.write_file('DWX_Historic_Trades.txt', data)
+
+    def open_order(self, content):
+        fields = content.split(',')
+        if len(fields) < 9:
+            self.error('OPEN_ORDER_WRONG_FORMAT', content)
+            return
+        symbol, order_type = fields[0], fields[1]
+        lots, price, stop_loss, take_profit = (float(x) for x in fields[2:6])
+        magic, comment = fields[6], fields[7]
+
+        if order_type not in ('buy', 'sell', 'buylimit', 'selllimit', 'buystop', 'sellstop'):
+            self.error('OPEN_ORDER_TYPE', f'Order type could not be parsed: {order_type}')
+            return
+        if lots <= 0:
+            self.error('OPEN_ORDER_LOTSIZE_TOO_SMALL', f'Lot size too small: {lots}')
+            return
+
+        if self.execution_delay > 0:
+            time.sleep(self.execution_delay)
+
+        with self.lock:
+            if symbol not in self.prices:
+                self.prices[symbol] = round(1 + random.random(), 5)
+            if order_type == 'buy':
+                price = round(self.prices[symbol] + self.spread, 5)
+            elif order_type == 'sell':
+                price = self.prices[symbol]
+            self.next_ticket += 1
+            ticket = str(self.next_ticket)
+            self.orders[ticket] = {
+                'magic': int(magic) if magic.lstrip('-').isdigit() else 0,
+                'symbol': symbol,
+                'lots': lots,
+                'type': order_type,
+                'open_price': price,
+                'open_time': format_order_time(time.time()),
+                'SL': stop_loss,
+                'TP': take_profit,
+                'pnl': 0.,
+                'commission': 0.,
+                'swap': 0.,
+                'comment': comment,
+            }
+        self.write_orders()
+        self.info(f'Successfully sent order {ticket}: {symbol}, {order_type}, {lots}, {price}')
+
+    def modify_order(self, content):
+        fields = content.split(',')
+        ticket = fields[0]
+        with self.lock:
+            order = self.orders.get(ticket)
+            if order is not None:
+                price, stop_loss, take_profit = (float(x) for x in fields[1:4])
+                if price > 0 and order['type'] not in ('buy', 'sell'):
+                    order['open_price'] = price
+                order['SL'] = stop_loss
+                order['TP'] = take_profit
+        if order is None:
+            self.error('MODIFY_ORDER_SELECT_TICKET', f'Could not select order with ticket {ticket}.')
+            return
+        self.write_orders()
+        self.info(f'Successfully modified order {ticket}: {order["symbol"]}, {order["SL"]}, {order["TP"]}')
+
+    def close_order(self, content):
+        fields = content.split(',')
+        ticket = fields[0]
+        lots = float(fields[1]) if len(fields) > 1 and fields[1] else 0.
+
+        if self.execution_delay > 0:
+            time.sleep(self.execution_delay)
+
+        with self.lock:
+            order = self.orders.get(ticket)
+            if order is not None:
+                if order['type'] in ('buy', 'sell') and 0 < lots < order['lots']:
+                    order['lots'] = round(order['lots'] - lots, 2)
+                else:
+                    self.close_order_locked(ticket)
+        if order is None:
+            self.error('CLOSE_ORDER_SELECT_TICKET', f'Could not select order with ticket {ticket}.')
+            return
+        self.write_orders()
+        if order['type'] in ('buy', 'sell'):
+            self.info(f'Successfully closed order {ticket}: {order["symbol"]}, {order["lots"]}')
+        else:
+            self.info(f'Successfully deleted order {ticket}: {order["symbol"]}')
+
+    def close_orders(self, condition, message):
+        with self.lock:
+            tickets = [ticket for ticket, order in self.orders.items() if condition(order)]
+            for ticket in tickets:
+                self.close_order_locked(ticket)
+        self.write_orders()
+        self.info(message.format(n=len(tickets)))
+
+    def close_order_locked(self, ticket):
+        """Move an order to the trade history (called with self.lock held)"""
+        order = self.orders.pop(ticket)
+        order['pnl'] = self.order_pnl(order)
+        order['close_time'] = format_order_time(time.time())
+        self.account_info['balance'] = round(self.account_info['balance'] + order['pnl'], 2)
+        self.closed_orders[ticket] = order
+
+
+def format_bar_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y.%m.%d %H:%M')
+
+
+def format_order_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y.%m.%d %H:%M:%S')
+
+
+def main():
+    """Main function to start the simulator"""
+    parser = argparse.ArgumentParser(description='MT4 simulator for the DWX Connect file protocol')
+    parser.add_argument('metatrader_dir', help='directory that gets the DWX folder')
+    parser.add_argument('--symbols', default='10',
+                        help='number of symbols or comma separated symbol names (default: 10)')
+    parser.add_argument('--tick-rate', type=float, default=20, help='market data writes per second')
+    parser.add_argument('--changed-fraction', type=float, default=0.5,
+                        help='share of the symbols with a new price per write')
+    parser.add_argument('--bar-rate', type=float, default=1, help='bar data writes per second')
+    parser.add_argument('--orders-rate', type=float, default=1, help='orders file writes per second')
+    parser.add_argument('--command-interval', type=float, default=0.025,
+                        help='seconds between checks of the command files')
+    parser.add_argument('--execution-delay', type=float, default=0.0,
+                        help='seconds until an order is filled')
+    parser.add_argument('--wait-for-subscription', action='store_true',
+                        help='only publish symbols after a SUBSCRIBE_SYMBOLS command')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+
+    symbols = int(args.symbols) if args.symbols.isdigit() else args.symbols.split(',')
+
+    simulator = MT4Simulator(args.metatrader_dir,
+                             symbols=symbols,
+                             tick_rate=args.tick_rate,
+                             changed_fraction=args.changed_fraction,
+                             bar_rate=args.bar_rate,
+                             orders_rate=args.orders_rate,
+                             command_interval=args.command_interval,
+                             execution_delay=args.execution_delay,
+                             subscribe_all=not args.wait_for_subscription,
+                             verbose=not args.quiet)
+    simulator.start()
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📊 {simulator.market_data_writes} market data writes, "
+                  f"{simulator.commands_processed} commands, {len(simulator.orders)} open orders")
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopping MT4 simulator...")
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
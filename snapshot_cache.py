@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import gzip
+import json
+import threading
+import uuid
+
+"""
+Pre-serialized snapshots of the tick and bar caches
+
+Each cache has a version that the writers increase when they change it.
+The JSON of a snapshot is only built again when the version changed, so
+polling clients and reconnecting sockets reuse the same bytes, and the
+data lock is only held to copy the cache, not to serialize it.
+"""
+
+# Changes with every start, so that ETags of an older process never match
+BOOT_ID = uuid.uuid4().hex[:8]
+
+GZIP_LEVEL = 6
+
+
+class RawJSON:
+    """Already serialized JSON that SnapshotJSON inserts into Socket.IO packets as it is"""
+    def __init__(self, text):
+        self.text = text
+
+
+class SnapshotJSON:
+    """
+    json module for Socket.IO (SocketIO(app, json=SnapshotJSON)) that
+    writes RawJSON arguments of an event without serializing them again
+    """
+    @staticmethod
+    def dumps(obj, **kwargs):
+        if isinstance(obj, list) and any(isinstance(item, RawJSON) for item in obj):
+            separator = kwargs.get('separators', (', ', ': '))[0]
+            return '[' + separator.join(item.text if isinstance(item, RawJSON) else json.dumps(item, **kwargs)
+                                        for item in obj) + ']'
+        return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
+
+
+class DataSnapshot:
+    def __init__(self, name, copy_data, data_lock):
+        """
+        Serialized snapshot of one cache
+
+        Args:
+            name (str): Name used in the ETag
+            copy_data (callable): Returns a copy of the cache that can be
+                serialized after data_lock was released
+            data_lock: The lock the writers of the cache hold
+        """
+        self.name = name
+        self.copy_data = copy_data
+        self.data_lock = data_lock
+
+        # Increased by the writers while they hold data_lock
+        self.version = 0
+
+        # (version, text, bytes) of the last build, gzip of the same version
+        self.built = (-1, None, None)
+        self.gzipped = (-1, None)
+        self.build_lock = threading.Lock()
+
+        # Statistics
+        self.builds = 0
+        self.requests = 0
+        self.not_modified = 0
+
+    def changed(self):
+        """Mark the cache as changed, call with data_lock held"""
+        self.version += 1
+
+    def get(self):
+        """Return (version, JSON text, JSON bytes), built again only if the cache changed"""
+        self.requests += 1
+        built = self.built
+        if built[0] == self.version:
+            return built
+
+        # Concurrent requests wait for one build instead of all serializing
+        with self.build_lock:
+            if self.built[0] != self.version:
+                with self.data_lock:
+                    version = self.version
+                    data = self.copy_data()
+                text = json.dumps(data)
+                self.built = (version, text, text.encode('utf-8'))
+                self.builds += 1
+            return self.built
+
+    def get_gzip(self, version, body):
+        """gzip compressed body of a version returned by get()"""
+        gzipped = self.gzipped
+        if gzipped[0] != version:
+            gzipped = (version, gzip.compress(body, GZIP_LEVEL))
+            self.gzipped = gzipped
+        return gzipped[1]
+
+    def etag(self, version, gzipped=False):
+        """Strong ETag of a version, the gzip body gets its own"""
+        etag = f'{self.name}-{BOOT_ID}-{version}'
+        return etag + '-gz' if gzipped else etag
+
+    def get_stats(self):
+        return {
+            'version': self.version,
+            'builds': self.builds,
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'bytes': 0 if self.built[2] is None else len(self.built[2])
+        }
@@ -0,0 +1,357 @@
+# the web server uses gevent. Without patching, socketio.emit() from the
+# dwx_client threads would not wake up the server greenlets.
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import threading
+from time import sleep, perf_counter
+from datetime import datetime, timezone
+
+sys.path.append('../')
+from api.command_latency import percentile
+from mt4_simulator import MT4Simulator
+from web_server import app, socketio, get_streamer
+from web_tick_processor import WebTickProcessor
+import socketio as socketio_client
+
+
+"""
+
+End-to-end Latency Benchmark
+
+Measures the time from writing DWX_Market_Data.txt to a Socket.IO client
+receiving the 'tick_data' event, split into stages:
+
+    detect    dwx_client read the changed file
+    parse     the JSON was decoded
+    on_tick   WebTickProcessor.on_tick() was called
+    emit      TickDataStreamer.emit_tick() was called
+    emitted   socketio.emit() returned
+    received  the Socket.IO client got the tick
+
+All times are in milliseconds since the file was written. The web server,
+WebTickProcessor and the Socket.IO client run in this process, and the
+mql side is played by mt4_simulator.py. Each market data file gives every
+symbol a new price, so ticks/s = writes/s * symbols.
+
+For each number of symbols and sleep_delay the write rate is increased
+until a step is not sustainable anymore: less than --min-received of the
+ticks reached the client (the event dispatcher conflates ticks if the
+handler falls behind) or the p99 latency is above --max-p99-ms.
+
+The results are saved as JSON, so that runs can be compared.
+
+By default every tick is sent as its own 'tick_data' event. With
+--tick-frame-rate the server sends the latest tick per symbol as
+'tick_frame' events instead, conflated ticks count as not received.
+
+Without the websocket-client package the Socket.IO client falls back to
+long polling, which adds tens of milliseconds to 'received'.
+
+No MT4 terminal is needed. Run from the tests/ directory:
+
+    python dwx_end_to_end_benchmark.py --symbols 1,10,100 --sleep-delays 0.001,0.005
+
+"""
+
+
+STAGES = ['detect', 'parse', 'on_tick', 'emit', 'emitted', 'received']
+
+PRICE_STEP = 1e-5
+
+
+class benchmark_run():
+
+    def __init__(self):
+
+        self.write_times = {}
+        # write sequence number -> perf_counter() of the stage.
+        self.detect_times = {}
+        self.parse_times = {}
+        # (symbol, sequence number) -> {stage: perf_counter()}.
+        self.tick_times = {}
+        self.lock = threading.Lock()
+
+    def tick_stage(self, stage, symbol, bid):
+
+        now = perf_counter()
+        key = (symbol, sequence_of(bid))
+        with self.lock:
+            self.tick_times.setdefault(key, {})[stage] = now
+
+
+def sequence_of(bid):
+
+    return int(round((bid - 1) / PRICE_STEP))
+
+
+def market_data(symbols, sequence):
+
+    bid = round(1 + sequence * PRICE_STEP, 5)
+    return {symbol: {'bid': bid, 'ask': round(bid + 0.0002, 5), 'tick_value': 1.}
+            for symbol in symbols}
+
+
+"""Adds the time stamps of the stages to a WebTickProcessor and its
+dwx_client. current() returns the benchmark_run of the current step.
+"""
+
+
+def instrument(processor, current):
+
+    dwx = processor.dwx
+    read_file_if_changed = dwx.read_file_if_changed
+    json_loads = dwx.json_loads
+
+    def timed_read(file_path):
+        text = read_file_if_changed(file_path)
+        if text is not None and file_path == dwx.path_market_data:
+            dwx._detect_time = perf_counter()
+        return text
+
+    def timed_loads(text):
+        data = json_loads(text)
+        if isinstance(data, dict) and len(data) > 0:
+            values = next(iter(data.values()))
+            if isinstance(values, dict) and 'bid' in values and 'ask' in values:
+                sequence = sequence_of(values['bid'])
+                run = current()
+                run.detect_times[sequence] = dwx._detect_time
+                run.parse_times[sequence] = perf_counter()
+        return data
+
+    dwx.read_file_if_changed = timed_read
+    dwx.json_loads = timed_loads
+
+    on_tick = processor.on_tick
+
+    def timed_on_tick(symbol, bid, ask):
+        current().tick_stage('on_tick', symbol, bid)
+        on_tick(symbol, bid, ask)
+
+    # the dispatcher looks the function up on every event.
+    processor.on_tick = timed_on_tick
+
+
+"""Adds the time stamps of emit_tick() to the global streamer.
+"""
+
+
+def instrument_streamer(streamer, current):
+
+    emit_tick = streamer.emit_tick
+
+    def timed_emit_tick(symbol, bid, ask, timestamp=None):
+        current().tick_stage('emit', symbol, bid)
+        emit_tick(symbol, bid, ask, timestamp)
+
+    def on_emitted(tick_data):
+        current().tick_stage('emitted', tick_data['symbol'], tick_data['bid'])
+
+    streamer.emit_tick = timed_emit_tick
+    streamer.add_tick_subscriber(on_emitted)
+
+
+def run_step(symbols, writes_per_second, duration, simulator, run):
+
+    interval = 1. / writes_per_second
+    sequence = 0
+    next_time = perf_counter()
+    end_time = next_time + duration
+
+    while perf_counter() < end_time:
+        sequence += 1
+        data = market_data(symbols, sequence + run.offset)
+        simulator.write_file('DWX_Market_Data.txt', data)
+        run.write_times[sequence + run.offset] = perf_counter()
+        next_time += interval
+        delay = next_time - perf_counter()
+        if delay > 0:
+            sleep(delay)
+
+    # wait for the last ticks.
+    sleep(0.5)
+    return sequence
+
+
+def step_results(run, symbols, writes_per_second, num_writes, duration):
+
+    latencies = {stage: [] for stage in STAGES}
+
+    for sequence, write_time in run.write_times.items():
+        if sequence in run.detect_times:
+            latencies['detect'].append(run.detect_times[sequence] - write_time)
+        if sequence in run.parse_times:
+            latencies['parse'].append(run.parse_times[sequence] - write_time)
+
+    received = 0
+    with run.lock:
+        tick_times = dict(run.tick_times)
+    for (symbol, sequence), stages in tick_times.items():
+        write_time = run.write_times.get(sequence)
+        if write_time is None:
+            continue
+        for stage, stage_time in stages.items():
+            latencies[stage].append(stage_time - write_time)
+        if 'received' in stages:
+            received += 1
+
+    stages = {}
+    for stage, values in latencies.items():
+        values.sort()
+        if len(values) == 0:
+            stages[stage] = None
+            continue
+        stages[stage] = {'count': len(values),
+                         'p50': 1000 * percentile(values, 50),
+                         'p95': 1000 * percentile(values, 95),
+                         'p99': 1000 * percentile(values, 99),
+                         'max': 1000 * values[-1]}
+
+    sent = num_writes * len(symbols)
+    return {'writes_per_second': writes_per_second,
+            'ticks_per_second': num_writes * len(symbols) / duration,
+            'sent': sent,
+            'received': received,
+            'received_fraction': received / sent if sent > 0 else 0,
+            'stages': stages}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='End-to-end tick latency benchmark')
+    parser.add_argument('--symbols', default='1,10,100',
+                        help='comma separated numbers of symbols')
+    parser.add_argument('--sleep-delays', default='0.001,0.005',
+                        help='comma separated sleep_delay values of dwx_client')
+    parser.add_argument('--rates', default='10,20,50,100,200,500,1000',
+                        help='comma separated market data writes per second')
+    parser.add_argument('--duration', type=float, default=3, help='seconds per step')
+    parser.add_argument('--no-inotify', action='store_true',
+                        help='poll with sleep_delay instead of waiting for inotify events')
+    parser.add_argument('--tick-frame-rate', type=float, default=0,
+                        help="send 'tick_frame' events at this rate instead of every tick")
+    parser.add_argument('--min-received', type=float, default=0.99)
+    parser.add_argument('--max-p99-ms', type=float, default=50)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', default='end_to_end_benchmark.json')
+    args = parser.parse_args()
+
+    symbol_counts = [int(x) for x in args.symbols.split(',')]
+    sleep_delays = [float(x) for x in args.sleep_delays.split(',')]
+    rates = [float(x) for x in args.rates.split(',')]
+
+    server_thread = threading.Thread(target=socketio.run, args=(app,),
+                                     kwargs={'host': '127.0.0.1', 'port': args.port,
+                                             'debug': False, 'use_reloader': False})
+    server_thread.daemon = True
+    server_thread.start()
+    sleep(2)
+
+    # the frames are started when the client connects.
+    get_streamer().tick_frame_rate = args.tick_frame_rate
+
+    state = {'run': benchmark_run()}
+
+    def current():
+        return state['run']
+
+    client = socketio_client.Client()
+
+    @client.on('tick_data')
+    def on_tick_data(data):
+        current().tick_stage('received', data['symbol'], data['bid'])
+
+    @client.on('tick_frame')
+    def on_tick_frame(frame):
+        for data in frame['ticks']:
+            current().tick_stage('received', data['symbol'], data['bid'])
+
+    # also joins again after a reconnect.
+    @client.on('connect')
+    def on_connect():
+        client.emit('join_ticks')
+
+    client.connect(f'http://127.0.0.1:{args.port}')
+
+    instrument_streamer(get_streamer(), current)
+
+    results = {'timestamp': datetime.now(timezone.utc).isoformat(),
+               'settings': vars(args),
+               'runs': []}
+
+    # sequence numbers stay unique over all steps.
+    offset = 0
+
+    for n_symbols in symbol_counts:
+        for sleep_delay in sleep_delays:
+
+            directory = tempfile.mkdtemp(prefix='dwx_benchmark_')
+            simulator = MT4Simulator(directory, symbols=0, tick_rate=0, bar_rate=0,
+                                     orders_rate=0, command_interval=0.005, verbose=False)
+            simulator.start()
+
+            symbols = [f'SYM{i:04d}' for i in range(n_symbols)]
+            processor = WebTickProcessor(directory, sleep_delay=sleep_delay, verbose=False,
+                                         tick_symbols=symbols, bar_symbols_timeframes=[],
+                                         use_inotify=not args.no_inotify)
+            instrument(processor, current)
+
+            print(f'\n{n_symbols} symbols, sleep_delay {sleep_delay}, '
+                  f'file watcher {type(processor.dwx.file_watcher).__name__}')
+            print(f'{"writes/s":>9} {"ticks/s":>9} {"received":>9} '
+                  + ' '.join(f'{stage + " p99":>12}' for stage in STAGES))
+
+            run_result = {'symbols': n_symbols,
+                          'sleep_delay': sleep_delay,
+                          'file_watcher': type(processor.dwx.file_watcher).__name__,
+                          'steps': [],
+                          'max_ticks_per_second': 0}
+
+            for rate in rates:
+
+                run = benchmark_run()
+                run.offset = offset
+                state['run'] = run
+
+                num_writes = run_step(symbols, rate, args.duration, simulator, run)
+                offset += num_writes + 1
+
+                step = step_results(run, symbols, rate, num_writes, args.duration)
+                run_result['steps'].append(step)
+
+                received = step['stages']['received']
+                p99 = received['p99'] if received is not None else float('inf')
+                print(f'{rate:>9.0f} {step["ticks_per_second"]:>9.0f} '
+                      f'{100 * step["received_fraction"]:>8.1f}% '
+                      + ' '.join(f'{step["stages"][stage]["p99"]:>10.2f}ms'
+                                 if step['stages'][stage] is not None else f'{"-":>12}'
+                                 for stage in STAGES))
+
+                if step['received_fraction'] < args.min_received or p99 > args.max_p99_ms:
+                    break
+                run_result['max_ticks_per_second'] = step['ticks_per_second']
+
+            print(f'max sustainable: {run_result["max_ticks_per_second"]:.0f} ticks/s')
+            results['runs'].append(run_result)
+
+            processor.dwx.ACTIVE = False
+            processor.dispatcher.stop()
+            simulator.stop()
+            # other runs must not be slowed down by the old client.
+            sleep(0.5)
+
+    client.disconnect()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f'\nResults saved to {os.path.abspath(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
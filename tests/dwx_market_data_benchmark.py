@@ -0,0 +1,91 @@
+import sys
+import json
+from time import perf_counter
+from random import random, seed
+
+sys.path.append('../')
+from api.dwx_client import changed_quotes, fast_json_loads
+
+
+"""
+
+Market Data Benchmark
+
+Measures how long it takes to decode DWX_Market_Data.txt and to find the
+symbols that changed, for 10, 100 and 1000 symbols. In each update 10% of
+the symbols get a new price.
+
+It compares json.loads with fast_json_loads (orjson if installed) and the
+old diff of the complete symbol dicts with changed_quotes().
+
+No MT4 terminal is needed.
+
+"""
+
+
+def make_updates(n_symbols, n_updates, changed_fraction=0.1):
+
+    seed(0)
+    market_data = {f'SYM{i:04d}': {'bid': 1.1, 'ask': 1.1002, 'tick_value': 1.}
+                   for i in range(n_symbols)}
+    texts = []
+    for _ in range(n_updates):
+        for symbol in market_data.keys():
+            if random() < changed_fraction:
+                bid = round(1 + random(), 5)
+                market_data[symbol] = {'bid': bid, 'ask': bid + 0.0002, 'tick_value': 1.}
+        texts.append(json.dumps(market_data))
+    return texts
+
+
+def time_parse(loads, texts):
+
+    start = perf_counter()
+    for text in texts:
+        loads(text)
+    return (perf_counter() - start) / len(texts)
+
+
+def diff_dicts(data, last_data):
+
+    changed = []
+    for symbol in data.keys():
+        if symbol not in last_data or data[symbol] != last_data[symbol]:
+            changed.append((symbol, data[symbol]['bid'], data[symbol]['ask']))
+    return changed
+
+
+def time_diff(decoded):
+
+    start = perf_counter()
+    last_data = {}
+    for data in decoded:
+        diff_dicts(data, last_data)
+        last_data = data
+    dict_seconds = (perf_counter() - start) / len(decoded)
+
+    start = perf_counter()
+    last_quotes = {}
+    for data in decoded:
+        changed_quotes(data, last_quotes)
+    tuple_seconds = (perf_counter() - start) / len(decoded)
+
+    return dict_seconds, tuple_seconds
+
+
+n_updates = 200
+
+print(f'fast_json_loads: {fast_json_loads.__module__}.{fast_json_loads.__name__}\n')
+print(f'{"symbols":>8} {"json.loads":>12} {"fast loads":>12} {"dict diff":>12} {"tuple diff":>12}')
+
+for n_symbols in [10, 100, 1000]:
+
+    texts = make_updates(n_symbols, n_updates)
+    decoded = [json.loads(text) for text in texts]
+
+    json_seconds = time_parse(json.loads, texts)
+    fast_seconds = time_parse(fast_json_loads, texts)
+    dict_seconds, tuple_seconds = time_diff(decoded)
+
+    print(f'{n_symbols:>8} {1e6*json_seconds:>10.1f}us {1e6*fast_seconds:>10.1f}us '
+          f'{1e6*dict_seconds:>10.1f}us {1e6*tuple_seconds:>10.1f}us')
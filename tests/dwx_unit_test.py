@@ -1,10 +1,32 @@
 
 from api.dwx_client import dwx_client
+from api.command_queue import command_queue
+from api.command_slots import command_slots
+from api.command_ack import ack_matcher
+from api.command_latency import command_latency, ORDERS_SUFFIX
+from api.file_watcher import IN_DELETE
+from api.tick_bus import tick_bus, tick_bus_reader
+from api.event_dispatcher import event_queue
+from api.bar_aggregator import bar_aggregator
+from api.tick_history import tick_history
+from api.tick_recorder import tick_recorder, tick_reader, tick_file_path
+from api.terminal_pool import run_call
+from mt4_simulator import MT4Simulator
+from web_server import app, parse_batch, ingest_records, snapshot_response
+from snapshot_cache import DataSnapshot
+from wire_format import (BinaryEncoder, tick_time, FRAME_HEADER, TICK_HEAD,
+                         TICK_DELTA, TICK_ABSOLUTE, BAR, DELTA, PRICE_UNIT)
+import os
 import sys
+import gzip
 import json
+import shutil
+import tempfile
 import unittest
-from time import sleep
-from threading import Thread
+import numpy as np
+from time import sleep, time, time_ns
+from concurrent.futures import Future
+from threading import Thread, Lock
 from os.path import join, exists
 from traceback import print_exc
 from random import random
@@ -448,5 +470,1037 @@ class TestDWXConnect(unittest.TestCase):
         self.assertIsInstance(historic_data, dict)
 
 
+"""
+
+Tests of the batch and async command functions against the MT4 simulator
+(mt4_simulator.py), so they do not need a running MT4 terminal.
+
+"""
+
+
+class TestDWXSimulator(unittest.TestCase):
+
+    """Starts the simulator in a temporary directory and a dwx_client
+    that reads its files.
+    """
+
+    def setUp(self):
+
+        self.MT4_directory_path = tempfile.mkdtemp(prefix='mt4_simulator_')
+        self.symbol = 'EURUSD'
+        self.lots = 0.01
+
+        self.simulator = MT4Simulator(self.MT4_directory_path, symbols=[self.symbol],
+                                      verbose=False)
+        self.simulator.start()
+
+        self.dwx = dwx_client(None, self.MT4_directory_path, sleep_delay=0.005,
+                              max_retry_command_seconds=10, verbose=False)
+        self.dwx.start()
+        sleep(0.5)
+
+    def tearDown(self):
+
+        self.dwx.ACTIVE = False
+        self.simulator.stop()
+        sleep(0.1)
+        shutil.rmtree(self.MT4_directory_path, ignore_errors=True)
+
+    """Opens, modifies and closes orders with the batch functions and
+    checks that each result is answered and confirmed by DWX_Orders.txt.
+    """
+
+    def test_open_modify_close_orders_batch(self):
+
+        results = self.dwx.open_orders_batch(
+            [{'symbol': self.symbol, 'order_type': 'buy', 'lots': self.lots}
+             for _ in range(3)], timeout=5)
+
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertEqual(result['message']['type'], 'INFO')
+            self.assertTrue(result['confirmed'])
+            self.assertIsNotNone(result['ticket'])
+            self.assertIsNotNone(result['order'])
+        tickets = [result['ticket'] for result in results]
+        self.assertEqual(len(set(tickets)), 3)
+
+        results = self.dwx.modify_orders_batch(
+            [{'ticket': ticket, 'stop_loss': 1.0, 'take_profit': 3.0}
+             for ticket in tickets], timeout=5)
+
+        for ticket, result in zip(tickets, results):
+            self.assertEqual(result['ticket'], ticket)
+            self.assertEqual(result['message']['type'], 'INFO')
+            self.assertTrue(result['confirmed'])
+            self.assertEqual(result['order']['SL'], 1.0)
+            self.assertEqual(result['order']['TP'], 3.0)
+
+        results = self.dwx.close_orders_batch(tickets, timeout=5)
+
+        for result in results:
+            self.assertEqual(result['message']['type'], 'INFO')
+            self.assertTrue(result['confirmed'])
+            self.assertIsNone(result['order'])
+        self.assertEqual(len(self.dwx.open_orders), 0)
+
+    """An order that does not exist is answered with an ERROR message
+    and not confirmed.
+    """
+
+    def test_close_orders_batch_unknown_ticket(self):
+
+        results = self.dwx.close_orders_batch(['123'], timeout=2)
+
+        self.assertEqual(results[0]['message']['type'], 'ERROR')
+        self.assertFalse(results[0]['confirmed'])
+
+    """Tests that the futures of send_command_async() resolve with the
+    answer of the command they belong to.
+    """
+
+    def test_send_command_async(self):
+
+        open_future = self.dwx.send_command_async(
+            'OPEN_ORDER', self.dwx.order_command_content(
+                self.dwx.open_order, {'symbol': self.symbol, 'lots': self.lots}))
+        error_future = self.dwx.send_command_async('CLOSE_ORDER', '123,0')
+
+        message = open_future.result(5)
+        self.assertEqual(message['type'], 'INFO')
+        self.assertIn('Successfully sent order', message['message'])
+
+        message = error_future.result(5)
+        self.assertEqual(message['type'], 'ERROR')
+        self.assertEqual(message['error_type'], 'CLOSE_ORDER_SELECT_TICKET')
+
+    """Tests that the command functions return futures with
+    async_commands=True.
+    """
+
+    def test_async_commands(self):
+
+        self.dwx.async_commands = True
+
+        future = self.dwx.open_order(symbol=self.symbol, lots=self.lots)
+        self.assertIsInstance(future, Future)
+        self.assertEqual(future.result(5)['type'], 'INFO')
+
+        ticket = future.result()['message'].split(':')[0].split()[-1]
+        future = self.dwx.close_order(ticket)
+        self.assertEqual(future.result(5)['type'], 'INFO')
+
+
+"""
+
+Tests of the building blocks that do not need MT4 or the simulator.
+
+"""
+
+
+class TestCommandQueue(unittest.TestCase):
+
+    """Returns the (command, content) of all queued commands in the
+    order they would be written.
+    """
+
+    def get_all(self, queue):
+
+        commands = []
+        while queue.qsize() > 0:
+            command, content, _ = queue.get(timeout=0)
+            commands.append((command, content))
+        return commands
+
+    def test_coalesce_modify_order(self):
+
+        queue = command_queue()
+        first = Future()
+        second = Future()
+        queue.put('MODIFY_ORDER', '123,0,1.1,1.2,0', first)
+        queue.put('MODIFY_ORDER', '456,0,1.1,1.2,0', Future())
+        queue.put('MODIFY_ORDER', '123,0,1.0,1.3,0', second)
+
+        self.assertEqual(self.get_all(queue), [('MODIFY_ORDER', '123,0,1.0,1.3,0'),
+                                               ('MODIFY_ORDER', '456,0,1.1,1.2,0')])
+        self.assertEqual(queue.num_coalesced, 1)
+
+        first.set_result({'type': 'INFO'})
+        self.assertEqual(second.result(0), {'type': 'INFO'})
+
+    def test_close_before_open(self):
+
+        queue = command_queue()
+        queue.put('OPEN_ORDER', 'EURUSD,buy,0.01')
+        queue.put('CLOSE_ORDER', '123,0')
+        queue.put('OPEN_ORDER', 'GBPUSD,buy,0.01')
+
+        self.assertEqual([command for command, _ in self.get_all(queue)],
+                         ['CLOSE_ORDER', 'OPEN_ORDER', 'OPEN_ORDER'])
+        self.assertEqual(queue.num_prioritized, 1)
+
+    def test_close_removes_modify_order(self):
+
+        queue = command_queue()
+        modify = Future()
+        coalesced = Future()
+        queue.put('MODIFY_ORDER', '123,0,1.1,1.2,0', modify)
+        queue.put('MODIFY_ORDER', '123,0,1.0,1.3,0', coalesced)
+        queue.put('MODIFY_ORDER', '456,0,1.1,1.2,0')
+        queue.put('CLOSE_ORDER', '123,0')
+
+        self.assertEqual(self.get_all(queue), [('CLOSE_ORDER', '123,0'),
+                                               ('MODIFY_ORDER', '456,0,1.1,1.2,0')])
+        self.assertTrue(modify.cancelled())
+        self.assertTrue(coalesced.cancelled())
+        self.assertEqual(queue.num_superseded, 1)
+
+
+class TestAckMatcher(unittest.TestCase):
+
+    def test_oldest_command_of_type(self):
+
+        matcher = ack_matcher()
+        first = Future()
+        second = Future()
+        subscribe = Future()
+        matcher.add(1, 'OPEN_ORDER', 'EURUSD,buy,0.01', first)
+        matcher.add(2, 'SUBSCRIBE_SYMBOLS', 'EURUSD', subscribe)
+        matcher.add(3, 'OPEN_ORDER', 'GBPUSD,buy,0.01', second)
+
+        message = {'type': 'INFO', 'message': 'Successfully sent order 1001: EURUSD, buy, 0.01'}
+        self.assertEqual(matcher.match(message).command_id, 1)
+        self.assertEqual(first.result(0), message)
+        self.assertFalse(second.done())
+
+        error = {'type': 'ERROR', 'error_type': 'OPEN_ORDER_LOTSIZE_TOO_SMALL'}
+        self.assertEqual(matcher.match(error).command_id, 3)
+        self.assertEqual(second.result(0), error)
+        self.assertEqual(matcher.num_pending(), 1)
+
+    """The more specific rule decides, and messages of unknown commands
+    are not matched.
+    """
+
+    def test_rules(self):
+
+        matcher = ack_matcher()
+        self.assertEqual(matcher.command_of({'type': 'INFO', 'message': 'Successfully subscribed to bar data: EURUSD_M1'}),
+                         'SUBSCRIBE_SYMBOLS_BAR_DATA')
+        self.assertEqual(matcher.command_of({'type': 'ERROR', 'error_type': 'CLOSE_ORDER_ALL'}),
+                         'CLOSE_ALL_ORDERS')
+        self.assertIsNone(matcher.match({'type': 'INFO', 'message': 'Successfully closed order 1: x'}))
+        self.assertFalse(matcher.expects_ack('GET_HISTORIC_DATA'))
+
+    """A message naming a ticket goes to the command for that ticket.
+    """
+
+    def test_ticket(self):
+
+        matcher = ack_matcher()
+        matcher.add(1, 'CLOSE_ORDER', '1001,0')
+        matcher.add(2, 'CLOSE_ORDER', '1002,0')
+
+        pending = matcher.match({'type': 'INFO', 'message': 'Successfully closed order 1002: EURUSD, buy, 0.01'})
+        self.assertEqual(pending.command_id, 2)
+
+    def test_timeout(self):
+
+        matcher = ack_matcher(timeout=0)
+        future = Future()
+        matcher.add(1, 'MODIFY_ORDER', '1001,0,0,0,0', future)
+        sleep(0.01)
+        matcher.expire()
+
+        self.assertIsInstance(future.exception(0), TimeoutError)
+        self.assertEqual(matcher.num_pending(), 0)
+
+
+class TestCommandLatency(unittest.TestCase):
+
+    def test_percentiles(self):
+
+        latency = command_latency(max_samples=100)
+        for i in range(200):
+            latency.record('OPEN_ORDER', i / 1000)
+
+        stats = latency.get_stats()['OPEN_ORDER']
+        # the percentiles are computed from the last 100 values.
+        self.assertEqual(stats['count'], 200)
+        self.assertAlmostEqual(stats['p50'], 150)
+        self.assertAlmostEqual(stats['p99'], 199)
+        self.assertAlmostEqual(stats['max'], 199)
+
+    def test_command_answered(self):
+
+        latency = command_latency()
+        pending = ack_matcher().add(1, 'MODIFY_ORDER', '1001,0,0,0,0')
+        pending.written_time -= 0.2
+        latency.command_answered(pending)
+
+        stats = latency.get_stats()
+        self.assertEqual(list(stats), ['MODIFY_ORDER'])
+        self.assertGreaterEqual(stats['MODIFY_ORDER']['p50'], 200)
+
+    """The time until a new order is in the orders file is measured if
+    the answer is read before or after the orders file.
+    """
+
+    def test_orders_seen(self):
+
+        latency = command_latency()
+        matcher = ack_matcher()
+
+        answered_first = matcher.add(1, 'OPEN_ORDER', 'EURUSD,buy,0.01')
+        latency.command_answered(answered_first, '1001')
+        latency.orders_seen(['1001'])
+
+        seen_first = matcher.add(2, 'OPEN_ORDER', 'EURUSD,buy,0.01')
+        latency.orders_seen(['1001', '1002'])
+        latency.command_answered(seen_first, '1002')
+
+        # an order that was not opened with a command is not counted.
+        latency.orders_seen(['1003'])
+
+        stats = latency.get_stats()
+        self.assertEqual(stats['OPEN_ORDER']['count'], 2)
+        self.assertEqual(stats['OPEN_ORDER' + ORDERS_SUFFIX]['count'], 2)
+
+
+class TestCommandSlots(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.prefix = join(self.directory, 'DWX_Commands_')
+        self.slots = command_slots(self.prefix, 5)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    """Acquires a slot and writes its file like write_command_file().
+    """
+
+    def write(self):
+
+        i = self.slots.acquire()
+        if i is not None:
+            with open(f'{self.prefix}{i}.txt', 'w') as f:
+                f.write('<:1|GET_ORDERS|:>')
+        return i
+
+    def remove(self, i):
+
+        os.remove(f'{self.prefix}{i}.txt')
+
+    """The mql side stops at the first missing file, so the lowest free
+    file is used first, also after files were read out of order.
+    """
+
+    def test_fill_without_gaps(self):
+
+        self.assertEqual([self.write() for _ in range(3)], [0, 1, 2])
+        self.remove(1)
+        self.remove(0)
+        self.assertEqual([self.write() for _ in range(3)], [0, 1, 3])
+        self.assertEqual(self.write(), 4)
+        self.assertIsNone(self.write())
+
+    """Files that exist before the client starts are not overwritten.
+    """
+
+    def test_existing_files(self):
+
+        for i in [0, 2]:
+            with open(f'{self.prefix}{i}.txt', 'w') as f:
+                f.write('')
+        self.slots = command_slots(self.prefix, 5)
+        self.assertEqual([self.write(), self.write()], [1, 3])
+
+    """With removal events the cached state is used without scanning the
+    directory, a removed file is handed out again first.
+    """
+
+    def test_removal_events(self):
+
+        self.slots.track_removals = True
+        num_scans = self.slots.num_scans
+        self.assertEqual([self.write() for _ in range(3)], [0, 1, 2])
+
+        self.remove(1)
+        self.slots.on_file_event('DWX_Commands_1.txt', IN_DELETE)
+        self.assertEqual(self.write(), 1)
+        self.assertEqual(self.slots.num_scans, num_scans)
+        self.assertEqual(self.slots.num_used(), 3)
+
+
+class TestEventQueue(unittest.TestCase):
+
+    def test_conflate(self):
+
+        queue = event_queue(10)
+        self.assertEqual(queue.put('tick', 'EURUSD', (1,), 'conflate'), 'queued')
+        self.assertEqual(queue.put('tick', 'GBPUSD', (2,), 'conflate'), 'queued')
+        self.assertEqual(queue.put('tick', 'EURUSD', (3,), 'conflate'), 'conflated')
+
+        # the newer event keeps the position of the queued one.
+        self.assertEqual(queue.get(0), ('tick', (3,)))
+        self.assertEqual(queue.get(0), ('tick', (2,)))
+        self.assertIsNone(queue.get(0))
+
+    def test_drop_oldest(self):
+
+        queue = event_queue(2)
+        for i in range(3):
+            result = queue.put('message', None, (i,), 'drop_oldest')
+        self.assertEqual(result, 'dropped')
+
+        self.assertEqual(queue.get(0), ('message', (1,)))
+        self.assertEqual(queue.get(0), ('message', (2,)))
+
+    """A full lane only drops events of its own type, and the events
+    of all lanes are returned in the order they were added.
+    """
+
+    def test_lanes(self):
+
+        queue = event_queue(1)
+        queue.put('bar_data', ('EURUSD', 'M1'), (1,), 'block')
+        queue.put('tick', 'EURUSD', (2,), 'drop_oldest')
+        self.assertEqual(queue.put('tick', 'EURUSD', (3,), 'drop_oldest'), 'dropped')
+
+        self.assertEqual(queue.qsize(), 2)
+        self.assertEqual(queue.get(0), ('bar_data', (1,)))
+        self.assertEqual(queue.get(0), ('tick', (3,)))
+
+    """close() wakes up a put() that blocks on a full lane.
+    """
+
+    def test_block_close(self):
+
+        queue = event_queue(1)
+        queue.put('bar_data', None, (1,), 'block')
+
+        thread = Thread(target=queue.put, args=('bar_data', None, (2,), 'block'))
+        thread.start()
+        sleep(0.1)
+        self.assertTrue(thread.is_alive())
+
+        queue.close()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+
+class TestBarAggregator(unittest.TestCase):
+
+    """Collects the closed bars.
+    """
+
+    class bar_collector():
+
+        def __init__(self):
+            self.bars = []
+
+        def on_bar_data(self, *bar):
+            self.bars.append(bar)
+
+    """add_ticks() builds the same bars as add_tick() for each tick.
+    """
+
+    def test_add_ticks_like_add_tick(self):
+
+        time_frames = ['S10', 'M1', 'H1', 'W1']
+        single = self.bar_collector()
+        vectorized = self.bar_collector()
+        aggregator = bar_aggregator(single, time_frames, time_offset=7200)
+        vectorized_aggregator = bar_aggregator(vectorized, time_frames, time_offset=7200)
+
+        random_state = np.random.RandomState(1)
+        start = datetime(2024, 1, 10, tzinfo=timezone.utc).timestamp()
+        times = np.sort(start + random_state.uniform(0, 10 * 86400, 2000))
+        prices = 1.1 + random_state.normal(0, 0.001, 2000).cumsum()
+
+        for timestamp, price in zip(times, prices):
+            aggregator.add_tick('EURUSD', price, timestamp)
+        # in two parts, so that the second one continues the open bars.
+        vectorized_aggregator.add_ticks('EURUSD', times[:1000], prices[:1000])
+        vectorized_aggregator.add_ticks('EURUSD', times[1000:], prices[1000:])
+
+        self.assertGreater(len(single.bars), 0)
+        self.assertEqual(sorted(single.bars), sorted(vectorized.bars))
+        for time_frame in time_frames:
+            self.assertEqual(aggregator.current_bar('EURUSD', time_frame),
+                             vectorized_aggregator.current_bar('EURUSD', time_frame))
+
+    """Daily and weekly bars start at midnight server time, weeks on
+    Sunday.
+    """
+
+    def test_server_time(self):
+
+        aggregator = bar_aggregator(None, ['D1', 'W1'], time_offset=7200)
+        # Wednesday 2024.01.10 23:00 UTC is Thursday 01:00 server time.
+        aggregator.add_tick('EURUSD', 1.1, datetime(2024, 1, 10, 23, tzinfo=timezone.utc).timestamp())
+
+        self.assertEqual(aggregator.current_bar('EURUSD', 'D1')['time'], '2024.01.11 00:00')
+        self.assertEqual(aggregator.current_bar('EURUSD', 'W1')['time'], '2024.01.07 00:00')
+
+    """close_due_bars() closes the bars of a symbol without new ticks.
+    """
+
+    def test_close_due_bars(self):
+
+        collector = self.bar_collector()
+        aggregator = bar_aggregator(collector, ['M1', 'H1'])
+        start = datetime(2024, 1, 10, 12, tzinfo=timezone.utc).timestamp()
+        aggregator.add_tick('EURUSD', 1.1, start + 10)
+        aggregator.add_tick('EURUSD', 1.2, start + 20)
+
+        aggregator.close_due_bars(start + 59)
+        self.assertEqual(collector.bars, [])
+
+        aggregator.close_due_bars(start + 60)
+        self.assertEqual(collector.bars, [('EURUSD', 'M1', '2024.01.10 12:00', 1.1, 1.2, 1.1, 1.2, 2)])
+        self.assertIsNone(aggregator.current_bar('EURUSD', 'M1'))
+        self.assertIsNotNone(aggregator.current_bar('EURUSD', 'H1'))
+
+        # the next tick opens a new bar without closing the old one again.
+        aggregator.add_tick('EURUSD', 1.3, start + 70)
+        self.assertEqual(len(collector.bars), 1)
+        self.assertEqual(aggregator.current_bar('EURUSD', 'M1')['time'], '2024.01.10 12:01')
+
+    """The close thread closes the bars with the current time.
+    """
+
+    def test_close_thread(self):
+
+        collector = self.bar_collector()
+        aggregator = bar_aggregator(collector, ['S1'], close_interval=0.05)
+        aggregator.add_tick('EURUSD', 1.1, time() - 5)
+        sleep(0.5)
+        aggregator.close()
+        aggregator.close_thread.join(1)
+
+        self.assertFalse(aggregator.close_thread.is_alive())
+        self.assertEqual(len(collector.bars), 1)
+
+
+class TestWireFormat(unittest.TestCase):
+
+    """Decodes a tick frame like the decoder of templates/index.html.
+    Returns the room and the ticks as (symbol, time, bid, ask).
+    """
+
+    def decode_ticks(self, data, names, last_prices):
+
+        _, room_id, num_ticks, base_time = FRAME_HEADER.unpack_from(data, 0)
+        room = names[room_id]
+        prices = last_prices.setdefault(room, {})
+        offset = FRAME_HEADER.size
+
+        ticks = []
+        for _ in range(num_ticks):
+            symbol_id, flags, offset_ms = TICK_HEAD.unpack_from(data, offset)
+            offset += TICK_HEAD.size
+            symbol = names[symbol_id]
+            if flags & DELTA:
+                bid_change, ask_change = TICK_DELTA.unpack_from(data, offset)
+                offset += TICK_DELTA.size
+                bid = prices[symbol][0] + bid_change * PRICE_UNIT
+                ask = prices[symbol][1] + ask_change * PRICE_UNIT
+            else:
+                bid, ask = TICK_ABSOLUTE.unpack_from(data, offset)
+                offset += TICK_ABSOLUTE.size
+            prices[symbol] = (bid, ask)
+            ticks.append((symbol, base_time + offset_ms / 1000, bid, ask))
+
+        self.assertEqual(offset, len(data))
+        return room, ticks
+
+    def test_tick_round_trip(self):
+
+        encoder = BinaryEncoder()
+        last_prices = {}
+        start = datetime(2024, 1, 10, tzinfo=timezone.utc).timestamp()
+
+        frames = [[{'symbol': 'EURUSD', 'bid': 1.10001, 'ask': 1.10003, 'timestamp': start},
+                   {'symbol': 'USDJPY', 'bid': 145.123, 'ask': 145.131, 'timestamp': start + 0.25}],
+                  [{'symbol': 'EURUSD', 'bid': 1.10002, 'ask': 1.10004,
+                    'timestamp': datetime.fromtimestamp(start + 1, timezone.utc).isoformat()},
+                   # not a whole number of price units, sent as absolute prices.
+                   {'symbol': 'USDJPY', 'bid': 145.1234567, 'ask': 145.14, 'timestamp': start + 1.5}]]
+
+        for ticks in frames:
+            data = encoder.encode_ticks('bin:tick_room', ticks)
+            room, decoded = self.decode_ticks(data, encoder.names, last_prices)
+            self.assertEqual(room, 'bin:tick_room')
+            for tick_data, (symbol, timestamp, bid, ask) in zip(ticks, decoded):
+                self.assertEqual(symbol, tick_data['symbol'])
+                self.assertAlmostEqual(timestamp, tick_time(tick_data), 3)
+                self.assertAlmostEqual(bid, tick_data['bid'], 9)
+                self.assertAlmostEqual(ask, tick_data['ask'], 9)
+
+        # EURUSD of the second frame was sent as change.
+        self.assertEqual(encoder.delta_ticks, 1)
+
+    def test_bar_round_trip(self):
+
+        encoder = BinaryEncoder()
+        bar_data = {'symbol': 'EURUSD', 'timeframe': 'M1', 'time': '2024.01.10 12:00',
+                    'open': 1.1, 'high': 1.2, 'low': 1.0, 'close': 1.15, 'volume': 42}
+
+        data = encoder.encode_bar(bar_data)
+        _, symbol_id, timeframe_id, open_price, high, low, close_price, volume = BAR.unpack_from(data, 0)
+        length = data[BAR.size]
+        bar_time = data[BAR.size + 1:BAR.size + 1 + length].decode('ascii')
+
+        self.assertEqual(encoder.names[symbol_id], 'EURUSD')
+        self.assertEqual(encoder.names[timeframe_id], 'M1')
+        self.assertEqual((open_price, high, low, close_price, volume), (1.1, 1.2, 1.0, 1.15, 42))
+        self.assertEqual(bar_time, '2024.01.10 12:00')
+        self.assertEqual(len(data), BAR.size + 1 + length)
+
+    """on_new_names is called without the lock of the encoder, once per
+    new table and before the data is returned. It may use the encoder.
+    """
+
+    def test_new_names_callback(self):
+
+        tables = []
+
+        def on_new_names(names):
+            tables.append(names)
+            encoder.get_stats()
+            encoder.encode_bar(bar_data)
+
+        encoder = BinaryEncoder(on_new_names)
+        bar_data = {'symbol': 'EURUSD', 'timeframe': 'M1', 'time': '2024.01.10 12:00',
+                    'open': 1.1, 'high': 1.2, 'low': 1.0, 'close': 1.15}
+
+        thread = Thread(target=encoder.encode_bar, args=(bar_data,))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(tables, [['EURUSD', 'M1']])
+
+        encoder.encode_bar(bar_data)
+        encoder.encode_ticks('all', [{'symbol': 'EURUSD', 'bid': 1.1, 'ask': 1.2}])
+        self.assertEqual(tables, [['EURUSD', 'M1'], ['EURUSD', 'M1', 'all']])
+
+class TestTickHistory(unittest.TestCase):
+
+    """After the write position wrapped around, the last ticks are
+    still one contiguous view in order.
+    """
+
+    def test_wraparound(self):
+
+        history = tick_history(capacity=5)
+        for i in range(13):
+            history.add('EURUSD', 1. + i, 2. + i, timestamp=100. + i)
+
+            times, bids, asks = history.last('EURUSD', 5)
+            expected = [100. + j for j in range(max(0, i - 4), i + 1)]
+            self.assertEqual(times.tolist(), expected)
+            self.assertEqual((bids - 1.).tolist(), [t - 100. for t in expected])
+
+        self.assertEqual(history.num_ticks('EURUSD'), 5)
+        self.assertEqual(history.last('EURUSD', 100)[0].tolist(), [108., 109., 110., 111., 112.])
+        self.assertEqual(history.last('EURUSD', 2)[2].tolist(), [13., 14.])
+        # a view, not a copy.
+        self.assertIsNotNone(times.base)
+
+    def test_last_seconds(self):
+
+        history = tick_history(capacity=10)
+        now = time()
+        for seconds in [30, 20, 10, 5, 1]:
+            history.add('EURUSD', 1.1, 1.2, timestamp=now - seconds)
+
+        self.assertEqual(len(history.last_seconds('EURUSD', 15)[0]), 3)
+        self.assertEqual(len(history.last_seconds('GBPUSD', 15)[0]), 0)
+
+
+class TestTickRecorder(unittest.TestCase):
+
+    class tick_collector():
+
+        def __init__(self):
+            self.ticks = []
+
+        def on_tick(self, symbol, bid, ask):
+            self.ticks.append((symbol, bid, ask))
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    """Ticks over midnight go to the files of both days and are read back
+    with read_day() and read_range().
+    """
+
+    def test_round_trip(self):
+
+        midnight = datetime(2024, 1, 11, tzinfo=timezone.utc).timestamp()
+        times = [midnight - 2, midnight - 1, midnight, midnight + 1]
+
+        recorder = tick_recorder(self.directory)
+        for i, timestamp in enumerate(times):
+            recorder.record('EURUSD', 1.1 + i, 1.2 + i, timestamp)
+        recorder.flush()
+
+        reader = tick_reader(self.directory)
+        self.assertEqual(reader.symbols(), ['EURUSD'])
+        self.assertEqual([day.isoformat() for day in reader.days('EURUSD')],
+                         ['2024-01-10', '2024-01-11'])
+
+        day = reader.read_day('EURUSD', datetime(2024, 1, 10).date())
+        self.assertEqual(day['time'].tolist(), times[:2])
+        self.assertEqual(day['bid'].tolist(), [1.1, 2.1])
+
+        ticks = reader.read_range('EURUSD', midnight - 1, midnight + 1)
+        self.assertEqual(ticks['time'].tolist(), times[1:3])
+        self.assertEqual(ticks['ask'].tolist(), [2.2, 3.2])
+        self.assertEqual(len(reader.read_range('GBPUSD', midnight - 1, midnight + 1)), 0)
+        recorder.close()
+
+    """A tick that was not written completely is cut off when the file is
+    opened again.
+    """
+
+    def test_partial_tick(self):
+
+        timestamp = datetime(2024, 1, 10, 12, tzinfo=timezone.utc).timestamp()
+        recorder = tick_recorder(self.directory)
+        recorder.record('EURUSD', 1.1, 1.2, timestamp)
+        recorder.close()
+
+        path = tick_file_path(self.directory, 'EURUSD', datetime(2024, 1, 10))
+        with open(path, 'ab') as f:
+            f.write(b'\0' * 10)
+
+        recorder = tick_recorder(self.directory)
+        recorder.record('EURUSD', 1.3, 1.4, timestamp + 1)
+        recorder.close()
+
+        ticks = tick_reader(self.directory).read_day('EURUSD', datetime(2024, 1, 10).date())
+        self.assertEqual(ticks['bid'].tolist(), [1.1, 1.3])
+
+    def test_passes_ticks_on(self):
+
+        collector = self.tick_collector()
+        recorder = tick_recorder(self.directory, collector)
+        recorder.on_tick('EURUSD', 1.1, 1.2)
+        recorder.close()
+
+        self.assertEqual(collector.ticks, [('EURUSD', 1.1, 1.2)])
+        self.assertEqual(recorder.num_ticks, 1)
+
+
+class TestReadFileIfChanged(unittest.TestCase):
+
+    """Creates a dwx_client for an empty DWX directory and counts the
+    reads of a test file.
+    """
+
+    def setUp(self):
+
+        self.MT4_directory_path = tempfile.mkdtemp(prefix='dwx_files_')
+        os.makedirs(join(self.MT4_directory_path, 'DWX'))
+        self.dwx = dwx_client(None, self.MT4_directory_path, verbose=False,
+                              racy_stat_seconds=2)
+        self.path = join(self.MT4_directory_path, 'DWX', 'test.txt')
+
+        self.num_reads = 0
+        try_read_file = self.dwx.try_read_file
+
+        def counting_read(file_path):
+            self.num_reads += 1
+            return try_read_file(file_path)
+
+        self.dwx.try_read_file = counting_read
+
+    def tearDown(self):
+
+        self.dwx.ACTIVE = False
+        sleep(0.1)
+        shutil.rmtree(self.MT4_directory_path, ignore_errors=True)
+
+    """Writes the file and sets its modification time.
+    """
+
+    def write(self, text, mtime_ns):
+
+        with open(self.path, 'w') as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    """The stat is trusted if the file was modified well before the
+    last read.
+    """
+
+    def test_unchanged_stat_is_not_read(self):
+
+        self.write('{"a": 1.10001}', time_ns() - 10_000_000_000)
+
+        self.assertEqual(self.dwx.read_file_if_changed(self.path), '{"a": 1.10001}')
+        self.assertIsNone(self.dwx.read_file_if_changed(self.path))
+        self.assertEqual(self.num_reads, 1)
+
+    """A rewrite with the same size inside the timestamp resolution
+    does not change the stat, it is found by the hash.
+    """
+
+    def test_same_size_rewrite_in_racy_window(self):
+
+        mtime_ns = time_ns()
+        self.write('{"a": 1.10001}', mtime_ns)
+        self.assertEqual(self.dwx.read_file_if_changed(self.path), '{"a": 1.10001}')
+
+        # longer than the polling delay, shorter than racy_stat_seconds.
+        sleep(0.1)
+        self.assertIsNone(self.dwx.read_file_if_changed(self.path))
+        self.write('{"a": 1.10002}', mtime_ns)
+        self.assertEqual(self.dwx.read_file_if_changed(self.path), '{"a": 1.10002}')
+        self.assertEqual(self.num_reads, 3)
+
+    """A new modification time or size causes a read, but the text is
+    only returned if its hash changed.
+    """
+
+    def test_changed_stat(self):
+
+        mtime_ns = time_ns() - 10_000_000_000
+        self.write('{"a": 1.1}', mtime_ns)
+        self.assertEqual(self.dwx.read_file_if_changed(self.path), '{"a": 1.1}')
+
+        self.write('{"a": 1.1}', mtime_ns + 1_000_000_000)
+        self.assertIsNone(self.dwx.read_file_if_changed(self.path))
+
+        self.write('{"a": 1.12}', mtime_ns + 2_000_000_000)
+        self.assertEqual(self.dwx.read_file_if_changed(self.path), '{"a": 1.12}')
+        self.assertEqual(self.num_reads, 3)
+
+    def test_missing_and_empty_file(self):
+
+        self.assertIsNone(self.dwx.read_file_if_changed(self.path))
+        self.write('', time_ns())
+        self.assertIsNone(self.dwx.read_file_if_changed(self.path))
+
+
+class TestTickBus(unittest.TestCase):
+
+    def setUp(self):
+
+        self.name = f'dwx_test_bus_{os.getpid()}'
+        self.bus = tick_bus(None, self.name, capacity=8, max_symbols=4, replace=True)
+
+    def tearDown(self):
+
+        self.bus.close()
+
+    def test_read(self):
+
+        reader = tick_bus_reader(self.name)
+        self.bus.publish('EURUSD', 1.1, 1.2, timestamp=1.)
+        self.bus.publish('GBPUSD', 1.3, 1.4, timestamp=2.)
+
+        ticks = reader.read()
+        self.assertEqual([reader.symbol(symbol_id) for symbol_id in ticks['symbol_id']],
+                         ['EURUSD', 'GBPUSD'])
+        self.assertEqual(ticks['bid'].tolist(), [1.1, 1.3])
+        self.assertEqual(ticks['ask'].tolist(), [1.2, 1.4])
+        self.assertEqual(ticks['time'].tolist(), [1., 2.])
+        self.assertEqual(len(reader.read()), 0)
+
+        self.bus.publish('EURUSD', 1.15, 1.25)
+        self.assertEqual(reader.read(max_ticks=5)['bid'].tolist(), [1.15])
+        reader.close()
+
+    """A reader that is more than capacity ticks behind gets the newest
+    ticks and counts the lost ones.
+    """
+
+    def test_lost_ticks(self):
+
+        reader = tick_bus_reader(self.name)
+        for i in range(20):
+            self.bus.publish('EURUSD', i, i + 1)
+
+        ticks = reader.read(max_ticks=3)
+        self.assertEqual(ticks['bid'].tolist(), [12., 13., 14.])
+        self.assertEqual(reader.num_lost, 12)
+        self.assertEqual(reader.read()['bid'].tolist(), [15., 16., 17., 18., 19.])
+        reader.close()
+
+    def test_from_start(self):
+
+        for i in range(3):
+            self.bus.publish('EURUSD', i, i + 1)
+
+        reader = tick_bus_reader(self.name, from_start=True)
+        self.assertEqual(reader.read()['bid'].tolist(), [0., 1., 2.])
+        reader.close()
+
+    """A second writer does not take over the bus of a running one.
+    """
+
+    def test_existing_bus(self):
+
+        with self.assertRaises(FileExistsError):
+            tick_bus(None, self.name)
+
+    def test_full_symbol_table(self):
+
+        for i in range(4):
+            self.bus.publish(f'SYM{i}', 1., 1.)
+        with self.assertRaises(ValueError):
+            self.bus.add_symbol('SYM4')
+
+
+class TestTerminalPool(unittest.TestCase):
+
+    """Stands in for the dwx_client of a worker process.
+    """
+
+    class client():
+
+        def get_future(self):
+            future = Future()
+            future.set_result({'ticket': 1})
+            return future
+
+        def get_lock(self):
+            return Lock()
+
+    def call(self, function_name):
+
+        outbox = []
+        run_call({'demo': self.client()}, outbox, Lock(), (1, 'demo', function_name, (), {}))
+        event_type, terminal_id, _, (call_id, result, error) = outbox[0]
+        self.assertEqual((event_type, terminal_id, call_id), ('result', 'demo', 1))
+        return result, error
+
+    """A Future is replaced by its result.
+    """
+
+    def test_future_result(self):
+
+        self.assertEqual(self.call('get_future'), ({'ticket': 1}, None))
+
+    """A result that cannot be pickled is sent as error.
+    """
+
+    def test_unpicklable_result(self):
+
+        result, error = self.call('get_lock')
+        self.assertIsNone(result)
+        self.assertIn('pickle', error)
+
+
+class TestIngest(unittest.TestCase):
+
+    records = [{'type': 'tick', 'symbol': 'EURUSD', 'bid': 1.1, 'ask': 1.2},
+               {'symbol': 'EURUSD', 'timeframe': 'M1', 'time': '2024.01.10 12:00',
+                'open': 1.1, 'high': 1.2, 'low': 1.0, 'close': 1.1}]
+
+    def test_parse_json(self):
+
+        body = json.dumps(self.records).encode()
+        self.assertEqual(parse_batch(body, 'application/json'), self.records)
+        body = json.dumps({'records': self.records}).encode()
+        self.assertEqual(parse_batch(body, 'application/json'), self.records)
+
+    """NDJSON is detected without its content type, also if the lines
+    start with '{' like a JSON object.
+    """
+
+    def test_parse_ndjson(self):
+
+        body = '\n'.join(json.dumps(record) for record in self.records).encode() + b'\n'
+        self.assertEqual(parse_batch(body, 'application/x-ndjson'), self.records)
+        self.assertEqual(parse_batch(body, 'application/json'), self.records)
+        self.assertEqual(parse_batch(body[:body.index(b'\n')], ''), self.records[:1])
+
+    """Invalid records are rejected without dropping the valid ones.
+    """
+
+    def test_ingest_records(self):
+
+        records = self.records + [{'type': 'tick', 'symbol': 'GBPUSD', 'bid': '1.2', 'ask': 1.3},
+                                  {'type': 'quote'}]
+        result = ingest_records(records)
+
+        self.assertEqual((result['accepted'], result['accepted_ticks'], result['accepted_bars'],
+                          result['rejected']), (2, 1, 1, 2))
+        self.assertEqual([error['index'] for error in result['errors']], [2, 3])
+        self.assertEqual(result['errors'][0]['error'], 'Field bid must be a number')
+
+class TestSnapshotResponse(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = {'EURUSD': {'bid': 1.1, 'ask': 1.2}}
+        self.lock = Lock()
+        self.snapshot = DataSnapshot('test', lambda: dict(self.data), self.lock)
+
+    def get(self, headers={}):
+
+        with app.test_request_context('/api/tick-data', headers=headers):
+            return snapshot_response(self.snapshot)
+
+    """The JSON is only built again after the cache changed, a matching
+    If-None-Match gets a 304 without body.
+    """
+
+    def test_etag(self):
+
+        response = self.get()
+        etag = response.headers['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_data()), self.data)
+
+        response = self.get({'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual((self.snapshot.builds, self.snapshot.not_modified), (1, 1))
+
+        with self.lock:
+            self.data['GBPUSD'] = {'bid': 1.3, 'ask': 1.4}
+            self.snapshot.changed()
+
+        response = self.get({'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn('GBPUSD', json.loads(response.get_data()))
+        self.assertEqual(self.snapshot.builds, 2)
+
+    """The gzip body has its own ETag, so a cache does not answer a
+    client without gzip with it.
+    """
+
+    def test_gzip(self):
+
+        plain = self.get()
+        response = self.get({'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.get_data()), plain.get_data())
+        self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+
+        self.assertEqual(self.get({'If-None-Match': plain.headers['ETag'],
+                                   'Accept-Encoding': 'gzip'}).status_code, 200)
+        self.assertEqual(self.get({'If-None-Match': response.headers['ETag'],
+                                   'Accept-Encoding': 'gzip'}).status_code, 304)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,20 +1,23 @@
 #!/usr/bin/env python3
 
 import json
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import threading
 import time
 from datetime import datetime, timezone
 import os
 from pathlib import Path
+from wire_format import BinaryEncoder
+from snapshot_cache import DataSnapshot, RawJSON, SnapshotJSON
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dwx_tick_data_secret'
 
 # Explicitly configure SocketIO for gevent
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent')
+# (SnapshotJSON sends the cached snapshots on connect without serializing them again)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent', json=SnapshotJSON)
 
 # Global variables for storing tick data
 tick_data_cache = {}
@@ -22,10 +25,121 @@ bar_data_cache = {}
 connected_clients = set()
 data_lock = threading.Lock()
 
+# Serialized snapshots of the caches, rebuilt only after a change
+tick_snapshot = DataSnapshot('ticks', lambda: dict(tick_data_cache), data_lock)
+bar_snapshot = DataSnapshot('bars', lambda: {symbol: {timeframe: list(bars) for timeframe, bars in timeframes.items()}
+                                             for symbol, timeframes in bar_data_cache.items()}, data_lock)
+
+# Members of the Socket.IO rooms, so that nothing is sent to empty rooms
+room_members = {}
+client_rooms = {}
+rooms_lock = threading.Lock()
+rooms_version = 0
+
+# Clients that get the binary wire format, they are in the rooms with this prefix
+BINARY_PREFIX = 'bin:'
+BINARY_ROOM = 'binary_clients'
+binary_clients = set()
+
+# Ticks per second and symbol sent to the browsers as 'tick_frame'. The default 0
+# sends every tick as 'tick_data' like before, so existing clients keep working
+TICK_FRAME_RATE = float(os.getenv('TICK_FRAME_RATE', 0))
+
+TICK_ROOM_PREFIX = 'tick:'
+
+def tick_room_of(symbol):
+    """Room of the clients that subscribed to the ticks of one symbol"""
+    return f'{TICK_ROOM_PREFIX}{symbol}'
+
+def tick_group_room(symbols):
+    """Name of the binary price state of the clients that subscribed to exactly these symbols"""
+    if len(symbols) == 1:
+        return BINARY_PREFIX + tick_room_of(next(iter(symbols)))
+    return BINARY_PREFIX + TICK_ROOM_PREFIX + ','.join(sorted(symbols))
+
+def bar_room_of(symbol, timeframe):
+    """Room of the clients that subscribed to the bars of one symbol and timeframe"""
+    return f'bar:{symbol}:{timeframe}'
+
+def has_members(room):
+    return bool(room_members.get(room))
+
+def add_room_member(sid, room):
+    global rooms_version
+    with rooms_lock:
+        rooms_version += 1
+        room_members.setdefault(room, set()).add(sid)
+        client_rooms.setdefault(sid, set()).add(room)
+
+def remove_room_member(sid, room):
+    global rooms_version
+    with rooms_lock:
+        rooms_version += 1
+        members = room_members.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del room_members[room]
+        rooms = client_rooms.get(sid)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                del client_rooms[sid]
+
+def emit_to_rooms(event, data, rooms, encode=None):
+    """
+    Emit once to the members of the rooms, so a client in several of them
+    gets the event once. encode() gives the data for the binary rooms.
+    """
+    json_rooms = [room for room in rooms if has_members(room)]
+    if json_rooms:
+        socketio.emit(event, data, room=json_rooms)
+    if encode is not None:
+        binary_rooms = [BINARY_PREFIX + room for room in rooms if has_members(BINARY_PREFIX + room)]
+        if binary_rooms:
+            socketio.emit(event + '_bin', encode(), room=binary_rooms)
+
+def emit_symbol_table(names):
+    """Send the name table to the binary clients when a name was added"""
+    if has_members(BINARY_ROOM):
+        socketio.emit('symbol_table', {'names': names}, room=BINARY_ROOM)
+
+binary_encoder = BinaryEncoder(on_new_names=emit_symbol_table)
+
+def stream_room(room):
+    """The room of the current client, in the binary rooms if it chose the binary format"""
+    if request.sid in binary_clients:
+        return BINARY_PREFIX + room
+    return room
+
+def join_stream_room(room):
+    room = stream_room(room)
+    join_room(room)
+    add_room_member(request.sid, room)
+    if room.startswith(BINARY_PREFIX):
+        # The new member has no previous prices to apply changes to
+        binary_encoder.reset(room)
+
+def leave_stream_room(room):
+    room = stream_room(room)
+    leave_room(room)
+    remove_room_member(request.sid, room)
+
 class TickDataStreamer:
-    def __init__(self):
+    def __init__(self, tick_frame_rate=TICK_FRAME_RATE):
         self.tick_subscribers = []
         self.bar_subscribers = []
+        self.command_latency_source = None
+        
+        # Latest tick per symbol since the last 'tick_frame'
+        self.tick_frame_rate = tick_frame_rate
+        self.pending_ticks = {}
+        self.pending_lock = threading.Lock()
+        self.tick_frames_started = None
+        self.tick_frame_stats = {'frames': 0, 'ticks_in': 0, 'ticks_sent': 0, 'coalesced': 0}
+        
+        # (rooms_version, {(binary, symbols): sids}) of the clients of the symbol rooms
+        self.tick_groups = (-1, {})
         
     def add_tick_subscriber(self, callback):
         self.tick_subscribers.append(callback)
@@ -33,6 +147,10 @@ class TickDataStreamer:
     def add_bar_subscriber(self, callback):
         self.bar_subscribers.append(callback)
         
+    def set_command_latency_source(self, callback):
+        """Set the function that returns the command latency stats (e.g. dwx_client.get_command_latency)"""
+        self.command_latency_source = callback
+        
     def emit_tick(self, symbol, bid, ask, timestamp=None):
         if timestamp is None:
             timestamp = datetime.now(timezone.utc).isoformat()
@@ -48,9 +166,17 @@ class TickDataStreamer:
         # Store in cache
         with data_lock:
             tick_data_cache[symbol] = tick_data
+            tick_snapshot.changed()
             
-        # Emit to WebSocket clients
-        socketio.emit('tick_data', tick_data, room='tick_room')
+        # Emit to WebSocket clients, conflated into frames if enabled
+        if self.tick_frame_rate > 0:
+            with self.pending_lock:
+                self.tick_frame_stats['ticks_in'] += 1
+                if symbol in self.pending_ticks:
+                    self.tick_frame_stats['coalesced'] += 1
+                self.pending_ticks[symbol] = tick_data
+        else:
+            self.send_ticks('tick_data', [tick_data], lambda ticks: ticks[0])
         
         # Call subscribers
         for callback in self.tick_subscribers:
@@ -81,13 +207,20 @@ class TickDataStreamer:
             if timeframe not in bar_data_cache[symbol]:
                 bar_data_cache[symbol][timeframe] = []
             
-            bar_data_cache[symbol][timeframe].append(bar_data)
+            bars = bar_data_cache[symbol][timeframe]
+            # Updates of the current bar replace it instead of adding a bar
+            if bars and bars[-1]['time'] == time_bar:
+                bars[-1] = bar_data
+            else:
+                bars.append(bar_data)
             # Keep only last 100 bars per symbol/timeframe
             if len(bar_data_cache[symbol][timeframe]) > 100:
                 bar_data_cache[symbol][timeframe] = bar_data_cache[symbol][timeframe][-100:]
+            bar_snapshot.changed()
         
         # Emit to WebSocket clients
-        socketio.emit('bar_data', bar_data, room='bar_room')
+        emit_to_rooms('bar_data', bar_data, ['bar_room', bar_room_of(symbol, timeframe)],
+                      lambda: binary_encoder.encode_bar(bar_data))
         
         # Call subscribers
         for callback in self.bar_subscribers:
@@ -95,6 +228,96 @@ class TickDataStreamer:
                 callback(bar_data)
             except Exception as e:
                 print(f"Error in bar subscriber: {e}")
+    
+    def start_tick_frames(self):
+        """Start sending the batched 'tick_frame' events (must be called from the server, e.g. on connect)"""
+        if self.tick_frame_rate <= 0 or self.tick_frames_started is not None:
+            return
+        self.tick_frames_started = time.time()
+        socketio.start_background_task(self.run_tick_frames)
+    
+    def run_tick_frames(self):
+        """Send the latest tick of each symbol that changed as one 'tick_frame' event per interval"""
+        interval = 1.0 / self.tick_frame_rate
+        while True:
+            socketio.sleep(interval)
+            try:
+                self.flush_tick_frame()
+            except Exception as e:
+                print(f"Error sending tick frame: {e}")
+    
+    def flush_tick_frame(self):
+        with self.pending_lock:
+            if not self.pending_ticks:
+                return
+            ticks = list(self.pending_ticks.values())
+            self.pending_ticks = {}
+            self.tick_frame_stats['frames'] += 1
+            self.tick_frame_stats['ticks_sent'] += len(ticks)
+        
+        self.send_ticks('tick_frame', ticks, lambda ticks: {'ticks': ticks})
+    
+    def send_ticks(self, event, ticks, payload):
+        """
+        Send all ticks to 'tick_room' and the ticks of their symbols to the
+        clients of the symbol rooms, one event per client. payload(ticks)
+        gives the JSON data of the event.
+        """
+        emit_to_rooms(event, payload(ticks), ['tick_room'],
+                      lambda: binary_encoder.encode_ticks(BINARY_PREFIX + 'tick_room', ticks))
+        
+        for (binary, symbols), sids in self.client_tick_groups().items():
+            group_ticks = [tick_data for tick_data in ticks if tick_data['symbol'] in symbols]
+            if not group_ticks:
+                continue
+            if binary:
+                socketio.emit(event + '_bin', binary_encoder.encode_ticks(tick_group_room(symbols), group_ticks),
+                              room=sids)
+            else:
+                socketio.emit(event, payload(group_ticks), room=sids)
+    
+    def client_tick_groups(self):
+        """
+        Clients of the symbol rooms that are not in 'tick_room', grouped by
+        format and set of symbols: {(binary, symbols): sids}. Built again
+        only when a client joined or left a room.
+        """
+        with rooms_lock:
+            version = rooms_version
+            if self.tick_groups[0] == version:
+                return self.tick_groups[1]
+            
+            groups = {}
+            for sid, rooms in client_rooms.items():
+                prefix = BINARY_PREFIX if sid in binary_clients else ''
+                if prefix + 'tick_room' in rooms:
+                    continue
+                symbols = frozenset(room[len(prefix + TICK_ROOM_PREFIX):] for room in rooms
+                                    if room.startswith(prefix + TICK_ROOM_PREFIX))
+                if symbols:
+                    groups.setdefault((bool(prefix), symbols), []).append(sid)
+        
+        # Clients that are new in a binary group have no previous prices of it
+        previous = self.tick_groups[1]
+        for (binary, symbols), sids in groups.items():
+            if binary and not set(sids) <= set(previous.get((binary, symbols), ())):
+                binary_encoder.reset(tick_group_room(symbols))
+        
+        self.tick_groups = (version, groups)
+        return groups
+    
+    def get_tick_frame_stats(self):
+        """Frame rate and how many ticks were coalesced into the frames"""
+        with self.pending_lock:
+            stats = dict(self.tick_frame_stats)
+        stats['frame_rate'] = self.tick_frame_rate
+        if self.tick_frames_started is not None:
+            elapsed = time.time() - self.tick_frames_started
+            stats['frames_per_second'] = round(stats['frames'] / elapsed, 2) if elapsed > 0 else 0
+        if stats['ticks_sent'] > 0:
+            stats['ticks_per_frame'] = round(stats['ticks_sent'] / stats['frames'], 2)
+            stats['coalescing_ratio'] = round(stats['ticks_in'] / stats['ticks_sent'], 2)
+        return stats
 
 # Global streamer instance
 streamer = TickDataStreamer()
@@ -103,17 +326,43 @@ streamer = TickDataStreamer()
 def index():
     return render_template('index.html')
 
+def snapshot_response(snapshot):
+    """Cached JSON of a snapshot with ETag, 304 for If-None-Match and gzip if accepted"""
+    version, _, body = snapshot.get()
+    # The gzip and identity bodies differ, so each has its own ETag
+    gzipped = 'gzip' in request.accept_encodings
+    etag = snapshot.etag(version, gzipped)
+    
+    if request.if_none_match.contains(etag):
+        snapshot.not_modified += 1
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if gzipped:
+            response.set_data(snapshot.get_gzip(version, body))
+            response.headers['Content-Encoding'] = 'gzip'
+    
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/tick-data')
 def get_tick_data():
     """REST API endpoint to get current tick data"""
-    with data_lock:
-        return json.dumps(tick_data_cache)
+    return snapshot_response(tick_snapshot)
 
 @app.route('/api/bar-data')
 def get_bar_data():
     """REST API endpoint to get current bar data"""
-    with data_lock:
-        return json.dumps(bar_data_cache)
+    return snapshot_response(bar_snapshot)
+
+@app.route('/api/command-latency')
+def get_command_latency():
+    """REST API endpoint to get the MT4 command round-trip latency per command type"""
+    if streamer.command_latency_source is None:
+        return {}
+    return streamer.command_latency_source()
 
 @app.route('/health')
 def health():
@@ -123,30 +372,122 @@ def health():
         'timestamp': datetime.now(timezone.utc).isoformat(),
         'active_connections': len(connected_clients),
         'tick_data_count': len(tick_data_cache),
-        'bar_data_count': len(bar_data_cache)
+        'bar_data_count': len(bar_data_cache),
+        'tick_frames': streamer.get_tick_frame_stats(),
+        'rooms_with_members': len(room_members),
+        'binary_clients': len(binary_clients),
+        'binary_encoding': binary_encoder.get_stats(),
+        'ingest': dict(ingest_stats),
+        'snapshots': {'ticks': tick_snapshot.get_stats(), 'bars': bar_snapshot.get_stats()}
     }
 
-@app.route('/api/forward/tick', methods=['POST'])
-def receive_tick_data():
-    """API endpoint to receive tick data from local MT4 forwarder"""
-    try:
-        data = request.get_json()
-        if not data:
-            return {'error': 'No data provided'}, 400
-            
-        # Validate required fields
-        required_fields = ['symbol', 'bid', 'ask']
-        for field in required_fields:
-            if field not in data:
-                return {'error': f'Missing required field: {field}'}, 400
-        
-        # Use the streamer to emit the data
+TICK_FIELDS = ['symbol', 'bid', 'ask']
+BAR_FIELDS = ['symbol', 'timeframe', 'time', 'open', 'high', 'low', 'close']
+PRICE_FIELDS = ['bid', 'ask', 'open', 'high', 'low', 'close']
+
+# Records listed per rejected batch in the response
+MAX_REPORTED_ERRORS = 20
+
+ingest_stats = {'batches': 0, 'accepted': 0, 'rejected': 0}
+ingest_lock = threading.Lock()
+
+def validate_record(data, required_fields):
+    """Return the error message of an invalid tick or bar, or None"""
+    if not isinstance(data, dict) or not data:
+        return 'No data provided'
+    for field in required_fields:
+        if field not in data:
+            return f'Missing required field: {field}'
+    for field in PRICE_FIELDS:
+        if field in data and (not isinstance(data[field], (int, float)) or isinstance(data[field], bool)):
+            return f'Field {field} must be a number'
+    return None
+
+def ingest_tick(data):
+    """Validate a forwarded tick and emit it, return the error message or None"""
+    error = validate_record(data, TICK_FIELDS)
+    if error is None:
         streamer.emit_tick(
             symbol=data['symbol'],
             bid=data['bid'],
             ask=data['ask'],
             timestamp=data.get('timestamp')
         )
+    return error
+
+def ingest_bar(data):
+    """Validate a forwarded bar and emit it, return the error message or None"""
+    error = validate_record(data, BAR_FIELDS)
+    if error is None:
+        streamer.emit_bar(
+            symbol=data['symbol'],
+            timeframe=data['timeframe'],
+            time_bar=data['time'],
+            open_price=data['open'],
+            high=data['high'],
+            low=data['low'],
+            close_price=data['close'],
+            volume=data.get('volume', 0)
+        )
+    return error
+
+def ingest_records(records):
+    """Ingest mixed ticks and bars; 'type' is 'tick' or 'bar', records with a timeframe are bars by default"""
+    accepted = 0
+    accepted_ticks = 0
+    errors = []
+    for index, record in enumerate(records):
+        try:
+            record_type = record.get('type') if isinstance(record, dict) else None
+            if record_type is None and isinstance(record, dict):
+                record_type = 'bar' if 'timeframe' in record else 'tick'
+            if record_type == 'tick':
+                error = ingest_tick(record)
+            elif record_type == 'bar':
+                error = ingest_bar(record)
+            else:
+                error = f'Unknown record type: {record_type}'
+        except Exception as e:
+            error = str(e)
+        
+        if error is None:
+            accepted += 1
+            accepted_ticks += record_type == 'tick'
+        else:
+            errors.append({'index': index, 'error': error})
+    
+    with ingest_lock:
+        ingest_stats['batches'] += 1
+        ingest_stats['accepted'] += accepted
+        ingest_stats['rejected'] += len(errors)
+    
+    return {'accepted': accepted, 'accepted_ticks': accepted_ticks, 'accepted_bars': accepted - accepted_ticks,
+            'rejected': len(errors), 'errors': errors[:MAX_REPORTED_ERRORS]}
+
+def parse_batch(body, content_type):
+    """Records of a JSON array, {'records': [...]} or NDJSON body (one record per line)"""
+    text = body.decode('utf-8')
+    if 'ndjson' not in content_type:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            # More than one JSON value: NDJSON without its content type
+            data = None
+        if isinstance(data, dict):
+            return data['records'] if 'records' in data else [data]
+        if data is not None:
+            return data
+    
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+@app.route('/api/forward/tick', methods=['POST'])
+def receive_tick_data():
+    """API endpoint to receive tick data from local MT4 forwarder"""
+    try:
+        data = request.get_json()
+        error = ingest_tick(data)
+        if error is not None:
+            return {'error': error}, 400
         
         return {'status': 'success', 'symbol': data['symbol']}, 200
         
@@ -159,26 +500,9 @@ def receive_bar_data():
     """API endpoint to receive bar data from local MT4 forwarder"""
     try:
         data = request.get_json()
-        if not data:
-            return {'error': 'No data provided'}, 400
-            
-        # Validate required fields
-        required_fields = ['symbol', 'timeframe', 'time', 'open', 'high', 'low', 'close']
-        for field in required_fields:
-            if field not in data:
-                return {'error': f'Missing required field: {field}'}, 400
-        
-        # Use the streamer to emit the data
-        streamer.emit_bar(
-            symbol=data['symbol'],
-            timeframe=data['timeframe'],
-            time_bar=data['time'],
-            open_price=data['open'],
-            high=data['high'],
-            low=data['low'],
-            close_price=data['close'],
-            volume=data.get('volume', 0)
-        )
+        error = ingest_bar(data)
+        if error is not None:
+            return {'error': error}, 400
         
         return {'status': 'success', 'symbol': data['symbol'], 'timeframe': data['timeframe']}, 200
         
@@ -186,41 +510,161 @@ def receive_bar_data():
         print(f"Error receiving bar data: {e}")
         return {'error': str(e)}, 500
 
+@app.route('/api/forward/batch', methods=['POST'])
+def receive_batch():
+    """API endpoint to receive many ticks and bars in one request (JSON array or NDJSON)"""
+    try:
+        records = parse_batch(request.get_data(), request.content_type or '')
+    except (ValueError, KeyError) as e:
+        return {'error': f'Invalid batch: {e}'}, 400
+    
+    if not isinstance(records, list):
+        return {'error': 'Invalid batch: expected a list of records'}, 400
+    
+    return ingest_records(records), 200
+
+@socketio.on('records', namespace='/ingest')
+def handle_ingest_records(records):
+    """Persistent ingestion channel for forwarders: emit 'records' with a list, the ack returns the counts"""
+    if not isinstance(records, list):
+        records = [records]
+    return ingest_records(records)
+
+def parse_list(value):
+    """Accept a list or a comma separated string"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def subscription_rooms(symbols, timeframes):
+    rooms = [tick_room_of(symbol) for symbol in symbols]
+    rooms += [bar_room_of(symbol, timeframe) for symbol in symbols for timeframe in timeframes]
+    return rooms
+
+def filtered_snapshot(symbols, timeframes):
+    """Cached ticks of the symbols and cached bars of the symbols and timeframes"""
+    with data_lock:
+        ticks = {symbol: tick_data_cache[symbol] for symbol in symbols if symbol in tick_data_cache}
+        bars = {}
+        for symbol in symbols:
+            for timeframe in timeframes:
+                symbol_bars = bar_data_cache.get(symbol, {}).get(timeframe)
+                if symbol_bars:
+                    bars.setdefault(symbol, {})[timeframe] = list(symbol_bars)
+    return ticks, bars
+
+def subscribe_client(symbols, timeframes):
+    """Join the rooms of the symbols and timeframes and send their cached data"""
+    for room in subscription_rooms(symbols, timeframes):
+        join_stream_room(room)
+    
+    ticks, bars = filtered_snapshot(symbols, timeframes)
+    if ticks:
+        emit('initial_tick_data', ticks)
+    if bars:
+        emit('initial_bar_data', bars)
+
 @socketio.on('connect')
 def handle_connect():
     print(f'Client connected: {request.sid}')
     connected_clients.add(request.sid)
+    streamer.start_tick_frames()
+    
+    # ?format=binary selects the binary wire format (see wire_format.py)
+    if request.args.get('format') == 'binary':
+        set_binary_format(True)
+    
+    # Clients can subscribe on connect with ?symbols=EURUSD,GBPUSD&timeframes=M1
+    symbols = parse_list(request.args.get('symbols'))
+    if symbols:
+        subscribe_client(symbols, parse_list(request.args.get('timeframes')))
+        return
     
     # Send current tick data to newly connected client
-    with data_lock:
-        if tick_data_cache:
-            emit('initial_tick_data', tick_data_cache)
-        if bar_data_cache:
-            emit('initial_bar_data', bar_data_cache)
+    _, ticks_json, _ = tick_snapshot.get()
+    if ticks_json != '{}':
+        emit('initial_tick_data', RawJSON(ticks_json))
+    _, bars_json, _ = bar_snapshot.get()
+    if bars_json != '{}':
+        emit('initial_bar_data', RawJSON(bars_json))
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f'Client disconnected: {request.sid}')
     connected_clients.discard(request.sid)
+    binary_clients.discard(request.sid)
+    for room in list(client_rooms.get(request.sid, ())):
+        remove_room_member(request.sid, room)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Subscribe to the ticks of symbols and their bars of timeframes: {'symbols': [...], 'timeframes': [...]}"""
+    data = data or {}
+    symbols = parse_list(data.get('symbols'))
+    timeframes = parse_list(data.get('timeframes'))
+    subscribe_client(symbols, timeframes)
+    print(f'Client {request.sid} subscribed to {symbols} {timeframes}')
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leave the rooms of symbols and timeframes, same format as 'subscribe'"""
+    data = data or {}
+    symbols = parse_list(data.get('symbols'))
+    timeframes = parse_list(data.get('timeframes'))
+    for room in subscription_rooms(symbols, timeframes):
+        leave_stream_room(room)
+    print(f'Client {request.sid} unsubscribed from {symbols} {timeframes}')
+
+def set_binary_format(binary):
+    """Switch the current client between JSON and binary events and move it to the matching rooms"""
+    if binary == (request.sid in binary_clients):
+        return
+    
+    rooms = [room[len(BINARY_PREFIX):] if room.startswith(BINARY_PREFIX) else room
+             for room in client_rooms.get(request.sid, ()) if room != BINARY_ROOM]
+    for room in rooms:
+        leave_stream_room(room)
+    
+    if binary:
+        binary_clients.add(request.sid)
+        join_room(BINARY_ROOM)
+        add_room_member(request.sid, BINARY_ROOM)
+        emit('symbol_table', {'names': list(binary_encoder.names)})
+    else:
+        binary_clients.discard(request.sid)
+        leave_room(BINARY_ROOM)
+        remove_room_member(request.sid, BINARY_ROOM)
+    
+    for room in rooms:
+        join_stream_room(room)
+
+@socketio.on('set_format')
+def handle_set_format(data):
+    """Choose the wire format: {'format': 'binary'} or {'format': 'json'}"""
+    data = data or {}
+    set_binary_format(data.get('format') == 'binary')
+    print(f'Client {request.sid} uses the {"binary" if request.sid in binary_clients else "JSON"} format')
 
 @socketio.on('join_ticks')
 def handle_join_ticks():
-    join_room('tick_room')
+    join_stream_room('tick_room')
     print(f'Client {request.sid} joined tick room')
 
 @socketio.on('leave_ticks')
 def handle_leave_ticks():
-    leave_room('tick_room')
+    leave_stream_room('tick_room')
     print(f'Client {request.sid} left tick room')
 
 @socketio.on('join_bars')
 def handle_join_bars():
-    join_room('bar_room')
+    join_stream_room('bar_room')
     print(f'Client {request.sid} joined bar room')
 
 @socketio.on('leave_bars')
 def handle_leave_bars():
-    leave_room('bar_room')
+    leave_stream_room('bar_room')
     print(f'Client {request.sid} left bar room')
 
 def create_templates_dir():
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 import json
-from time import sleep
+from time import sleep, perf_counter
 from threading import Thread
 from os.path import join, exists
 from traceback import print_exc
@@ -14,6 +14,9 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from api.dwx_client import dwx_client
+from api.event_dispatcher import event_dispatcher
+from api.bar_aggregator import bar_aggregator
+from api.tick_bus import tick_bus
 from web_server import get_streamer
 
 """
@@ -36,7 +39,12 @@ class WebTickProcessor:
                  max_retry_command_seconds=10,  # retry to send the command for 10 seconds if not successful
                  verbose=True,
                  tick_symbols=['EURUSDi', 'GBPUSDi', 'USDCHFi', 'USDJPYi', 'AUDUSDi', 'USDCADi'],
-                 bar_symbols_timeframes=[['EURUSDi', 'M1'], ['GBPUSDi', 'M1'], ['USDCHFi', 'M1']]
+                 bar_symbols_timeframes=[['EURUSDi', 'M1'], ['GBPUSDi', 'M1'], ['USDCHFi', 'M1']],
+                 use_inotify=True,              # wait for file changes with inotify (linux only)
+                 local_bar_timeframes=None,     # e.g. ['M1', 'M5']: build bars from ticks instead of MT4 bar data
+                 bar_time_offset=0,             # seconds the MT4 server time is ahead of UTC, for the local bars
+                 bar_update_interval=0.25,      # send the current local bar at most every 0.25 seconds per symbol/timeframe
+                 tick_bus_name=None             # publish all ticks to this shared memory tick bus
                  ):
         
         self.verbose = verbose
@@ -46,6 +54,10 @@ class WebTickProcessor:
         # Statistics
         self.total_ticks_received = 0
         self.total_bars_received = 0
+        
+        # (symbol, timeframe) -> time the current bar was last sent
+        self.bar_update_interval = bar_update_interval
+        self.last_bar_update = {}
         self.start_time = datetime.now(timezone.utc)
         
         # Get the web streamer instance
@@ -55,9 +67,32 @@ class WebTickProcessor:
         print(f"📊 Tick symbols: {tick_symbols}")
         print(f"📈 Bar symbols/timeframes: {bar_symbols_timeframes}")
         
+        # Handle the events on a worker thread so that printing and emitting
+        # do not delay the polling of the DWX files
+        self.dispatcher = event_dispatcher(self)
+        event_handler = self.dispatcher
+        
+        # Build bars locally from every tick, before ticks can be conflated
+        self.aggregator = None
+        if local_bar_timeframes:
+            # Close the bars of quiet symbols on time instead of at their next tick
+            self.aggregator = bar_aggregator(self.dispatcher, local_bar_timeframes,
+                                             time_offset=bar_time_offset, close_interval=1.)
+            event_handler = self.aggregator
+            print(f"🧮 Local bars for all tick symbols: {local_bar_timeframes}")
+        
+        # Let other local processes read the ticks without polling the files again
+        self.tick_bus = None
+        if tick_bus_name:
+            self.tick_bus = tick_bus(event_handler, tick_bus_name)
+            event_handler = self.tick_bus
+            print(f"🚌 Publishing ticks to shared memory: {tick_bus_name}")
+        
         # Initialize DWX client
-        self.dwx = dwx_client(self, MT4_directory_path, sleep_delay, 
-                             max_retry_command_seconds, verbose=verbose)
+        self.dwx = dwx_client(event_handler, MT4_directory_path, sleep_delay, 
+                             max_retry_command_seconds, verbose=verbose,
+                             use_inotify=use_inotify)
+        self.streamer.set_command_latency_source(self.dwx.get_command_latency)
         sleep(1)
         
         self.dwx.start()
@@ -71,8 +106,9 @@ class WebTickProcessor:
         self.dwx.subscribe_symbols(tick_symbols)
         
         # Subscribe to bar data
-        print(f"📊 Subscribing to bar data for {len(bar_symbols_timeframes)} symbol/timeframe combinations...")
-        self.dwx.subscribe_symbols_bar_data(bar_symbols_timeframes)
+        if self.aggregator is None:
+            print(f"📊 Subscribing to bar data for {len(bar_symbols_timeframes)} symbol/timeframe combinations...")
+            self.dwx.subscribe_symbols_bar_data(bar_symbols_timeframes)
         
         # Request historic data for initial display
         print("📚 Requesting historic data...")
@@ -120,6 +156,16 @@ class WebTickProcessor:
         # Forward to web streamer
         self.streamer.emit_bar(symbol, time_frame, time, open_price, high, low, close_price, tick_volume)
 
+    def on_bar_update(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+        """Send the current local bar, so the dashboard shows a live candle"""
+        now = perf_counter()
+        key = (symbol, time_frame)
+        if now - self.last_bar_update.get(key, -self.bar_update_interval) < self.bar_update_interval:
+            return
+        self.last_bar_update[key] = now
+        
+        self.streamer.emit_bar(symbol, time_frame, time, open_price, high, low, close_price, tick_volume)
+
     def on_historic_data(self, symbol, time_frame, data):
         """Handle historic data response"""
         if self.verbose:
@@ -159,6 +205,8 @@ class WebTickProcessor:
         print(f"📈 Total ticks received: {self.total_ticks_received}")
         print(f"📊 Total bars received: {self.total_bars_received}")
         print(f"🔗 WebSocket active: {len(self.streamer.tick_subscribers)} subscribers")
+        tick_stats = self.dispatcher.get_stats()['tick']
+        print(f"🧵 Ticks conflated: {tick_stats['conflated']}, dropped: {tick_stats['dropped']}")
         print(f"💼 Account balance: {self.dwx.account_info.get('balance', 'N/A')}")
         print(f"🎯 Active symbols: {len(self.tick_symbols)}")
         print(f"📡 Connection status: {'🟢 Active' if self.dwx.ACTIVE else '🔴 Inactive'}")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import struct
+import threading
+from datetime import datetime
+
+"""
+Binary wire format for tick and bar events
+
+Clients that choose the binary format get packed little endian arrays
+instead of JSON dicts. Symbol, timeframe and room names are sent once in a
+'symbol_table' event and referenced by their index, timestamps are
+milliseconds relative to the frame, and bid/ask are sent as the change
+against the previous tick of the symbol in the same room where possible.
+The room is named in each frame, so a client in several rooms keeps the
+previous prices per room.
+
+Tick frame ('tick_frame_bin' / 'tick_data_bin'):
+    header  u8 version, u16 room id, u16 number of ticks, f64 base time
+            (seconds since epoch)
+    tick    u16 symbol id, u8 flags, i32 milliseconds after the base time,
+            then if flags & DELTA: i32 bid change, i32 ask change in PRICE_UNIT
+            else: f64 bid, f64 ask
+
+Bar ('bar_data_bin'):
+    u8 version, u16 symbol id, u16 timeframe id, f64 open, high, low, close,
+    u32 volume, u8 length of the bar time, bar time (ascii)
+
+The decoder of templates/index.html reads the same layout.
+"""
+
+WIRE_VERSION = 1
+
+# Price changes are sent in millionths
+PRICE_UNIT = 1e-6
+PRICES_PER_UNIT = 1000000
+
+DELTA = 1
+
+FRAME_HEADER = struct.Struct('<BHHd')
+TICK_HEAD = struct.Struct('<HBi')
+TICK_DELTA = struct.Struct('<ii')
+TICK_ABSOLUTE = struct.Struct('<dd')
+BAR = struct.Struct('<BHHddddI')
+
+INT32_MAX = 2**31 - 1
+
+
+def price_units(price):
+    """Price in PRICE_UNIT, or None if it is not a whole number of units"""
+    units = round(price * PRICES_PER_UNIT)
+    if units / PRICES_PER_UNIT != price:
+        return None
+    return units
+
+
+def tick_time(tick_data):
+    """Seconds since epoch of the ISO timestamp of a tick"""
+    timestamp = tick_data.get('timestamp')
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class BinaryEncoder:
+    def __init__(self, on_new_names=None):
+        """
+        Encode ticks and bars for the binary clients
+
+        Args:
+            on_new_names (callable): Called with the full name table when a
+                symbol or timeframe was added, before the data using it is sent
+        """
+        self.on_new_names = on_new_names
+        self.names = []
+        self.name_ids = {}
+
+        # room -> symbol -> (bid units, ask units) of the last tick sent
+        self.last_prices = {}
+        self.lock = threading.Lock()
+
+        # on_new_names is called without self.lock, this lock makes the other
+        # encoders wait until the table with their names was sent
+        self.names_lock = threading.RLock()
+        self.names_published = 0
+
+        # Statistics
+        self.ticks_encoded = 0
+        self.delta_ticks = 0
+        self.tick_bytes = 0
+        self.bar_bytes = 0
+
+    def name_id(self, name):
+        """Index of a symbol, timeframe or room in the name table"""
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.name_ids[name] = name_id
+        return name_id
+
+    def publish_names(self, num_names):
+        """Call on_new_names if the first num_names names were not sent yet (without self.lock)"""
+        if self.on_new_names is None:
+            return
+        with self.names_lock:
+            if num_names <= self.names_published:
+                return
+            # Set first, so that a callback that encodes again does not call itself
+            self.names_published = num_names
+            self.on_new_names(self.names[:num_names])
+
+    def reset(self, room):
+        """Send absolute prices in the next frame of a room, e.g. after a client joined"""
+        with self.lock:
+            self.last_prices.pop(room, None)
+
+    def encode_ticks(self, room, ticks):
+        """Encode tick dicts as sent to the JSON clients into one frame for a room"""
+        with self.lock:
+            last_prices = self.last_prices.setdefault(room, {})
+            times = [tick_time(tick_data) for tick_data in ticks]
+            base_time = min((t for t in times if t is not None), default=0.0)
+
+            parts = [FRAME_HEADER.pack(WIRE_VERSION, self.name_id(room), len(ticks), base_time)]
+            for tick_data, timestamp in zip(ticks, times):
+                symbol = tick_data['symbol']
+                symbol_id = self.name_id(symbol)
+                offset_ms = 0 if timestamp is None else int(round((timestamp - base_time) * 1000))
+
+                bid_units = price_units(tick_data['bid'])
+                ask_units = price_units(tick_data['ask'])
+                last = last_prices.get(symbol)
+
+                if bid_units is None or ask_units is None:
+                    last_prices.pop(symbol, None)
+                    last = None
+                else:
+                    last_prices[symbol] = (bid_units, ask_units)
+
+                if (last is not None and abs(bid_units - last[0]) <= INT32_MAX
+                        and abs(ask_units - last[1]) <= INT32_MAX):
+                    parts.append(TICK_HEAD.pack(symbol_id, DELTA, offset_ms))
+                    parts.append(TICK_DELTA.pack(bid_units - last[0], ask_units - last[1]))
+                    self.delta_ticks += 1
+                else:
+                    parts.append(TICK_HEAD.pack(symbol_id, 0, offset_ms))
+                    parts.append(TICK_ABSOLUTE.pack(tick_data['bid'], tick_data['ask']))
+
+            data = b''.join(parts)
+            self.ticks_encoded += len(ticks)
+            self.tick_bytes += len(data)
+            num_names = len(self.names)
+
+        self.publish_names(num_names)
+        return data
+
+    def encode_bar(self, bar_data):
+        """Encode a bar dict as sent to the JSON clients"""
+        with self.lock:
+            bar_time = str(bar_data['time']).encode('ascii')[:255]
+            data = BAR.pack(WIRE_VERSION, self.name_id(bar_data['symbol']),
+                            self.name_id(bar_data['timeframe']),
+                            bar_data['open'], bar_data['high'], bar_data['low'],
+                            bar_data['close'], int(bar_data.get('volume') or 0))
+            data += bytes([len(bar_time)]) + bar_time
+            self.bar_bytes += len(data)
+            num_names = len(self.names)
+
+        self.publish_names(num_names)
+        return data
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'names': len(self.names),
+                'ticks_encoded': self.ticks_encoded,
+                'delta_ticks': self.delta_ticks,
+                'tick_bytes': self.tick_bytes,
+                'bar_bytes': self.bar_bytes,
+                'bytes_per_tick': round(self.tick_bytes / self.ticks_encoded, 1) if self.ticks_encoded else None
+            }